@@ -0,0 +1,254 @@
+"""Benchmark for the local journey planner over a full-country timetable.
+
+Measures the GTFS timetable database build, the transit index build and
+size, and journey search latency between random stops with and without
+real-time patches. Uses the GTFS static timetable zip given with --gtfs,
+such as the full TFI GTFS_All.zip, or otherwise a synthetic timetable of a
+similar size.
+
+Run from the repository root with Home Assistant installed:
+
+    python -m benchmarks.bench_journey [--gtfs PATH] [--queries 200]
+        [--save [PATH]] [--compare PATH]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from datetime import date, datetime, time as dt_time, timedelta
+from pathlib import Path
+import math
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Any
+
+from custom_components.tfi_journeyplanner.departures import Departure
+from custom_components.tfi_journeyplanner.gtfs import GTFSStaticTimetable
+from custom_components.tfi_journeyplanner.journey import TransitIndex
+
+from .bench_pipeline import (
+    RESULTS_DIR,
+    compare_results,
+    get_version,
+    measure,
+    save_results,
+)
+from .payloads import generate_gtfs
+
+
+def generate_realtime_departures(
+    index: TransitIndex, ratio: float, cancelled_ratio: float, seed: int = 0
+) -> list[Departure]:
+    """Generate real-time departures for a ratio of the trips of an index."""
+    rnd = random.Random(seed)
+    departures = []
+    for route in range(index.route_count):
+        stop_start = index.route_stop_start[route]
+        stride = index.route_stop_start[route + 1] - stop_start
+        first_trip = index.route_trip_start[route]
+        for trip in range(index.route_trip_start[route + 1] - first_trip):
+            if rnd.random() >= ratio:
+                continue
+            pos = rnd.randrange(stride)
+            scheduled = (
+                index.base
+                + index.departures[index.route_time_start[route] + trip * stride + pos]
+            )
+            departures.append(
+                Departure(
+                    index.stop_ids[index.route_stops[stop_start + pos]],
+                    index.trip_services[first_trip + trip],
+                    "OUTBOUND",
+                    index.trip_destinations[first_trip + trip],
+                    scheduled,
+                    scheduled + rnd.randint(-60, 600),
+                    rnd.random() < cancelled_ratio,
+                )
+            )
+    return departures
+
+
+def generate_queries(
+    index: TransitIndex,
+    stops: dict[str, tuple[str | None, float | None, float | None]],
+    base: datetime,
+    count: int,
+    max_distance: float,
+    seed: int = 0,
+) -> list[tuple[list[str], list[str], float]]:
+    """Generate queries between random stops within max_distance km.
+
+    Departure times are between 07:00 and 20:00.
+    """
+    rnd = random.Random(seed)
+    located = [
+        (stop_id, stops[stop_id][1], stops[stop_id][2])
+        for stop_id in index.stop_ids
+        if stop_id in stops and stops[stop_id][1] is not None
+    ] or [(stop_id, 0.0, 0.0) for stop_id in index.stop_ids]
+    queries = []
+    while len(queries) < count:
+        origin, lat, lon = rnd.choice(located)
+        destination, dest_lat, dest_lon = rnd.choice(located)
+        distance = 111.32 * math.hypot(
+            dest_lat - lat, (dest_lon - lon) * math.cos(math.radians(lat))
+        )
+        if distance <= max_distance:
+            departure_time = base + timedelta(minutes=rnd.randint(7 * 60, 20 * 60))
+            queries.append(([origin], [destination], departure_time.timestamp()))
+    return queries
+
+
+async def run(args: argparse.Namespace, gtfs_path: str) -> dict[str, dict[str, Any]]:
+    """Run benchmarks and return results by benchmark name."""
+    results: dict[str, dict[str, Any]] = {}
+
+    def report(name: str, result: dict[str, Any]) -> None:
+        results[name] = result
+        print(
+            f"{name:>36}: p50 {result['p50_ms']:9.3f} ms, "
+            f"p99 {result['p99_ms']:9.3f} ms, peak {result['peak_kib']:10.1f} KiB"
+        )
+
+    timetable = GTFSStaticTimetable(gtfs_path, args.db)
+    start = time.perf_counter()
+    timetable.load()
+    print(f"loaded timetable in {time.perf_counter() - start:.1f} s")
+
+    ## Memory is traced in a separate build, as tracing slows it down
+    day = args.day or date.today()
+    start = time.perf_counter()
+    index = TransitIndex.build(timetable, day)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    TransitIndex.build(timetable, day)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    report(
+        "build index",
+        {
+            "iterations": 1,
+            "p50_ms": elapsed * 1000,
+            "p99_ms": elapsed * 1000,
+            "peak_kib": peak / 1024,
+            "size_kib": index.size / 1024,
+        },
+    )
+    print(
+        f"{'':>36}  {len(index.stop_ids)} stops, {index.route_count} routes, "
+        f"{len(index.trip_ids)} trips, {len(index.departures)} stop times, "
+        f"{index.size / 1024:.0f} KiB"
+    )
+
+    base = datetime.combine(day, dt_time(), timetable.timezone)
+    queries = generate_queries(
+        index, timetable.stops(), base, args.queries, args.max_distance, args.seed
+    )
+    realtime = generate_realtime_departures(
+        index, args.realtime_ratio, args.cancelled_ratio, args.seed
+    )
+
+    report(
+        f"patch ({len(realtime)} departures)",
+        await measure(lambda: index.patch(realtime), 10, len(realtime)),
+    )
+    patches = index.patch(realtime)
+
+    for name, query_patches in (("search", None), ("search (realtime)", patches)):
+        pending = iter(queries * 2)
+        found = 0
+
+        def search() -> None:
+            nonlocal found
+            origins, destinations, departure_time = next(pending)
+            if index.search(
+                origins,
+                destinations,
+                departure_time,
+                query_patches,
+                args.max_transfers,
+            ):
+                found += 1
+
+        report(name, await measure(search, args.queries))
+        print(f"{'':>36}  {found} of {args.queries} queries found a journey")
+
+    timetable.close()
+    return results
+
+
+def main() -> None:
+    """Run journey planner benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.partition("\n")[0])
+    parser.add_argument("--gtfs", metavar="PATH", help="GTFS static timetable zip")
+    parser.add_argument("--db", metavar="PATH", help="timetable database path")
+    parser.add_argument("--day", type=date.fromisoformat)
+    parser.add_argument("--towns", type=int, default=40)
+    parser.add_argument("--stops", type=int, default=10000)
+    parser.add_argument("--lines", type=int, default=800)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument(
+        "--max-distance",
+        type=float,
+        default=30.0,
+        help="maximum distance in km between query stops",
+    )
+    parser.add_argument("--max-transfers", type=int, default=3)
+    parser.add_argument("--realtime-ratio", type=float, default=0.3)
+    parser.add_argument("--cancelled-ratio", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--save",
+        nargs="?",
+        const="",
+        metavar="PATH",
+        help="save results, by default to benchmarks/results/journey-<version>.json",
+    )
+    parser.add_argument(
+        "--compare", metavar="PATH", help="compare with previously saved results"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=10.0,
+        help="p50 latency increase in percent reported as a regression",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        gtfs_path = args.gtfs
+        if gtfs_path is None:
+            gtfs_path = str(Path(tmp_dir) / "gtfs.zip")
+            start = time.perf_counter()
+            generate_gtfs(gtfs_path, args.towns, args.stops, args.lines, seed=args.seed)
+            print(f"generated timetable in {time.perf_counter() - start:.1f} s")
+        if args.db is None:
+            args.db = str(Path(tmp_dir) / "gtfs.db")
+        results = asyncio.run(run(args, gtfs_path))
+
+    version = get_version()
+    if args.save is not None:
+        save_results(
+            Path(args.save) if args.save else RESULTS_DIR / f"journey-{version}.json",
+            {
+                "version": version,
+                "created": datetime.now().astimezone().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "parameters": {
+                    key: str(value) if isinstance(value, date) else value
+                    for key, value in vars(args).items()
+                    if key not in ("save", "compare", "threshold", "db")
+                },
+                "results": results,
+            },
+        )
+    if args.compare and compare_results(Path(args.compare), results, args.threshold):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
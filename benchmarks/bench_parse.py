@@ -0,0 +1,89 @@
+"""Micro-benchmark for TFI departure timestamp parsing.
+
+Compares the original parsing of departure timestamps with datetime objects
+against the epoch timestamp parsing pipeline, over a synthetic payload.
+
+Run from the repository root with Home Assistant installed:
+
+    python -m benchmarks.bench_parse [--departures 5000] [--repeat 10]
+"""
+
+from __future__ import annotations
+
+import argparse
+from datetime import datetime, timedelta, timezone
+import timeit
+from typing import Any
+
+from custom_components.tfi_journeyplanner.departures import Departure
+from custom_components.tfi_journeyplanner.util import iso_to_timestamp
+
+from .payloads import generate_departures
+
+
+def parse_datetime(deps_raw: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Parse departures with datetime objects and a per-departure now."""
+    departures = []
+    for raw in deps_raw:
+        dep = dict(raw)
+        dep_rt_str = dep.get("realTimeDeparture")
+        dep["realTimeDeparture"] = dep_rt = (
+            datetime.fromisoformat(dep_rt_str).astimezone() if dep_rt_str else None
+        )
+        dep_sch_str = dep.get("scheduledDeparture")
+        dep["scheduledDeparture"] = dep_sch = (
+            datetime.fromisoformat(dep_sch_str).astimezone() if dep_sch_str else None
+        )
+        dep["departure"] = dep_rt if dep_rt is not None else dep_sch
+        now = datetime.now().astimezone(timezone.utc)
+        if dep["departure"] >= now - timedelta(minutes=1):
+            departures.append(dep)
+    return departures
+
+
+def parse_timestamp(deps_raw: list[dict[str, Any]]) -> list[Departure]:
+    """Parse departures to epoch timestamps with a single cut-off."""
+    cutoff = datetime.now().timestamp() - 60
+    departures = []
+    for raw in deps_raw:
+        dep = Departure.from_json(raw)
+        if dep.departure >= cutoff:
+            departures.append(dep)
+    return departures
+
+
+def parse_timestamp_cold(deps_raw: list[dict[str, Any]]) -> list[Departure]:
+    """Parse departures to epoch timestamps with an empty conversion cache."""
+    iso_to_timestamp.cache_clear()
+    return parse_timestamp(deps_raw)
+
+
+def main() -> None:
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.partition("\n")[0])
+    parser.add_argument("--departures", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    deps_raw = generate_departures(departures=args.departures)
+    assert len(parse_datetime(deps_raw)) == len(parse_timestamp(deps_raw))
+
+    results = {}
+    for name, func in (
+        ("datetime", parse_datetime),
+        ("timestamp (cold cache)", parse_timestamp_cold),
+        ("timestamp (warm cache)", parse_timestamp),
+    ):
+        best = min(
+            timeit.repeat(lambda f=func: f(deps_raw), number=1, repeat=args.repeat)
+        )
+        results[name] = best
+        print(
+            f"{name:>22}: {best * 1000:8.2f} ms per payload, "
+            f"{args.departures / best:10.0f} departures/s, "
+            f"speedup {results['datetime'] / best:.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
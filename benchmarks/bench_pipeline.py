@@ -0,0 +1,333 @@
+"""Benchmark suite for the TFI departure pipeline.
+
+Measures departure parsing, update_departures against a local stand-in for
+the TFI API, filter_cached_departures, filtered departures for a number of
+sensors and departure attribute rendering, over synthetic payloads. Reports
+throughput, p50/p99 latency and peak memory, and optionally saves the
+results or compares them with saved results of another version.
+
+Run from the repository root with Home Assistant installed:
+
+    python -m benchmarks.bench_pipeline [--stops 50] [--departures 5000]
+        [--sensors 100] [--iterations 100] [--save [PATH]] [--compare PATH]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from collections.abc import Awaitable, Callable
+from datetime import datetime, timedelta
+import inspect
+import json
+import math
+from pathlib import Path
+import platform
+import random
+import time
+import tracemalloc
+from typing import Any
+
+from custom_components.tfi_journeyplanner.attributes import project_departures
+from custom_components.tfi_journeyplanner.const import (
+    CONF_EXECUTOR_THRESHOLD,
+    DEFAULTS,
+)
+from custom_components.tfi_journeyplanner.departures import DepartureFilter
+from custom_components.tfi_journeyplanner.tfi_journeyplanner_api import TFIData
+
+from .payloads import generate_departures, generate_stop_ids, group_by_stop
+from .server import TFIStandInServer
+
+RESULTS_DIR = Path(__file__).parent / "results"
+MANIFEST = (
+    Path(__file__).parent.parent
+    / "custom_components"
+    / "tfi_journeyplanner"
+    / "manifest.json"
+)
+MEMORY_ITERATIONS = 5
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    """Return the nearest-rank percentile of sorted samples."""
+    return samples[max(math.ceil(pct / 100 * len(samples)) - 1, 0)]
+
+
+async def measure(
+    func: Callable[[], Any],
+    iterations: int,
+    items: int = 1,
+    setup: Callable[[], None] | None = None,
+) -> dict[str, float]:
+    """Measure latency, throughput and peak memory of func.
+
+    func may return an awaitable. setup is called before each call, outside
+    the measurement. Memory is traced in a separate pass, as tracing slows
+    down the calls.
+    """
+
+    async def call() -> None:
+        result = func()
+        if inspect.isawaitable(result):
+            await result
+
+    samples = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        await call()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+
+    tracemalloc.start()
+    for _ in range(min(iterations, MEMORY_ITERATIONS)):
+        if setup:
+            setup()
+        await call()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = sum(samples)
+    return {
+        "iterations": iterations,
+        "ops_per_s": iterations / total,
+        "items_per_s": iterations * items / total,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "peak_kib": peak / 1024,
+    }
+
+
+def generate_sensor_filters(
+    stop_ids: list[str], count: int, services: int, seed: int = 0
+) -> list[DepartureFilter]:
+    """Generate filters of sensors with a mix of stop and service options.
+
+    Sensors are drawn from a limited set of options, so some sensors have
+    identical filters as in a typical configuration.
+    """
+    rnd = random.Random(seed)
+    filters = []
+    for _ in range(count):
+        sensor_stops = rnd.sample(stop_ids, min(rnd.randint(1, 3), len(stop_ids)))
+        service_ids = None
+        if rnd.random() < 0.3:
+            service_ids = [str(rnd.randint(1, services)) for _ in range(2)]
+        filters.append(
+            DepartureFilter.create(
+                sensor_stops,
+                service_ids=service_ids,
+                limit_departures=rnd.choice([None, 5, 10]),
+                departure_horizon=timedelta(minutes=rnd.choice([30, 60, 120])),
+            )
+        )
+    return filters
+
+
+def get_version() -> str:
+    """Return the integration version."""
+    with open(MANIFEST, encoding="utf-8") as file:
+        return json.load(file)["version"]
+
+
+def save_results(path: Path, report: dict[str, Any]) -> None:
+    """Save benchmark report as JSON."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+        file.write("\n")
+    print(f"saved results to {path}")
+
+
+def compare_results(
+    path: Path, results: dict[str, dict[str, float]], threshold: float
+) -> bool:
+    """Print latency changes against saved results.
+
+    Returns whether any p50 latency regressed by more than threshold percent.
+    """
+    with open(path, encoding="utf-8") as file:
+        baseline = json.load(file)
+    print(f"\ncompared with version {baseline['version']} ({path}):")
+    regressed = False
+    for name, result in results.items():
+        if (base := baseline["results"].get(name)) is None:
+            continue
+        changes = {
+            key: (result[key] - base[key]) / base[key] * 100 if base[key] else 0.0
+            for key in ("p50_ms", "p99_ms", "peak_kib")
+        }
+        flag = ""
+        if changes["p50_ms"] > threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        print(
+            f"{name:>44}: p50 {changes['p50_ms']:+7.1f}%, "
+            f"p99 {changes['p99_ms']:+7.1f}%, "
+            f"peak memory {changes['peak_kib']:+7.1f}%{flag}"
+        )
+    return regressed
+
+
+async def run(args: argparse.Namespace) -> dict[str, dict[str, float]]:
+    """Run benchmarks and return results by benchmark name."""
+    stop_ids = generate_stop_ids(args.stops)
+    deps_raw = generate_departures(
+        stops=args.stops,
+        departures=args.departures,
+        services=args.services,
+        realtime_ratio=args.realtime_ratio,
+        cancelled_ratio=args.cancelled_ratio,
+        seed=args.seed,
+    )
+    filters = generate_sensor_filters(
+        stop_ids, args.sensors, args.services, seed=args.seed
+    )
+    sensors = f"{args.sensors} sensors"
+
+    results: dict[str, dict[str, float]] = {}
+
+    async def bench(
+        name: str,
+        func: Callable[[], Awaitable[Any] | Any],
+        items: int = 1,
+        setup: Callable[[], None] | None = None,
+    ) -> None:
+        result = results[name] = await measure(func, args.iterations, items, setup)
+        print(
+            f"{name:>44}: {result['ops_per_s']:9.1f} ops/s, "
+            f"{result['items_per_s']:11.0f} items/s, "
+            f"p50 {result['p50_ms']:8.3f} ms, p99 {result['p99_ms']:8.3f} ms, "
+            f"peak {result['peak_kib']:9.1f} KiB"
+        )
+
+    async with TFIStandInServer(group_by_stop(deps_raw)) as server:
+        tfi_data = TFIData(
+            shard_size=args.shard_size,
+            stream_decode=args.stream_decode,
+            executor_threshold=args.executor_threshold,
+        )
+        await tfi_data.setup()
+        tfi_data.api_url = server.url
+        try:
+            body = server.encode_departures(stop_ids)
+            # pylint: disable-next=protected-access
+            parse = tfi_data._parse_departures
+            await bench(
+                "parse departures",
+                lambda: parse(json.loads(body)["stopDepartures"]),
+                args.departures,
+            )
+            await bench(
+                "update_departures",
+                lambda: tfi_data.update_departures(stop_ids),
+                args.departures,
+            )
+            loop_blocks = tfi_data.metrics.loop_blocks
+            print(
+                f"{'':>44}  longest loop block {loop_blocks.max:.3f} ms, "
+                f"{loop_blocks.count} over {loop_blocks.budget} ms"
+            )
+            await bench(
+                "filter_cached_departures",
+                tfi_data.filter_cached_departures,
+                len(tfi_data.get_cached_departures(stop_ids)),
+            )
+
+            def get_filtered_departures() -> list[list[Any]]:
+                return [tfi_data.get_departures_for_filter(f) for f in filters]
+
+            ## Filtering invalidates filter results shared between sensors
+            await bench(
+                f"get_filtered_departures ({sensors})",
+                get_filtered_departures,
+                args.sensors,
+                tfi_data.filter_cached_departures,
+            )
+            await bench(
+                f"get_filtered_departures (shared, {sensors})",
+                get_filtered_departures,
+                args.sensors,
+            )
+
+            sensor_departures = get_filtered_departures()
+            await bench(
+                f"render attributes ({sensors})",
+                lambda: [
+                    project_departures(departures, None, args.attribute_max_bytes)
+                    for departures in sensor_departures
+                ],
+                args.sensors,
+            )
+        finally:
+            await tfi_data.cleanup()
+    return results
+
+
+def main() -> None:
+    """Run benchmark suite."""
+    parser = argparse.ArgumentParser(description=__doc__.partition("\n")[0])
+    parser.add_argument("--stops", type=int, default=50)
+    parser.add_argument("--departures", type=int, default=5000)
+    parser.add_argument("--services", type=int, default=150)
+    parser.add_argument("--realtime-ratio", type=float, default=0.7)
+    parser.add_argument("--cancelled-ratio", type=float, default=0.05)
+    parser.add_argument("--sensors", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--shard-size", type=int, default=0)
+    parser.add_argument(
+        "--stream-decode", action=argparse.BooleanOptionalAction, default=True
+    )
+    parser.add_argument(
+        "--executor-threshold",
+        type=int,
+        default=DEFAULTS[CONF_EXECUTOR_THRESHOLD],
+        metavar="KIB",
+        help="response size decoded in an executor, 0 to decode in the event loop",
+    )
+    parser.add_argument("--attribute-max-bytes", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--save",
+        nargs="?",
+        const="",
+        metavar="PATH",
+        help="save results, by default to benchmarks/results/<version>.json",
+    )
+    parser.add_argument(
+        "--compare", metavar="PATH", help="compare with previously saved results"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=10.0,
+        help="p50 latency increase in percent reported as a regression",
+    )
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    version = get_version()
+    if args.save is not None:
+        save_results(
+            Path(args.save) if args.save else RESULTS_DIR / f"{version}.json",
+            {
+                "version": version,
+                "created": datetime.now().astimezone().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "parameters": {
+                    key: value
+                    for key, value in vars(args).items()
+                    if key not in ("save", "compare", "threshold")
+                },
+                "results": results,
+            },
+        )
+    if args.compare and compare_results(Path(args.compare), results, args.threshold):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
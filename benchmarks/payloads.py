@@ -0,0 +1,231 @@
+"""Synthetic TFI Journey Planner API payloads for benchmarks."""
+
+from __future__ import annotations
+
+import csv
+from datetime import date, datetime, timedelta, timezone
+import io
+import math
+import random
+from typing import Any
+import zipfile
+
+GTFS_WEEKDAYS = [
+    "monday",
+    "tuesday",
+    "wednesday",
+    "thursday",
+    "friday",
+    "saturday",
+    "sunday",
+]
+DESTINATIONS = [
+    "City Centre",
+    "Dun Laoghaire",
+    "Blanchardstown",
+    "Tallaght",
+    "Swords",
+    "Bray",
+    "Howth",
+    "Lucan",
+]
+
+
+def generate_stop_ids(count: int) -> list[str]:
+    """Return synthetic Dublin Bus stop IDs."""
+    return [f"8220DB{i:06d}" for i in range(count)]
+
+
+def generate_departures(
+    stops: int = 50,
+    departures: int = 5000,
+    services: int = 150,
+    realtime_ratio: float = 0.7,
+    cancelled_ratio: float = 0.05,
+    seed: int = 0,
+) -> list[dict[str, Any]]:
+    """Generate synthetic stopDepartures entries sorted by scheduled departure.
+
+    Departures are spread over the stops and services at random, within two
+    hours of the current minute.
+    """
+    rnd = random.Random(seed)
+    tzinfo = timezone(timedelta(hours=1))
+    now = datetime.now(tzinfo).replace(second=0, microsecond=0)
+    stop_ids = generate_stop_ids(stops)
+    deps_raw = []
+    for _ in range(departures):
+        scheduled = now + timedelta(minutes=rnd.randint(-2, 120))
+        realtime = (
+            scheduled + timedelta(seconds=rnd.randint(-60, 600))
+            if rnd.random() < realtime_ratio
+            else None
+        )
+        deps_raw.append(
+            {
+                "stopRef": rnd.choice(stop_ids),
+                "serviceNumber": str(rnd.randint(1, services)),
+                "serviceDirection": rnd.choice(["INBOUND", "OUTBOUND"]),
+                "destination": rnd.choice(DESTINATIONS),
+                "scheduledDeparture": scheduled.isoformat(timespec="milliseconds"),
+                "realTimeDeparture": (
+                    realtime.isoformat(timespec="milliseconds") if realtime else None
+                ),
+                "cancelled": rnd.random() < cancelled_ratio,
+            }
+        )
+    deps_raw.sort(key=lambda dep: dep["scheduledDeparture"])
+    return deps_raw
+
+
+def group_by_stop(deps_raw: list[dict[str, Any]]) -> dict[str, list[dict[str, Any]]]:
+    """Return stopDepartures entries grouped by stop ID."""
+    by_stop: dict[str, list[dict[str, Any]]] = {}
+    for dep in deps_raw:
+        by_stop.setdefault(dep["stopRef"], []).append(dep)
+    return by_stop
+
+
+def _write_csv(zf: zipfile.ZipFile, name: str, header: list[str], rows: Any) -> None:
+    with zf.open(name, "w") as file, io.TextIOWrapper(
+        file, encoding="utf-8", newline=""
+    ) as text:
+        writer = csv.writer(text)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def _gtfs_time(secs: float) -> str:
+    secs = int(secs)
+    return f"{secs // 3600:02d}:{secs // 60 % 60:02d}:{secs % 60:02d}"
+
+
+def generate_gtfs(
+    path: str,
+    towns: int = 40,
+    stops: int = 10000,
+    lines: int = 800,
+    intercity_ratio: float = 0.1,
+    seed: int = 0,
+) -> None:
+    """Write a synthetic country-scale GTFS static timetable zip.
+
+    Stops are spread around towns in a country the size of Ireland. Town
+    lines run along stops of a town every 10 to 30 minutes and intercity
+    lines call at a few stops of several towns every 1 to 2 hours, in both
+    directions from 06:00 to 23:30 every day.
+    """
+    rnd = random.Random(seed)
+    centres = [
+        (rnd.uniform(51.6, 55.2), rnd.uniform(-10.0, -6.1)) for _ in range(towns)
+    ]
+    town_stops: list[list[int]] = [[] for _ in range(towns)]
+    locations = []
+    for stop in range(stops):
+        town = rnd.randrange(towns)
+        lat, lon = centres[town]
+        locations.append((lat + rnd.gauss(0, 0.02), lon + rnd.gauss(0, 0.03)))
+        town_stops[town].append(stop)
+    stop_ids = generate_stop_ids(stops)
+
+    def distance(a: int, b: int) -> float:
+        (lat_a, lon_a), (lat_b, lon_b) = locations[a], locations[b]
+        return 111320 * math.hypot(
+            lat_b - lat_a, (lon_b - lon_a) * math.cos(math.radians(lat_a))
+        )
+
+    def along(candidates: list[int], count: int) -> list[int]:
+        """Return stops sorted along a random bearing."""
+        bearing = rnd.uniform(0, math.pi)
+        chosen = rnd.sample(candidates, min(count, len(candidates)))
+        return sorted(
+            chosen,
+            key=lambda s: locations[s][0] * math.cos(bearing)
+            + locations[s][1] * math.sin(bearing),
+        )
+
+    routes = []
+    trips = []
+    stop_times = []
+    for line in range(lines):
+        if rnd.random() < intercity_ratio:
+            line_towns = along(range(towns), rnd.randint(2, 5))
+            line_stops = [
+                stop
+                for town in line_towns
+                for stop in along(town_stops[town], rnd.randint(2, 4))
+            ]
+            speed, headway = 15.0, rnd.choice([60, 90, 120]) * 60
+        else:
+            town = rnd.randrange(towns)
+            line_stops = along(town_stops[town], rnd.randint(15, 40))
+            speed, headway = 5.0, rnd.choice([10, 15, 20, 30]) * 60
+        if len(line_stops) < 2:
+            continue
+        service = str(line + 1)
+        routes.append((service, service))
+        for direction, pattern in enumerate((line_stops, line_stops[::-1])):
+            offsets = [0.0]
+            for prev, stop in zip(pattern, pattern[1:]):
+                offsets.append(offsets[-1] + 20 + distance(prev, stop) / speed)
+            headsign = f"Stop {stop_ids[pattern[-1]]}"
+            start = 6 * 3600 + rnd.randrange(headway)
+            while start <= 23.5 * 3600:
+                trip_id = f"{service}.{direction}.{start}"
+                trips.append((service, "ALL", trip_id, headsign, direction))
+                for sequence, (stop, offset) in enumerate(zip(pattern, offsets)):
+                    time_str = _gtfs_time(start + offset)
+                    stop_times.append(
+                        (trip_id, time_str, time_str, stop_ids[stop], sequence + 1)
+                    )
+                start += headway
+
+    today = date.today()
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        _write_csv(
+            zf,
+            "agency.txt",
+            ["agency_id", "agency_name", "agency_url", "agency_timezone"],
+            [("1", "Synthetic Transport", "https://example.com", "Europe/Dublin")],
+        )
+        _write_csv(zf, "routes.txt", ["route_id", "route_short_name"], routes)
+        _write_csv(
+            zf,
+            "trips.txt",
+            ["route_id", "service_id", "trip_id", "trip_headsign", "direction_id"],
+            trips,
+        )
+        _write_csv(
+            zf,
+            "stops.txt",
+            ["stop_id", "stop_name", "stop_lat", "stop_lon"],
+            (
+                (stop_id, f"Stop {stop_id}", f"{lat:.6f}", f"{lon:.6f}")
+                for stop_id, (lat, lon) in zip(stop_ids, locations)
+            ),
+        )
+        _write_csv(
+            zf,
+            "stop_times.txt",
+            [
+                "trip_id",
+                "arrival_time",
+                "departure_time",
+                "stop_id",
+                "stop_sequence",
+            ],
+            stop_times,
+        )
+        _write_csv(
+            zf,
+            "calendar.txt",
+            ["service_id", *GTFS_WEEKDAYS, "start_date", "end_date"],
+            [
+                (
+                    "ALL",
+                    *["1"] * 7,
+                    (today - timedelta(days=30)).strftime("%Y%m%d"),
+                    (today + timedelta(days=365)).strftime("%Y%m%d"),
+                )
+            ],
+        )
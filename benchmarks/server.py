@@ -0,0 +1,101 @@
+"""Local stand-in for the TFI Journey Planner departures API.
+
+Serves synthetic stopDepartures payloads so that the full request path of
+TFIData can be benchmarked offline.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any
+
+from aiohttp import web
+
+DEPARTURES_PATH = "/lts/lts/v1/public/departures"
+
+
+class TFIStandInServer:
+    """Local HTTP server answering departure requests from synthetic data.
+
+    Responses contain the departures of the requested stops. Every other
+    response has its real-time departures shifted by 30 seconds, so that
+    consecutive responses differ and are parsed rather than detected as
+    unchanged. Encoded responses are cached so that serving them costs little
+    compared to the client.
+    """
+
+    def __init__(
+        self,
+        departures_by_stop: dict[str, list[dict[str, Any]]],
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        """Initialise stand-in server."""
+        self.departures_by_stop = departures_by_stop
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self._bodies: dict[tuple[tuple[str, ...], bool], bytes] = {}
+        self._runner: web.AppRunner | None = None
+
+    @property
+    def url(self) -> str:
+        """Return URL of the departures API."""
+        return f"http://{self.host}:{self.port}{DEPARTURES_PATH}"
+
+    async def start(self) -> None:
+        """Start serving requests."""
+        app = web.Application()
+        app.router.add_post(DEPARTURES_PATH, self._handle_departures)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        ## Port 0 binds to a free port
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self) -> None:
+        """Stop serving requests."""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> TFIStandInServer:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.stop()
+
+    def encode_departures(self, stop_ids: list[str], shifted: bool = False) -> bytes:
+        """Return the encoded response body for stops."""
+        key = (tuple(stop_ids), shifted)
+        if (body := self._bodies.get(key)) is None:
+            deps_raw = [
+                dep
+                for stop_id in dict.fromkeys(stop_ids)
+                for dep in self.departures_by_stop.get(stop_id, [])
+            ]
+            deps_raw.sort(key=lambda dep: dep["scheduledDeparture"])
+            if shifted:
+                deps_raw = [self._shift_realtime(dep) for dep in deps_raw]
+            body = json.dumps({"stopDepartures": deps_raw}).encode()
+            self._bodies[key] = body
+        return body
+
+    @staticmethod
+    def _shift_realtime(dep: dict[str, Any]) -> dict[str, Any]:
+        if not (realtime := dep.get("realTimeDeparture")):
+            return dep
+        ## Shift the seconds field of the ISO timestamp within the minute
+        seconds = (int(realtime[17:19]) + 30) % 60
+        return {
+            **dep,
+            "realTimeDeparture": f"{realtime[:17]}{seconds:02d}{realtime[19:]}",
+        }
+
+    async def _handle_departures(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        post_data = await request.json()
+        body = self.encode_departures(post_data["stopIds"], self.requests % 2 == 0)
+        return web.Response(body=body, content_type="application/json")
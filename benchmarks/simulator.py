@@ -0,0 +1,369 @@
+"""Local TFI Journey Planner departures API simulator.
+
+Serves departures that evolve over simulated time, with real-time drift and
+cancellations, for any requested stop. Latency, error status codes and
+empty responses can be injected, and requests are recorded so that the
+request rate and freshness of each stop can be measured under load.
+
+Run from the repository root:
+
+    python -m benchmarks.simulator [--port 8080] [--latency 0.2]
+        [--error-rate 0.05] [--empty-rate 0.02]
+
+Set the departures API URL in the fetch options of the integration to the
+printed URL. Statistics are served at /simulator/stats, and faults can be
+changed while running by posting JSON to /simulator/faults, for example
+{"error_rate": 1.0} to simulate an outage.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from collections import Counter, deque
+from collections.abc import Callable
+from datetime import datetime
+import math
+import random
+import time
+from typing import Any
+from zoneinfo import ZoneInfo
+
+from aiohttp import web
+
+from .payloads import DESTINATIONS
+from .server import DEPARTURES_PATH
+
+STATS_PATH = "/simulator/stats"
+FAULTS_PATH = "/simulator/faults"
+TIMEZONE = ZoneInfo("Europe/Dublin")
+FAULTS = ("latency", "latency_jitter", "error_rate", "error_statuses", "empty_rate")
+
+
+class SimulatedTimetable:
+    """Departures of simulated services at any stop.
+
+    Each stop is served by services_per_stop services at a fixed headway.
+    Trips have real-time departures once they are within realtime_window
+    seconds of their scheduled departure, with a delay that drifts as the
+    departure approaches, and some trips are cancelled. Everything is derived
+    from the seed, so the same departures are served for the same time.
+    """
+
+    def __init__(
+        self,
+        services_per_stop: int = 5,
+        realtime_ratio: float = 0.8,
+        cancelled_ratio: float = 0.03,
+        realtime_window: int = 1800,
+        seed: int = 0,
+    ) -> None:
+        """Initialise simulated timetable."""
+        self.services_per_stop = services_per_stop
+        self.realtime_ratio = realtime_ratio
+        self.cancelled_ratio = cancelled_ratio
+        self.realtime_window = realtime_window
+        self.seed = seed
+        self._services: dict[str, list[tuple[str, str, str, int, int]]] = {}
+
+    def _stop_services(self, stop_id: str) -> list[tuple[str, str, str, int, int]]:
+        """Return service, direction, destination, headway and offset at stop."""
+        if (services := self._services.get(stop_id)) is None:
+            rnd = random.Random(f"{self.seed}:{stop_id}")
+            services = []
+            for _ in range(self.services_per_stop):
+                headway = rnd.randint(8, 30) * 60
+                services.append(
+                    (
+                        str(rnd.randint(1, 150)),
+                        rnd.choice(["INBOUND", "OUTBOUND"]),
+                        rnd.choice(DESTINATIONS),
+                        headway,
+                        rnd.randrange(0, headway, 60),
+                    )
+                )
+            self._services[stop_id] = services
+        return services
+
+    def departures(
+        self, stop_id: str, now: float, horizon: int
+    ) -> list[tuple[int, dict[str, Any]]]:
+        """Return departure times and stopDepartures entries of a stop.
+
+        Departures are included from one minute before now until horizon
+        seconds after now.
+        """
+        deps = []
+        for service, direction, destination, headway, offset in self._stop_services(
+            stop_id
+        ):
+            first = math.ceil((now - 3600 - offset) / headway)
+            last = math.floor((now + horizon - offset) / headway)
+            for trip in range(first, last + 1):
+                scheduled = offset + trip * headway
+                rnd = random.Random(f"{self.seed}:{stop_id}:{service}:{trip}")
+                has_realtime = rnd.random() < self.realtime_ratio
+                cancelled = rnd.random() < self.cancelled_ratio
+                base_delay = rnd.gauss(60, 120)
+                drift = rnd.uniform(-0.1, 0.3)
+
+                realtime = None
+                tracked = now >= scheduled - self.realtime_window
+                if tracked and has_realtime and not cancelled:
+                    elapsed = now - (scheduled - self.realtime_window)
+                    delay = min(max(base_delay + drift * elapsed, -120), 1800)
+                    realtime = scheduled + int(delay)
+                departure = realtime or scheduled
+                if departure < now - 60 or scheduled > now + horizon:
+                    continue
+                deps.append(
+                    (
+                        departure,
+                        {
+                            "stopRef": stop_id,
+                            "serviceNumber": service,
+                            "serviceDirection": direction,
+                            "destination": destination,
+                            "scheduledDeparture": _isoformat(scheduled),
+                            "realTimeDeparture": (
+                                _isoformat(realtime) if realtime else None
+                            ),
+                            "cancelled": tracked and cancelled,
+                        },
+                    )
+                )
+        return deps
+
+
+def _isoformat(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, TIMEZONE).isoformat(
+        timespec="milliseconds"
+    )
+
+
+class SimulatorStats:
+    """Requests recorded by the simulator."""
+
+    def __init__(self, rate_window: int = 60) -> None:
+        """Initialise simulator statistics."""
+        self.rate_window = rate_window
+        self.requests = 0
+        self.statuses: Counter[int] = Counter()
+        self.empty = 0
+        self.stop_requests: Counter[str] = Counter()
+        self.stop_served: dict[str, float] = {}
+        self._request_times: deque[float] = deque()
+
+    def record(self, now: float, stop_ids: list[str], status: int, empty: bool) -> None:
+        """Record a request and its response."""
+        self.requests += 1
+        self.statuses[status] += 1
+        self.stop_requests.update(stop_ids)
+        if empty:
+            self.empty += 1
+        elif status == 200:
+            for stop_id in stop_ids:
+                self.stop_served[stop_id] = now
+        self._request_times.append(now)
+
+    def request_rate(self, now: float) -> float:
+        """Return requests per minute within the rate window."""
+        request_times = self._request_times
+        while request_times and request_times[0] < now - self.rate_window:
+            request_times.popleft()
+        return len(request_times) * 60 / self.rate_window
+
+    def freshness(self, now: float) -> dict[str, float]:
+        """Return seconds since departures were last served for each stop."""
+        return {stop_id: now - served for stop_id, served in self.stop_served.items()}
+
+    def as_dict(self, now: float) -> dict[str, Any]:
+        """Return statistics for reporting."""
+        freshness = self.freshness(now)
+        return {
+            "requests": self.requests,
+            "requests_per_minute": self.request_rate(now),
+            "statuses": dict(self.statuses),
+            "empty_responses": self.empty,
+            "stop_requests": dict(self.stop_requests),
+            "stop_freshness": freshness,
+            "max_freshness": max(freshness.values(), default=None),
+        }
+
+
+class TFISimulator:
+    """Local HTTP server simulating the TFI departures API.
+
+    Fault attributes may be changed while the server is running. latency is
+    the mean response delay in seconds, varied uniformly by latency_jitter.
+    error_rate and empty_rate are the probabilities of responding with one
+    of error_statuses, and with no departures.
+    """
+
+    def __init__(
+        self,
+        timetable: SimulatedTimetable | None = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        horizon: int = 7200,
+        latency: float = 0.0,
+        latency_jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_statuses: list[int] | None = None,
+        empty_rate: float = 0.0,
+        clock: Callable[[], float] = time.time,
+        seed: int = 0,
+    ) -> None:
+        """Initialise simulator."""
+        self.timetable = timetable or SimulatedTimetable(seed=seed)
+        self.host = host
+        self.port = port
+        self.horizon = horizon
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses or [500, 502, 503]
+        self.empty_rate = empty_rate
+        self.clock = clock
+        self.stats = SimulatorStats()
+        self._random = random.Random(seed)
+        self._runner: web.AppRunner | None = None
+
+    @property
+    def url(self) -> str:
+        """Return URL of the departures API."""
+        return f"http://{self.host}:{self.port}{DEPARTURES_PATH}"
+
+    async def start(self) -> None:
+        """Start serving requests."""
+        app = web.Application()
+        app.router.add_post(DEPARTURES_PATH, self._handle_departures)
+        app.router.add_get(STATS_PATH, self._handle_stats)
+        app.router.add_post(FAULTS_PATH, self._handle_faults)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        ## Port 0 binds to a free port
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self) -> None:
+        """Stop serving requests."""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> TFISimulator:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.stop()
+
+    def departures(self, stop_ids: list[str], now: float) -> list[dict[str, Any]]:
+        """Return stopDepartures entries of stops at simulated time now."""
+        deps = [
+            dep
+            for stop_id in dict.fromkeys(stop_ids)
+            for dep in self.timetable.departures(stop_id, now, self.horizon)
+        ]
+        deps.sort(key=lambda dep: dep[0])
+        return [dep_raw for _, dep_raw in deps]
+
+    async def _handle_departures(self, request: web.Request) -> web.Response:
+        post_data = await request.json()
+        stop_ids = post_data.get("stopIds") or []
+        if self.latency or self.latency_jitter:
+            await asyncio.sleep(
+                max(
+                    self.latency
+                    + self._random.uniform(-self.latency_jitter, self.latency_jitter),
+                    0,
+                )
+            )
+
+        now = self.clock()
+        if self._random.random() < self.error_rate:
+            status = self._random.choice(self.error_statuses)
+            self.stats.record(now, stop_ids, status, False)
+            return web.Response(status=status, text="Simulated error")
+
+        empty = self._random.random() < self.empty_rate
+        self.stats.record(now, stop_ids, 200, empty)
+        return web.json_response(
+            {"stopDepartures": [] if empty else self.departures(stop_ids, now)}
+        )
+
+    async def _handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats.as_dict(self.clock()))
+
+    async def _handle_faults(self, request: web.Request) -> web.Response:
+        faults = await request.json()
+        for key, value in faults.items():
+            if key not in FAULTS:
+                raise web.HTTPBadRequest(text=f"unknown fault {key}")
+            setattr(self, key, value)
+        return web.json_response({key: getattr(self, key) for key in FAULTS})
+
+
+async def serve(args: argparse.Namespace) -> None:
+    """Run simulator until interrupted, reporting statistics periodically."""
+    timetable = SimulatedTimetable(
+        services_per_stop=args.services_per_stop,
+        realtime_ratio=args.realtime_ratio,
+        cancelled_ratio=args.cancelled_ratio,
+        seed=args.seed,
+    )
+    async with TFISimulator(
+        timetable,
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        error_rate=args.error_rate,
+        error_statuses=args.error_status,
+        empty_rate=args.empty_rate,
+        seed=args.seed,
+    ) as simulator:
+        print(f"serving departures at {simulator.url}")
+        while True:
+            await asyncio.sleep(args.report_interval)
+            stats = simulator.stats.as_dict(simulator.clock())
+            max_freshness = stats["max_freshness"]
+            print(
+                f"{datetime.now().strftime('%H:%M:%S')} "
+                f"{stats['requests']} requests, "
+                f"{stats['requests_per_minute']:.1f}/min, "
+                f"statuses {stats['statuses']}, "
+                f"{stats['empty_responses']} empty, "
+                f"{len(stats['stop_freshness'])} stops, oldest "
+                + (f"{max_freshness:.0f}s" if max_freshness is not None else "-")
+            )
+
+
+def main() -> None:
+    """Run simulator."""
+    parser = argparse.ArgumentParser(description=__doc__.partition("\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--services-per-stop", type=int, default=5)
+    parser.add_argument("--realtime-ratio", type=float, default=0.8)
+    parser.add_argument("--cancelled-ratio", type=float, default=0.03)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--latency-jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--error-status", type=int, action="append", help="may be repeated"
+    )
+    parser.add_argument("--empty-rate", type=float, default=0.0)
+    parser.add_argument("--report-interval", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -10,17 +10,31 @@ from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
 from homeassistant.core import HomeAssistant
 from homeassistant.exceptions import PlatformNotReady
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.storage import STORAGE_DIR
 
 from .const import (
     DOMAIN,
+    DATA_HUB,
     CONF_UPDATE_INTERVAL,
     CONF_UPDATE_INTERVAL_FAST,
     CONF_UPDATE_INTERVAL_NO_DATA,
     CONF_UPDATE_HORIZON_FAST,
+    CONF_TIMETABLE_PREFETCH,
+    CONF_LEARN_SERVICE_HOURS,
+    CONF_GTFS_STATIC_PATH,
+    CONF_STOPS,
+    DEFAULTS,
+    STORAGE_DIR_TIMETABLE,
 )
-from .tfi_journeyplanner_api import TFIData
+from .cache_store import DepartureCacheStore
+from .hub import TFIHub
 from .coordinator import TFIJourneyPlannerCoordinator
-from .util import get_duration_option
+from .gtfs import get_timetable_db_path, remove_timetable_db
+from .service_hours import ServiceHoursStore
+from .services import async_setup_services, async_unload_services
+from .util import get_departure_horizon, get_duration_option
+from .websocket_api import async_setup_websocket_api
 
 PLATFORMS: list[Platform] = [Platform.SENSOR, Platform.SWITCH]
 
@@ -32,31 +46,57 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 
     hass.data.setdefault(DOMAIN, {})
 
-    ## Set up platform data update coordinator
-    try:
-        tfi_data = TFIData()
-        await tfi_data.setup()
-    except Exception as exc:  # pylint: disable=broad-except
-        _LOGGER.error(
-            "Could not set up integration: %s: %s", type(exc).__name__, str(exc)
-        )
-        raise PlatformNotReady  # pylint: disable=raise-missing-from
+    ## Set up shared fetch hub
+    if (hub := hass.data[DOMAIN].get(DATA_HUB)) is None:
+        try:
+            hub = TFIHub()
+            hub.cache_store = DepartureCacheStore(hass, hub.tfi_data)
+            hub.service_hours = ServiceHoursStore(hass)
+            hub.tfi_data.shared_session = async_get_clientsession(hass)
+            hub.tfi_data.timetable_db_dir = hass.config.path(
+                STORAGE_DIR, STORAGE_DIR_TIMETABLE
+            )
+            await hub.setup()
+        except Exception as exc:  # pylint: disable=broad-except
+            _LOGGER.error(
+                "Could not set up integration: %s: %s", type(exc).__name__, str(exc)
+            )
+            raise PlatformNotReady  # pylint: disable=raise-missing-from
+        hass.data[DOMAIN][DATA_HUB] = hub
+        async_setup_services(hass)
+        async_setup_websocket_api(hass)
 
+    ## Set up platform data update coordinator
     options = entry.options
     coordinator = TFIJourneyPlannerCoordinator(
         hass,
-        tfi_data,
-        # departure_horizon,
+        hub,
         get_duration_option(options, CONF_UPDATE_INTERVAL),
         get_duration_option(options, CONF_UPDATE_INTERVAL_FAST),
         get_duration_option(options, CONF_UPDATE_INTERVAL_NO_DATA),
         get_duration_option(options, CONF_UPDATE_HORIZON_FAST),
+        timetable_prefetch=options.get(
+            CONF_TIMETABLE_PREFETCH, DEFAULTS[CONF_TIMETABLE_PREFETCH]
+        ),
+        departure_horizon=max(
+            get_departure_horizon(options, stop) for stop in options[CONF_STOPS]
+        ),
+        learn_service_hours=options.get(
+            CONF_LEARN_SERVICE_HOURS, DEFAULTS[CONF_LEARN_SERVICE_HOURS]
+        ),
+    )
+    hub.subscribe(
+        entry.entry_id,
+        options,
+        update_callback=coordinator.async_update_listeners,
+        scheduler=coordinator.scheduler,
     )
     await coordinator.async_config_entry_first_refresh()
 
     hass.data[DOMAIN].setdefault(entry.entry_id, {})
     hass.data[DOMAIN][entry.entry_id]["coordinator"] = coordinator
-    hass.data[DOMAIN][entry.entry_id]["tfi_data"] = tfi_data
+    hass.data[DOMAIN][entry.entry_id]["tfi_data"] = hub.tfi_data
+    hass.data[DOMAIN][entry.entry_id]["attribute_cache"] = hub.attribute_cache
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
     entry.async_on_unload(entry.add_update_listener(_async_update_listener))
@@ -71,12 +111,31 @@ async def _async_update_listener(hass: HomeAssistant, entry: ConfigEntry) -> Non
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
-    entry_data = hass.data[DOMAIN][entry.entry_id]
-    # coordinator: TFIJourneyPlannerCoordinator = entry_data["coordinator"]
-    tfi_data: TFIData = entry_data["tfi_data"]
+    hub: TFIHub = hass.data[DOMAIN][DATA_HUB]
 
     if unload_ok := await hass.config_entries.async_unload_platforms(entry, PLATFORMS):
-        await tfi_data.cleanup()
+        hub.unsubscribe(entry.entry_id)
         hass.data[DOMAIN].pop(entry.entry_id)
+        if not hub.subscribers:
+            async_unload_services(hass)
+            await hub.cleanup()
+            hass.data[DOMAIN].pop(DATA_HUB)
 
     return unload_ok
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Remove the timetable database of a removed config entry."""
+    if not (path := entry.options.get(CONF_GTFS_STATIC_PATH)):
+        return
+    ## Timetable databases are shared by entries with the same timetable
+    if any(
+        other.options.get(CONF_GTFS_STATIC_PATH) == path
+        for other in hass.config_entries.async_entries(DOMAIN)
+        if other.entry_id != entry.entry_id
+    ):
+        return
+    db_path = get_timetable_db_path(
+        hass.config.path(STORAGE_DIR, STORAGE_DIR_TIMETABLE), path
+    )
+    await hass.async_add_executor_job(remove_timetable_db, db_path)
@@ -0,0 +1,88 @@
+"""TFI Journey Planner departure attribute projection."""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from collections.abc import Hashable, Sequence
+from datetime import datetime
+import json
+from typing import Any
+
+from .const import DEFAULT_ATTRIBUTE_CACHE_SIZE
+from .departures import Departure
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+
+def project_departures(
+    departures: Sequence[Departure],
+    fields: tuple[str, ...] | None = None,
+    max_bytes: int = 0,
+) -> list[dict[str, Any]]:
+    """Return departure attributes restricted to fields and max_bytes.
+
+    Departures are added in order until the JSON encoded list would exceed
+    max_bytes, so later departures are dropped first. A max_bytes of 0
+    disables the limit.
+    """
+    projected = []
+    size = 2  ## enclosing brackets
+    for dep in departures:
+        item = dep.as_dict(fields)
+        if max_bytes:
+            size += len(
+                json.dumps(item, default=_json_default, separators=(",", ":"))
+            ) + bool(projected)
+            if size > max_bytes:
+                break
+        projected.append(item)
+    return projected
+
+
+class DepartureAttributeCache:
+    """Projected departure attributes shared between sensors.
+
+    Sensors with identical filters select the same departures on each poll,
+    so the projection is computed by the first sensor and reused by the
+    others. The least recently used projections are evicted once the cache
+    holds max_entries.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_ATTRIBUTE_CACHE_SIZE) -> None:
+        """Initialise departure attribute cache."""
+        self.max_entries = max_entries
+        self._cache: OrderedDict[Hashable, list[dict[str, Any]]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def clear(self) -> None:
+        """Remove all projections."""
+        self._cache.clear()
+
+    def project(
+        self,
+        key: Hashable,
+        departures: Sequence[Departure],
+        fields: tuple[str, ...] | None = None,
+        max_bytes: int = 0,
+    ) -> list[dict[str, Any]]:
+        """Return projected attributes of departures identified by key.
+
+        key must change whenever any projected value of the departures
+        changes. The returned list is shared and must not be modified.
+        """
+        cache_key = (key, fields, max_bytes)
+        if (projected := self._cache.get(cache_key)) is not None:
+            self._cache.move_to_end(cache_key)
+            return projected
+
+        projected = project_departures(departures, fields, max_bytes)
+        self._cache[cache_key] = projected
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return projected
@@ -0,0 +1,98 @@
+"""TFI Journey Planner persistent departure cache."""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+import logging
+from typing import Any
+
+from homeassistant.const import EVENT_HOMEASSISTANT_FINAL_WRITE
+from homeassistant.core import CALLBACK_TYPE, Event, HomeAssistant, callback
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.storage import Store
+
+from .const import (
+    STORAGE_KEY_DEPARTURES,
+    STORAGE_VERSION,
+    DEFAULT_CACHE_SAVE_INTERVAL,
+)
+from .tfi_journeyplanner_api import TFIData
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class DepartureCacheStore:
+    """Snapshot cached departures to disk for warm restarts.
+
+    The departure cache is saved periodically when it has changed, and when
+    Home Assistant shuts down. Departures are saved as compact rows to keep
+    the snapshot small.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        tfi_data: TFIData,
+        save_interval: timedelta = DEFAULT_CACHE_SAVE_INTERVAL,
+    ) -> None:
+        """Initialise persistent departure cache."""
+        self.hass = hass
+        self.tfi_data = tfi_data
+        self.save_interval = save_interval
+        self._store: Store[dict[str, Any]] = Store(
+            hass, STORAGE_VERSION, STORAGE_KEY_DEPARTURES
+        )
+        self._dirty = False
+        self._unsub_interval: CALLBACK_TYPE | None = None
+        self._unsub_final_write: CALLBACK_TYPE | None = None
+
+    async def async_load(self) -> None:
+        """Restore the departure cache and start saving snapshots."""
+        try:
+            snapshot = await self._store.async_load()
+        except Exception as exc:  # pylint: disable=broad-except
+            _LOGGER.warning(
+                "Could not load departure cache: %s: %s", type(exc).__name__, exc
+            )
+            snapshot = None
+        if snapshot:
+            restored = self.tfi_data.restore(snapshot)
+            _LOGGER.debug("restored %d cached departures", restored)
+
+        self._unsub_interval = async_track_time_interval(
+            self.hass, self._async_save_interval, self.save_interval
+        )
+        self._unsub_final_write = self.hass.bus.async_listen_once(
+            EVENT_HOMEASSISTANT_FINAL_WRITE, self._async_final_write
+        )
+
+    async def async_unload(self) -> None:
+        """Stop saving snapshots and save the departure cache."""
+        if self._unsub_interval:
+            self._unsub_interval()
+            self._unsub_interval = None
+        if self._unsub_final_write:
+            self._unsub_final_write()
+            self._unsub_final_write = None
+        await self.async_save()
+
+    @callback
+    def async_mark_dirty(self) -> None:
+        """Mark the departure cache as changed since the last snapshot."""
+        self._dirty = True
+
+    async def async_save(self) -> None:
+        """Save a snapshot of the departure cache if it has changed."""
+        if not self._dirty:
+            return
+        self._dirty = False
+        snapshot = self.tfi_data.snapshot()
+        _LOGGER.debug("saving %d cached departures", len(snapshot["departures"]))
+        await self._store.async_save(snapshot)
+
+    async def _async_save_interval(self, _now: datetime) -> None:
+        await self.async_save()
+
+    async def _async_final_write(self, _event: Event) -> None:
+        self._unsub_final_write = None
+        await self.async_save()
@@ -0,0 +1,114 @@
+"""TFI Journey Planner API circuit breaker."""
+
+from __future__ import annotations
+
+from datetime import timedelta
+import logging
+import random
+import time
+
+from .const import (
+    DEFAULT_CIRCUIT_FAILURE_THRESHOLD,
+    DEFAULT_CIRCUIT_BACKOFF_INITIAL,
+    DEFAULT_CIRCUIT_BACKOFF_MAX,
+    DEFAULT_CIRCUIT_BACKOFF_JITTER,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Stop sending requests to a failing API.
+
+    The circuit opens after failure_threshold consecutive failed requests,
+    and requests are refused until the backoff has elapsed. A single probe
+    request is then allowed through (half open): if it succeeds the circuit
+    closes, otherwise it opens again with the backoff doubled up to
+    backoff_max. Backoffs are extended by a random jitter so that retries
+    from several clients do not synchronise.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = DEFAULT_CIRCUIT_FAILURE_THRESHOLD,
+        backoff_initial: timedelta = DEFAULT_CIRCUIT_BACKOFF_INITIAL,
+        backoff_max: timedelta = DEFAULT_CIRCUIT_BACKOFF_MAX,
+        jitter: float = DEFAULT_CIRCUIT_BACKOFF_JITTER,
+    ) -> None:
+        """Initialise closed circuit breaker."""
+        self.failure_threshold = failure_threshold
+        self.backoff_initial = backoff_initial.total_seconds()
+        self.backoff_max = backoff_max.total_seconds()
+        self.jitter = jitter
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self._backoff = 0.0
+        self._retry_at = 0.0
+        self._probing = False
+
+    @property
+    def is_closed(self) -> bool:
+        """Return whether requests are sent normally."""
+        return self.state == STATE_CLOSED
+
+    @property
+    def retry_in(self) -> float | None:
+        """Return seconds until the next probe request, or None if closed."""
+        if self.state == STATE_CLOSED:
+            return None
+        return max(self._retry_at - time.monotonic(), 0.0)
+
+    def allow_request(self) -> bool:
+        """Return whether a request may be sent now.
+
+        Once the backoff has elapsed, only the first caller is allowed to
+        send a probe request until its outcome has been recorded.
+        """
+        if self.state == STATE_CLOSED:
+            return True
+        if self._probing or time.monotonic() < self._retry_at:
+            return False
+        _LOGGER.debug("circuit half open, sending probe request")
+        self.state = STATE_HALF_OPEN
+        self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        """Record a successful request and close the circuit."""
+        if self.state != STATE_CLOSED:
+            _LOGGER.info("TFI API has recovered, resuming requests")
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self._backoff = 0.0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        """Record a failed request, opening the circuit if required."""
+        self.failures += 1
+        if self.state == STATE_HALF_OPEN:
+            self._open(min(self._backoff * 2, self.backoff_max))
+        elif self.state == STATE_CLOSED and self.failures >= self.failure_threshold:
+            _LOGGER.warning(
+                "TFI API failed %d consecutive requests, pausing requests",
+                self.failures,
+            )
+            self._open(self.backoff_initial)
+
+    def abort_request(self) -> None:
+        """Record a request that was abandoned without an outcome."""
+        if self.state == STATE_HALF_OPEN:
+            ## Allow another probe request straight away
+            self.state = STATE_OPEN
+            self._probing = False
+
+    def _open(self, backoff: float) -> None:
+        self._backoff = backoff
+        delay = backoff * (1 + random.uniform(0, self.jitter))
+        self._retry_at = time.monotonic() + delay
+        self.state = STATE_OPEN
+        self._probing = False
+        _LOGGER.debug("circuit open, next probe request in %.1fs", delay)
@@ -3,6 +3,7 @@
 from __future__ import annotations
 
 import logging
+import os
 from typing import Any, Tuple
 import re
 from datetime import timedelta
@@ -10,7 +11,7 @@ from datetime import timedelta
 import voluptuous as vol
 
 from homeassistant import config_entries
-from homeassistant.core import callback
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.data_entry_flow import FlowResult
 from homeassistant.helpers import selector
 
@@ -29,12 +30,27 @@ from .const import (
     CONF_UPDATE_HORIZON_FAST,
     CONF_REALTIME_ONLY,
     CONF_INCLUDE_CANCELLED,
+    CONF_SHARD_SIZE,
+    CONF_SHARD_CONCURRENCY,
+    CONF_STREAM_DECODE,
+    CONF_EXECUTOR_THRESHOLD,
+    CONF_SHARED_SESSION,
+    CONF_FIRST_DEPARTURE_GRANULARITY,
+    CONF_ATTRIBUTE_FIELDS,
+    CONF_ATTRIBUTE_MAX_BYTES,
+    CONF_GTFS_STATIC_PATH,
+    CONF_TIMETABLE_PREFETCH,
+    CONF_GTFS_REALTIME_FEED,
+    CONF_GTFS_REALTIME_API_KEY,
+    CONF_API_URL,
+    CONF_LEARN_SERVICE_HOURS,
     ENTRY_DATA,
     ENTRY_OPTIONS,
     DEFAULTS,
     DEFAULT_TITLE,
     DEFAULT_DEPARTURE_HORIZON,
 )
+from .departures import DEPARTURE_ATTRIBUTES
 from .util import (
     duration_to_seconds,
     duration_str_to_seconds,
@@ -73,6 +89,25 @@ OPTIONS_STOPS_SCHEMA_ITEMS = {
     vol.Required(
         CONF_INCLUDE_CANCELLED, default=DEFAULTS[CONF_INCLUDE_CANCELLED]
     ): selector.BooleanSelector(),
+    vol.Optional(CONF_ATTRIBUTE_FIELDS): selector.SelectSelector(
+        selector.SelectSelectorConfig(
+            options=list(DEPARTURE_ATTRIBUTES), multiple=True
+        ),
+    ),
+    vol.Required(
+        CONF_ATTRIBUTE_MAX_BYTES, default=DEFAULTS[CONF_ATTRIBUTE_MAX_BYTES]
+    ): vol.Coerce(
+        int,
+        selector.NumberSelector(
+            selector.NumberSelectorConfig(
+                min=0,
+                max=65536,
+                step=256,
+                unit_of_measurement="bytes",
+                mode=selector.NumberSelectorMode.BOX,
+            )
+        ),
+    ),
 }
 
 OPTIONS_TIMERS_SCHEMA_ITEMS = {
@@ -92,6 +127,64 @@ OPTIONS_TIMERS_SCHEMA_ITEMS = {
         CONF_UPDATE_INTERVAL_NO_DATA,
         default=seconds_to_duration(DEFAULTS[CONF_UPDATE_INTERVAL_NO_DATA]),
     ): selector.DurationSelector(selector.DurationSelectorConfig(enable_day=False)),
+    vol.Required(
+        CONF_FIRST_DEPARTURE_GRANULARITY,
+        default=seconds_to_duration(DEFAULTS[CONF_FIRST_DEPARTURE_GRANULARITY]),
+    ): selector.DurationSelector(selector.DurationSelectorConfig(enable_day=False)),
+    vol.Required(
+        CONF_LEARN_SERVICE_HOURS, default=DEFAULTS[CONF_LEARN_SERVICE_HOURS]
+    ): selector.BooleanSelector(),
+}
+
+OPTIONS_FETCH_SCHEMA_ITEMS = {
+    vol.Required(CONF_SHARD_SIZE, default=DEFAULTS[CONF_SHARD_SIZE]): vol.Coerce(
+        int,
+        selector.NumberSelector(
+            selector.NumberSelectorConfig(
+                min=0, max=50, mode=selector.NumberSelectorMode.BOX
+            )
+        ),
+    ),
+    vol.Required(
+        CONF_SHARD_CONCURRENCY, default=DEFAULTS[CONF_SHARD_CONCURRENCY]
+    ): vol.Coerce(
+        int,
+        selector.NumberSelector(
+            selector.NumberSelectorConfig(
+                min=1, max=10, mode=selector.NumberSelectorMode.SLIDER
+            )
+        ),
+    ),
+    vol.Required(
+        CONF_STREAM_DECODE, default=DEFAULTS[CONF_STREAM_DECODE]
+    ): selector.BooleanSelector(),
+    vol.Required(
+        CONF_EXECUTOR_THRESHOLD, default=DEFAULTS[CONF_EXECUTOR_THRESHOLD]
+    ): vol.Coerce(
+        int,
+        selector.NumberSelector(
+            selector.NumberSelectorConfig(
+                min=0,
+                max=65536,
+                unit_of_measurement="KiB",
+                mode=selector.NumberSelectorMode.BOX,
+            )
+        ),
+    ),
+    vol.Required(
+        CONF_SHARED_SESSION, default=DEFAULTS[CONF_SHARED_SESSION]
+    ): selector.BooleanSelector(),
+    vol.Optional(CONF_GTFS_STATIC_PATH): selector.TextSelector(),
+    vol.Required(
+        CONF_TIMETABLE_PREFETCH, default=DEFAULTS[CONF_TIMETABLE_PREFETCH]
+    ): selector.BooleanSelector(),
+    vol.Optional(CONF_GTFS_REALTIME_FEED): selector.TextSelector(),
+    vol.Optional(CONF_GTFS_REALTIME_API_KEY): selector.TextSelector(
+        selector.TextSelectorConfig(type=selector.TextSelectorType.PASSWORD)
+    ),
+    vol.Optional(CONF_API_URL): selector.TextSelector(
+        selector.TextSelectorConfig(type=selector.TextSelectorType.URL)
+    ),
 }
 
 STEP_USER_DATA_SCHEMA = vol.Schema(
@@ -103,6 +196,7 @@ STEP_USER_DATA_SCHEMA = vol.Schema(
 
 STEP_OPTIONS_STOPS_SCHEMA = vol.Schema({**OPTIONS_STOPS_SCHEMA_ITEMS})
 STEP_OPTIONS_TIMERS_SCHEMA = vol.Schema({**OPTIONS_TIMERS_SCHEMA_ITEMS})
+STEP_OPTIONS_FETCH_SCHEMA = vol.Schema({**OPTIONS_FETCH_SCHEMA_ITEMS})
 
 
 def convert_options(options: dict[str, Any]) -> dict[str, Any]:
@@ -138,6 +232,11 @@ def convert_options(options: dict[str, Any]) -> dict[str, Any]:
                         if CONF_LIMIT_DEPARTURES in stop
                         else ""
                     )
+                    + (
+                        "!" + ",".join(stop[CONF_ATTRIBUTE_FIELDS])
+                        if CONF_ATTRIBUTE_FIELDS in stop
+                        else ""
+                    )
                 )
             else:
                 stop_list.append(stop)
@@ -159,11 +258,20 @@ def convert_options(options: dict[str, Any]) -> dict[str, Any]:
     flow_options[CONF_UPDATE_HORIZON_FAST] = seconds_to_duration(
         options.get(CONF_UPDATE_HORIZON_FAST), DEFAULTS[CONF_UPDATE_HORIZON_FAST]
     )
+    flow_options[CONF_FIRST_DEPARTURE_GRANULARITY] = seconds_to_duration(
+        options.get(CONF_FIRST_DEPARTURE_GRANULARITY),
+        DEFAULTS[CONF_FIRST_DEPARTURE_GRANULARITY],
+    )
 
     return flow_options
 
 
-def validate_input(
+class InvalidAttributeFields(ValueError):
+    """Stop specification with an empty or unknown departure attribute."""
+
+
+async def validate_input(
+    hass: HomeAssistant,
     user_input: dict[str, Any],
 ) -> Tuple[dict[str, Any], dict[str, Any], dict[str, str], dict[str, str]]:
     """Validate the user input."""
@@ -174,7 +282,7 @@ def validate_input(
     options = {k: v for (k, v) in user_input.items() if k in ENTRY_OPTIONS}
 
     def parse_stop_raw(stop_raw: str) -> dict[str, Any]:
-        stop_split = re.split(r"([=/@#])", stop_raw)
+        stop_split = re.split(r"([=/@#!])", stop_raw)
         stop = {CONF_STOP_IDS: stop_split.pop(0).split(",")}
         while len(stop_split) > 0:
             match stop_split.pop(0):
@@ -192,6 +300,11 @@ def validate_input(
                             )
                         }
                     )
+                case "!":  ## attribute_fields override
+                    fields = stop_split.pop(0).split(",")
+                    if not all(fields) or set(fields).difference(DEPARTURE_ATTRIBUTES):
+                        raise InvalidAttributeFields(fields)
+                    stop.update({CONF_ATTRIBUTE_FIELDS: fields})
         return stop
 
     try:
@@ -205,6 +318,12 @@ def validate_input(
                     try:
                         stop = parse_stop_raw(stop_raw)
                         stops.append(stop)
+                    except InvalidAttributeFields:
+                        errors[CONF_STOPS] = "invalid_attribute_fields"
+                        description_placeholders["stop"] = stop_raw
+                        description_placeholders["attributes"] = ", ".join(
+                            DEPARTURE_ATTRIBUTES
+                        )
                     except Exception:  # pylint: disable=broad-except
                         errors[CONF_STOPS] = "invalid_stop_id"
                         description_placeholders.setdefault("stops", [])
@@ -212,6 +331,24 @@ def validate_input(
 
                 options[CONF_STOPS] = stops
 
+        if gtfs_static_path := user_input.get(CONF_GTFS_STATIC_PATH):
+            if not await hass.async_add_executor_job(os.path.isfile, gtfs_static_path):
+                errors[CONF_GTFS_STATIC_PATH] = "invalid_gtfs_static_path"
+        elif user_input.get(CONF_TIMETABLE_PREFETCH):
+            errors[CONF_TIMETABLE_PREFETCH] = "missing_gtfs_static_path"
+        if gtfs_realtime_feed := user_input.get(CONF_GTFS_REALTIME_FEED):
+            if not user_input.get(CONF_GTFS_STATIC_PATH):
+                errors[CONF_GTFS_REALTIME_FEED] = "missing_gtfs_static_path"
+            elif not gtfs_realtime_feed.startswith(
+                ("http://", "https://")
+            ) and not await hass.async_add_executor_job(
+                os.path.isfile, gtfs_realtime_feed.removeprefix("file://")
+            ):
+                errors[CONF_GTFS_REALTIME_FEED] = "invalid_gtfs_realtime_feed"
+        if api_url := user_input.get(CONF_API_URL):
+            if not api_url.startswith(("http://", "https://")):
+                errors[CONF_API_URL] = "invalid_api_url"
+
         if CONF_DEPARTURE_HORIZON in user_input:
             if duration := duration_to_seconds(user_input[CONF_DEPARTURE_HORIZON]):
                 options[CONF_DEPARTURE_HORIZON] = duration
@@ -229,6 +366,11 @@ def validate_input(
         if CONF_UPDATE_HORIZON_FAST in user_input:
             if duration := duration_to_seconds(user_input[CONF_UPDATE_HORIZON_FAST]):
                 options[CONF_UPDATE_HORIZON_FAST] = duration
+        if CONF_FIRST_DEPARTURE_GRANULARITY in user_input:
+            if duration := duration_to_seconds(
+                user_input[CONF_FIRST_DEPARTURE_GRANULARITY]
+            ):
+                options[CONF_FIRST_DEPARTURE_GRANULARITY] = duration
 
         return (data, options, errors, description_placeholders)
     except Exception as exc:  # pylint: disable=broad-except
@@ -259,8 +401,8 @@ class TFIJourneyPlannerConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         description_placeholders: dict[str, str] = {}
 
         if user_input is not None:
-            (data, options, errors, description_placeholders) = validate_input(
-                user_input
+            (data, options, errors, description_placeholders) = await validate_input(
+                self.hass, user_input
             )
             if not errors:
                 return self.async_create_entry(
@@ -299,8 +441,13 @@ class TFIJourneyPlannerOptionsFlow(config_entries.OptionsFlow):
         description_placeholders: dict[str, str] = {}
 
         if user_input is not None:
-            (_, options, errors, description_placeholders) = validate_input(user_input)
+            (_, options, errors, description_placeholders) = await validate_input(
+                self.hass, user_input
+            )
             if not errors:
+                ## Filters and attribute fields are removed when cleared
+                for opt in (CONF_SERVICE_IDS, CONF_DIRECTION, CONF_ATTRIBUTE_FIELDS):
+                    self._options.pop(opt, None)
                 self._options.update(options)
                 return await self.async_step_timer_options()
 
@@ -322,10 +469,12 @@ class TFIJourneyPlannerOptionsFlow(config_entries.OptionsFlow):
         description_placeholders: dict[str, str] = {}
 
         if user_input is not None:
-            (_, options, errors, description_placeholders) = validate_input(user_input)
+            (_, options, errors, description_placeholders) = await validate_input(
+                self.hass, user_input
+            )
             if not errors:
                 self._options.update(options)
-                return self.async_create_entry(title="", data=self._options)
+                return await self.async_step_fetch_options()
 
         return self.async_show_form(
             step_id="timer_options",
@@ -336,3 +485,36 @@ class TFIJourneyPlannerOptionsFlow(config_entries.OptionsFlow):
             errors=errors,
             description_placeholders=description_placeholders,
         )
+
+    async def async_step_fetch_options(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Handle fetch options page."""
+        errors: dict[str, str] = {}
+        description_placeholders: dict[str, str] = {}
+
+        if user_input is not None:
+            (_, options, errors, description_placeholders) = await validate_input(
+                self.hass, user_input
+            )
+            if not errors:
+                ## Timetable, real-time feed and API URL are removed when cleared
+                for opt in (
+                    CONF_GTFS_STATIC_PATH,
+                    CONF_GTFS_REALTIME_FEED,
+                    CONF_GTFS_REALTIME_API_KEY,
+                    CONF_API_URL,
+                ):
+                    self._options.pop(opt, None)
+                self._options.update(options)
+                return self.async_create_entry(title="", data=self._options)
+
+        return self.async_show_form(
+            step_id="fetch_options",
+            data_schema=self.add_suggested_values_to_schema(
+                STEP_OPTIONS_FETCH_SCHEMA,
+                user_input if user_input else self._flow_options,
+            ),
+            errors=errors,
+            description_placeholders=description_placeholders,
+        )
@@ -4,6 +4,21 @@ from datetime import timedelta
 
 DOMAIN = "tfi_journeyplanner"
 
+DATA_HUB = "hub"
+
+SERVICE_PLAN_JOURNEY = "plan_journey"
+ATTR_ORIGIN = "origin"
+ATTR_DESTINATION = "destination"
+ATTR_DEPARTURE_TIME = "departure_time"
+ATTR_MAX_TRANSFERS = "max_transfers"
+
+WS_TYPE_SUBSCRIBE_DEPARTURES = f"{DOMAIN}/subscribe_departures"
+
+STORAGE_KEY_DEPARTURES = f"{DOMAIN}.departures"
+STORAGE_KEY_SERVICE_HOURS = f"{DOMAIN}.service_hours"
+STORAGE_DIR_TIMETABLE = f"{DOMAIN}.timetable"
+STORAGE_VERSION = 1
+
 CONF_TITLE = "title"
 CONF_STOPS = "stops"
 CONF_STOP_IDS = "stop_ids"
@@ -17,6 +32,20 @@ CONF_UPDATE_INTERVAL_FAST = "update_interval_fast"
 CONF_UPDATE_INTERVAL_NO_DATA = "update_interval_no_data"
 CONF_REALTIME_ONLY = "realtime_only"
 CONF_INCLUDE_CANCELLED = "include_cancelled"
+CONF_SHARD_SIZE = "shard_size"
+CONF_SHARD_CONCURRENCY = "shard_concurrency"
+CONF_STREAM_DECODE = "stream_decode"
+CONF_EXECUTOR_THRESHOLD = "executor_threshold"
+CONF_FIRST_DEPARTURE_GRANULARITY = "first_departure_granularity"
+CONF_ATTRIBUTE_FIELDS = "attribute_fields"
+CONF_ATTRIBUTE_MAX_BYTES = "attribute_max_bytes"
+CONF_GTFS_STATIC_PATH = "gtfs_static_path"
+CONF_TIMETABLE_PREFETCH = "timetable_prefetch"
+CONF_GTFS_REALTIME_FEED = "gtfs_realtime_feed"
+CONF_GTFS_REALTIME_API_KEY = "gtfs_realtime_api_key"
+CONF_SHARED_SESSION = "shared_session"
+CONF_API_URL = "api_url"
+CONF_LEARN_SERVICE_HOURS = "learn_service_hours"
 
 ENTRY_DATA = {
     CONF_TITLE,
@@ -33,6 +62,20 @@ ENTRY_OPTIONS = {
     CONF_UPDATE_INTERVAL_NO_DATA,
     CONF_REALTIME_ONLY,
     CONF_INCLUDE_CANCELLED,
+    CONF_SHARD_SIZE,
+    CONF_SHARD_CONCURRENCY,
+    CONF_STREAM_DECODE,
+    CONF_EXECUTOR_THRESHOLD,
+    CONF_FIRST_DEPARTURE_GRANULARITY,
+    CONF_ATTRIBUTE_FIELDS,
+    CONF_ATTRIBUTE_MAX_BYTES,
+    CONF_GTFS_STATIC_PATH,
+    CONF_TIMETABLE_PREFETCH,
+    CONF_GTFS_REALTIME_FEED,
+    CONF_GTFS_REALTIME_API_KEY,
+    CONF_SHARED_SESSION,
+    CONF_API_URL,
+    CONF_LEARN_SERVICE_HOURS,
 }
 
 DEFAULTS = {
@@ -43,8 +86,46 @@ DEFAULTS = {
     CONF_LIMIT_DEPARTURES: 10,
     CONF_REALTIME_ONLY: False,
     CONF_INCLUDE_CANCELLED: False,
+    CONF_SHARD_SIZE: 0,
+    CONF_SHARD_CONCURRENCY: 4,
+    CONF_STREAM_DECODE: True,
+    CONF_EXECUTOR_THRESHOLD: 256,
+    CONF_FIRST_DEPARTURE_GRANULARITY: timedelta(minutes=1),
+    CONF_ATTRIBUTE_FIELDS: [],
+    CONF_ATTRIBUTE_MAX_BYTES: 0,
+    CONF_TIMETABLE_PREFETCH: False,
+    CONF_SHARED_SESSION: False,
+    CONF_LEARN_SERVICE_HOURS: False,
 }
 DEFAULT_TITLE = "TFI Journey Planner"
 DEFAULT_SENSOR_ICON = "mdi:transit-connection-variant"
 DEFAULT_DEPARTURE_HORIZON = timedelta(hours=1)
 DEFAULT_UPDATE_NO_DATA_THRESHOLD = 3
+DEFAULT_WAKEUP_EXPIRY_DELAY = timedelta(seconds=1)
+DEFAULT_WAKEUP_MIN_INTERVAL = timedelta(seconds=1)
+DEFAULT_STREAM_CHUNK_SIZE = 16384
+DEFAULT_HUB_BATCH_DELAY = timedelta(seconds=1)
+DEFAULT_HUB_CACHE_TTL = timedelta(seconds=30)
+DEFAULT_ATTRIBUTE_CACHE_SIZE = 256
+DEFAULT_CACHE_SAVE_INTERVAL = timedelta(minutes=5)
+DEFAULT_GTFS_REALTIME_MIN_INTERVAL = timedelta(seconds=30)
+DEFAULT_GTFS_REALTIME_MAX_DELAY = timedelta(minutes=30)
+DEFAULT_CIRCUIT_FAILURE_THRESHOLD = 3
+DEFAULT_CIRCUIT_BACKOFF_INITIAL = timedelta(seconds=30)
+DEFAULT_CIRCUIT_BACKOFF_MAX = timedelta(minutes=15)
+DEFAULT_CIRCUIT_BACKOFF_JITTER = 0.2
+DEFAULT_SERVICE_HOURS_LEARNING_PERIOD = timedelta(days=7)
+DEFAULT_SERVICE_HOURS_SAVE_DELAY = timedelta(minutes=5)
+DEFAULT_SERVICE_HOURS_LEAD = timedelta(minutes=15)
+DEFAULT_JOURNEY_MAX_TRANSFERS = 3
+DEFAULT_JOURNEY_MAX_DURATION = timedelta(hours=3)
+DEFAULT_JOURNEY_TRANSFER_SLACK = timedelta(minutes=1)
+DEFAULT_JOURNEY_MAX_WALK_DISTANCE = 400
+DEFAULT_JOURNEY_WALK_SPEED = 1.2
+## Histogram buckets from 0.1 ms to 50 s in 1-2-5 steps
+DEFAULT_METRICS_BUCKETS_MS = tuple(
+    base * 10**exp for exp in range(-1, 5) for base in (1, 2, 5)
+)
+DEFAULT_METRICS_RATE_WINDOW = timedelta(minutes=1)
+DEFAULT_LOOP_BLOCK_BUDGET_MS = 50
+DEFAULT_WS_REFRESH_INTERVAL = timedelta(seconds=30)
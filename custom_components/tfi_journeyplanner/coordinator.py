@@ -2,13 +2,22 @@
 
 from datetime import datetime, timedelta
 import logging
+import time
 
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
 
-from .const import DEFAULT_UPDATE_NO_DATA_THRESHOLD
-from .util import timedelta_to_str
-from .tfi_journeyplanner_api import TFIData
+from .const import (
+    DEFAULT_DEPARTURE_HORIZON,
+    DEFAULT_SERVICE_HOURS_LEAD,
+    DEFAULT_WAKEUP_EXPIRY_DELAY,
+    DEFAULT_WAKEUP_MIN_INTERVAL,
+)
+from .departures import Departure
+from .util import timedelta_to_str, timestamp_to_datetime
+from .hub import TFIHub
+from .metrics import EntryMetrics, elapsed_ms
+from .scheduler import StopScheduler
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -19,11 +28,14 @@ class TFIJourneyPlannerCoordinator(DataUpdateCoordinator):
     def __init__(
         self,
         hass: HomeAssistant,
-        tfi_data: TFIData,
+        hub: TFIHub,
         update_interval: timedelta,
         update_interval_fast: timedelta,
         update_interval_no_data: timedelta,
         update_horizon_fast: timedelta,
+        timetable_prefetch: bool = False,
+        departure_horizon: timedelta = DEFAULT_DEPARTURE_HORIZON,
+        learn_service_hours: bool = False,
     ) -> None:
         """Initialise TFI Journey Planner coordinator."""
         super().__init__(
@@ -34,83 +46,200 @@ class TFIJourneyPlannerCoordinator(DataUpdateCoordinator):
             ## short initial refresh after all platforms have completed setup
             ## TODO: remove interval as coordinator is now refreshed in async_setup_entry
             update_interval=timedelta(seconds=3),
+            ## only notify listeners when cached departures have changed
+            always_update=False,
+        )
+        self._hub = hub
+        self.timetable_prefetch = timetable_prefetch
+        self.departure_horizon = departure_horizon
+        self.learn_service_hours = learn_service_hours
+        self.scheduler = StopScheduler(
+            update_interval,
+            update_interval_fast,
+            update_interval_no_data,
+            update_horizon_fast,
         )
-        self._tfi_data = tfi_data
-        self.update_interval_default = update_interval
-        self.update_interval_fast = update_interval_fast
-        self.update_interval_no_data = update_interval_no_data
-        self.update_horizon_fast = update_horizon_fast
         self._next_update: datetime = None
-        self._update_no_data = 0
         self.polling_enabled = True
         self.is_polling = True
+        self.metrics = EntryMetrics()
+
+    async def _async_update_data(self) -> tuple[tuple[int, ...], int | None] | None:
+        """Fetch data from TFI Journey Planner API, recording the update time."""
+        start = time.perf_counter()
+        try:
+            return await self._async_update_stops()
+        finally:
+            self.metrics.update_time.record(elapsed_ms(start))
 
-    async def _async_update_data(self) -> None:
-        """Fetch data from TFI Journey Planner API."""
-        tfi_data: TFIData = self._tfi_data
+    async def _async_update_stops(self) -> tuple[tuple[int, ...], int | None] | None:
+        """Update departures of stops due for update.
+
+        Returns the cache versions of the stops and the next departure time,
+        which only change when sensors need to be refreshed.
+        """
+        hub: TFIHub = self._hub
 
         stop_ids = [stop for stops in self.async_contexts() for stop in stops]
         if not stop_ids:
             _LOGGER.debug("no stops registered, skipping update")
             return
 
+        scheduler = self.scheduler
+        scheduler.set_stops(stop_ids)
+
         if self.is_polling and not self.polling_enabled:  ## polling enabled
             _LOGGER.debug("re-enabling coordinator polling")
             self.polling_enabled = True
-            self._next_update = None
+            scheduler.paused = False
+            scheduler.reset()
         elif not self.is_polling and self.polling_enabled:  ## polling disabled
             _LOGGER.debug("disabling coordinator polling")
             self.polling_enabled = False
+            ## Stops are not added to other entries' requests either
+            scheduler.paused = True
             self.update_interval = None
 
         ## Continue refreshing sensors when polling is off
         if not self.is_polling:
-            self._tfi_data.filter_cached_departures()
-            self.update_interval = timedelta(seconds=30)
-            return
+            hub.tfi_data.filter_cached_departures(stop_ids)
+            return self._finish_update(stop_ids, datetime.now().astimezone(), None)
 
         now = datetime.now().astimezone()
-        next_update = self._next_update
-        if next_update is None:
+        if self._next_update is None:
             _LOGGER.debug("performing initial update")
-            next_update = now
-        if next_update > now + timedelta(seconds=15):
+        due_stop_ids = scheduler.due_stops(now + timedelta(seconds=15))
+        if self.learn_service_hours and due_stop_ids:
+            due_stop_ids = self._defer_out_of_service_stops(due_stop_ids, now)
+        if not due_stop_ids:
             _LOGGER.debug(
                 "skipping update, next update in %s",
-                timedelta_to_str(next_update - now),
+                timedelta_to_str(scheduler.next_update - now),
             )
-            return
+            return self._finish_update(stop_ids, now, scheduler.next_update)
 
-        departures = await tfi_data.update_departures(stop_ids)
-        first_departure = None
-        departure_horizon = None
-        update_interval = self.update_interval_default
-        if len(departures) == 0:
-            self._update_no_data += 1
-            if self._update_no_data > DEFAULT_UPDATE_NO_DATA_THRESHOLD:
-                update_interval = self.update_interval_no_data
+        live_stop_ids = due_stop_ids
+        departures = []
+        if self.timetable_prefetch:
+            live_stop_ids, departures = await self._async_update_timetable_stops(
+                due_stop_ids, now
+            )
+        if live_stop_ids:
+            request_start = time.perf_counter()
+            departures.extend(await hub.update_departures(live_stop_ids))
+            self.metrics.request_latency.record(elapsed_ms(request_start))
+            departures.sort(key=lambda dep: dep.departure)
+        circuit_breaker = hub.tfi_data.circuit_breaker
+        if circuit_breaker.is_closed:
+            intervals = scheduler.update(due_stop_ids, departures, now)
         else:
-            self._update_no_data = 0
-            first_departure: datetime = departures[0].get("departure", now)
-            departure_horizon = first_departure - now
-            update_horizon_fast = self.update_horizon_fast
-            update_interval_default = self.update_interval_default
-            update_interval_fast = self.update_interval_fast
-            if departure_horizon < update_horizon_fast:
-                ## Next departure due within fast update horizon
-                update_interval = update_interval_fast
-            elif departure_horizon < update_horizon_fast + update_interval_default:
-                ## Next departure will fall within fast update horizon before next update
-                update_interval = max(
-                    departure_horizon - update_horizon_fast, update_interval_fast
-                )
-
-        self._next_update = now + update_interval
-        self.update_interval = timedelta(seconds=30)
+            ## TFI API is failing, wait until the circuit breaker allows a probe
+            retry = now + timedelta(seconds=circuit_breaker.retry_in)
+            _LOGGER.debug(
+                "TFI API circuit %s, deferring update until %s",
+                circuit_breaker.state,
+                retry,
+            )
+            scheduler.defer(due_stop_ids, retry)
+            intervals = {}
+        self._next_update = scheduler.next_update
+        data = self._finish_update(stop_ids, now, self._next_update)
 
         _LOGGER.debug(
-            "retrieved %d departures, first departure in %s, next update in %s",
+            "retrieved %d departures for %d of %d stops, next update in %s",
             len(departures),
-            timedelta_to_str(departure_horizon) if departure_horizon else "(unknown)",
-            timedelta_to_str(update_interval),
+            len(due_stop_ids),
+            len(scheduler.stop_ids),
+            timedelta_to_str(self._next_update - now),
+        )
+        for stop_id, update_interval in intervals.items():
+            _LOGGER.debug(
+                "stop %s next update in %s", stop_id, timedelta_to_str(update_interval)
+            )
+        return data
+
+    def _defer_out_of_service_stops(
+        self, stop_ids: list[str], now: datetime
+    ) -> list[str]:
+        """Defer stops that cannot have a departure within the departure horizon.
+
+        Stops are deferred until shortly before the departure horizon reaches
+        the next service at the stop according to the learned service hours.
+        Returns the stops that still need polling.
+        """
+        if (service_hours := self._hub.service_hours) is None:
+            return stop_ids
+        lead = self.departure_horizon + DEFAULT_SERVICE_HOURS_LEAD
+        due_stop_ids = []
+        for stop_id in stop_ids:
+            next_service = service_hours.profile.next_service(stop_id, now)
+            if next_service is None or next_service - lead <= now:
+                due_stop_ids.append(stop_id)
+                continue
+            _LOGGER.debug(
+                "stop %s has no service until %s, resuming polling at %s",
+                stop_id,
+                next_service,
+                next_service - lead,
+            )
+            self.scheduler.defer([stop_id], next_service - lead)
+        return due_stop_ids
+
+    async def _async_update_timetable_stops(
+        self, stop_ids: list[str], now: datetime
+    ) -> tuple[list[str], list[Departure]]:
+        """Update stops with no departure due soon from the GTFS timetable.
+
+        Real-time departure times only matter for departures within the fast
+        update horizon, so other stops are updated from the timetable without
+        polling. Returns the stops that still need polling and the timetable
+        departures.
+        """
+        tfi_data = self._hub.tfi_data
+        scheduled = await tfi_data.get_timetable_departures(
+            stop_ids,
+            now.timestamp(),
+            (now + self.scheduler.update_horizon_fast).timestamp(),
         )
+        if scheduled is None:
+            return stop_ids, []
+
+        due_soon = {dep.stop_ref for dep in scheduled}
+        timetable_stop_ids = [s for s in stop_ids if s not in due_soon]
+        departures = []
+        if timetable_stop_ids:
+            _LOGGER.debug("updating stops %s from timetable", timetable_stop_ids)
+            departures = (
+                await tfi_data.update_timetable_departures(timetable_stop_ids) or []
+            )
+        return [s for s in stop_ids if s in due_soon], departures
+
+    def _finish_update(
+        self, stop_ids: list[str], now: datetime, next_update: datetime | None
+    ) -> tuple[tuple[int, ...], int | None]:
+        """Schedule next wakeup and return coordinator data.
+
+        The next wakeup is at the next update or next departure expiry, so
+        that sensors remove an expired departure without waiting for the next
+        update. The returned data changes on departure expiry too.
+        """
+        tfi_data = self._hub.tfi_data
+        wakeup = next_update
+        next_departure = None
+        for dep in tfi_data.get_cached_departures(stop_ids):
+            if dep.departure >= now.timestamp():
+                next_departure = dep.departure
+                expiry = (
+                    timestamp_to_datetime(dep.departure) + DEFAULT_WAKEUP_EXPIRY_DELAY
+                )
+                if wakeup is None or expiry < wakeup:
+                    wakeup = expiry
+                break
+
+        if wakeup is None:
+            _LOGGER.debug("no update or departure expiry scheduled")
+            self.update_interval = None
+        else:
+            self.update_interval = max(wakeup - now, DEFAULT_WAKEUP_MIN_INTERVAL)
+            _LOGGER.debug("next wakeup in %s", timedelta_to_str(self.update_interval))
+        return (tfi_data.get_stop_versions(stop_ids), next_departure)
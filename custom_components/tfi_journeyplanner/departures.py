@@ -0,0 +1,373 @@
+"""TFI Journey Planner departure store."""
+
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+from collections.abc import Callable, Iterable, Iterator
+from datetime import timedelta
+import heapq
+import sys
+from typing import Any, NamedTuple
+
+from .const import DEFAULT_DEPARTURE_HORIZON
+from .util import iso_to_timestamp, timestamp_to_datetime
+
+
+class Departure:
+    """Departure record holding only the fields used by the integration.
+
+    Times are stored as epoch seconds, and are only converted to datetime
+    objects when the departure is rendered with as_dict().
+    """
+
+    __slots__ = (
+        "stop_ref",
+        "service",
+        "direction",
+        "destination",
+        "scheduled",
+        "realtime",
+        "departure",
+        "cancelled",
+    )
+
+    def __init__(
+        self,
+        stop_ref: str,
+        service: str,
+        direction: str,
+        destination: str | None,
+        scheduled: int | None,
+        realtime: int | None,
+        cancelled: bool = False,
+    ) -> None:
+        """Initialise departure."""
+        self.stop_ref = stop_ref
+        self.service = service
+        self.direction = direction
+        self.destination = destination
+        self.scheduled = scheduled
+        self.realtime = realtime
+        self.departure = realtime if realtime is not None else scheduled
+        self.cancelled = cancelled
+
+    @classmethod
+    def from_json(cls, dep: dict[str, Any]) -> Departure:
+        """Create departure from TFI API departure."""
+        dep_rt_str = dep.get("realTimeDeparture")
+        dep_sch_str = dep.get("scheduledDeparture")
+        dep_rt = iso_to_timestamp(dep_rt_str) if dep_rt_str else None
+        dep_sch = iso_to_timestamp(dep_sch_str) if dep_sch_str else None
+        destination = dep.get("destination")
+        return cls(
+            sys.intern(dep["stopRef"]),
+            sys.intern(dep.get("serviceNumber") or "unknown"),
+            sys.intern(dep["serviceDirection"]),
+            sys.intern(destination) if destination else None,
+            dep_sch,
+            dep_rt,
+            bool(dep.get("cancelled", False)),
+        )
+
+    @classmethod
+    def from_row(cls, row: list[Any]) -> Departure:
+        """Create departure from a row created by as_row()."""
+        stop_ref, service, direction, destination, scheduled, realtime, cancelled = row
+        return cls(
+            sys.intern(stop_ref),
+            sys.intern(service),
+            sys.intern(direction),
+            sys.intern(destination) if destination else None,
+            scheduled,
+            realtime,
+            cancelled,
+        )
+
+    def as_row(self) -> list[Any]:
+        """Return departure as a compact row for persistent storage."""
+        return [
+            self.stop_ref,
+            self.service,
+            self.direction,
+            self.destination,
+            self.scheduled,
+            self.realtime,
+            self.cancelled,
+        ]
+
+    def __repr__(self) -> str:
+        return (
+            f"Departure({self.stop_ref} {self.service} {self.direction} "
+            f"departure={self.departure} realtime={self.realtime is not None})"
+        )
+
+    def as_dict(self, fields: Iterable[str] | None = None) -> dict[str, Any]:
+        """Return departure as dict for state attributes.
+
+        If fields is given, only those attributes are included.
+        """
+        if fields is None:
+            fields = DEPARTURE_ATTRIBUTES
+        return {field: DEPARTURE_ATTRIBUTES[field](self) for field in fields}
+
+    def expire_realtime(self) -> None:
+        """Replace scheduled departure time with realtime departure time."""
+        if self.realtime is not None:
+            self.scheduled = self.realtime
+            self.realtime = None
+
+
+## Departure state attributes, named as in the upstream response
+DEPARTURE_ATTRIBUTES: dict[str, Callable[[Departure], Any]] = {
+    "stopRef": lambda dep: dep.stop_ref,
+    "serviceNumber": lambda dep: dep.service,
+    "serviceDirection": lambda dep: dep.direction,
+    "destination": lambda dep: dep.destination,
+    "scheduledDeparture": lambda dep: timestamp_to_datetime(dep.scheduled),
+    "realTimeDeparture": lambda dep: timestamp_to_datetime(dep.realtime),
+    "departure": lambda dep: timestamp_to_datetime(dep.departure),
+    "cancelled": lambda dep: dep.cancelled,
+}
+
+
+class DepartureFilter(NamedTuple):
+    """Immutable departure filter compiled from sensor options.
+
+    Filters are hashable, so sensors with identical filters can share the
+    filtered departures.
+    """
+
+    stop_ids: frozenset[str]
+    service_ids: frozenset[str] | None
+    direction: frozenset[str] | None
+    limit_departures: int | None
+    horizon: float
+    realtime_only: bool
+    include_cancelled: bool
+
+    @classmethod
+    def create(
+        cls,
+        stop_ids: Iterable[str],
+        service_ids: Iterable[str] | None = None,
+        direction: Iterable[str] | None = None,
+        limit_departures: int | None = None,
+        departure_horizon: timedelta = DEFAULT_DEPARTURE_HORIZON,
+        realtime_only: bool = False,
+        include_cancelled: bool = False,
+    ) -> DepartureFilter:
+        """Compile departure filter from options, empty filters match all."""
+        return cls(
+            frozenset(stop_ids),
+            frozenset(service_ids) if service_ids else None,
+            frozenset(direction) if direction else None,
+            limit_departures or None,
+            departure_horizon.total_seconds(),
+            bool(realtime_only),
+            bool(include_cancelled),
+        )
+
+
+def _departure_key(dep: Departure) -> int:
+    return dep.departure
+
+
+class DepartureIndex:
+    """Departures sorted by departure time."""
+
+    __slots__ = ("times", "departures")
+
+    def __init__(self, departures: list[Departure]) -> None:
+        """Initialise index from departures sorted by departure time."""
+        self.departures = departures
+        self.times = [dep.departure for dep in departures]
+
+    def window(self, start: float, end: float) -> list[Departure]:
+        """Return departures with start <= departure time <= end."""
+        times = self.times
+        return self.departures[bisect_left(times, start) : bisect_right(times, end)]
+
+
+class DepartureStore:
+    """Cached departures indexed by stop, stop and service, stop and direction.
+
+    Every index is sorted by departure time so that filter queries are a
+    bisect on the time window followed by a merge across the selected indexes.
+    """
+
+    def __init__(self) -> None:
+        """Initialise empty departure store."""
+        self._departures: list[Departure] = []
+        self._by_stop: dict[str, DepartureIndex] = {}
+        self._by_stop_service: dict[tuple[str, str], DepartureIndex] = {}
+        self._by_stop_direction: dict[tuple[str, str], DepartureIndex] = {}
+
+    def __len__(self) -> int:
+        return len(self._departures)
+
+    def __iter__(self) -> Iterator[Departure]:
+        return iter(self._departures)
+
+    @property
+    def departures(self) -> list[Departure]:
+        """Return all departures sorted by departure time."""
+        return self._departures
+
+    @property
+    def stop_ids(self) -> set[str]:
+        """Return stop IDs with cached departures."""
+        return set(self._by_stop)
+
+    def for_stops(self, stop_ids: Iterable[str]) -> list[Departure]:
+        """Return all departures for stops sorted by departure time."""
+        indexes = [
+            index
+            for stop_id in dict.fromkeys(stop_ids)
+            if (index := self._by_stop.get(stop_id)) is not None
+        ]
+        if len(indexes) == 1:
+            return list(indexes[0].departures)
+        return list(
+            heapq.merge(*(index.departures for index in indexes), key=_departure_key)
+        )
+
+    def copy(self) -> DepartureStore:
+        """Return a copy of the store sharing its immutable indexes.
+
+        Replacing departures in the copy does not change this store, so the
+        copy can be rebuilt in another thread while this store is in use.
+        """
+        store = DepartureStore()
+        store._departures = self._departures
+        store._by_stop = dict(self._by_stop)
+        store._by_stop_service = dict(self._by_stop_service)
+        store._by_stop_direction = dict(self._by_stop_direction)
+        return store
+
+    def clear(self) -> None:
+        """Remove all departures."""
+        self.replace([])
+
+    def replace(
+        self,
+        departures: Iterable[Departure],
+        stop_ids: Iterable[str] | None = None,
+    ) -> None:
+        """Replace cached departures.
+
+        If stop_ids is given, only departures and indexes for those stops are
+        rebuilt, and departures for other stops are kept.
+        """
+        by_stop: dict[str, list[Departure]] = {}
+        for dep in departures:
+            by_stop.setdefault(dep.stop_ref, []).append(dep)
+
+        if stop_ids is None:
+            self._by_stop = {}
+            self._by_stop_service = {}
+            self._by_stop_direction = {}
+            stop_ids = by_stop
+        else:
+            stop_ids = set(stop_ids) | set(by_stop)
+            for stop_id in stop_ids:
+                self._drop_stop(stop_id)
+
+        for stop_id in stop_ids:
+            if stop_deps := by_stop.get(stop_id):
+                self._add_stop(stop_id, stop_deps)
+
+        self._departures = list(
+            heapq.merge(
+                *(index.departures for index in self._by_stop.values()),
+                key=_departure_key,
+            )
+        )
+
+    def _drop_stop(self, stop_id: str) -> None:
+        """Remove all indexes for a stop."""
+        if self._by_stop.pop(stop_id, None) is None:
+            return
+        for index in (self._by_stop_service, self._by_stop_direction):
+            for key in [key for key in index if key[0] == stop_id]:
+                del index[key]
+
+    def _add_stop(self, stop_id: str, departures: list[Departure]) -> None:
+        """Build indexes for a stop."""
+        departures.sort(key=_departure_key)
+        by_service: dict[str, list[Departure]] = {}
+        by_direction: dict[str, list[Departure]] = {}
+        for dep in departures:
+            by_service.setdefault(dep.service, []).append(dep)
+            by_direction.setdefault(dep.direction, []).append(dep)
+
+        self._by_stop[stop_id] = DepartureIndex(departures)
+        for service, deps in by_service.items():
+            self._by_stop_service[(stop_id, service)] = DepartureIndex(deps)
+        for direction, deps in by_direction.items():
+            self._by_stop_direction[(stop_id, direction)] = DepartureIndex(deps)
+
+    def query(
+        self,
+        stop_ids: Iterable[str],
+        start: float,
+        end: float,
+        service_ids: Iterable[str] | None = None,
+        direction: Iterable[str] | None = None,
+        limit_departures: int | None = None,
+        realtime_only: bool = False,
+        include_cancelled: bool = False,
+    ) -> list[Departure]:
+        """Return departures matching filters between start and end epoch times."""
+        service_ids = frozenset(service_ids) if service_ids else None
+        direction = frozenset(direction) if direction else None
+
+        ## Select the most specific index available for each stop
+        sources: list[list[Departure]] = []
+        for stop_id in dict.fromkeys(stop_ids):
+            if service_ids:
+                keys = [(stop_id, service) for service in service_ids]
+                index = self._by_stop_service
+            elif direction:
+                keys = [(stop_id, dep_dir) for dep_dir in direction]
+                index = self._by_stop_direction
+            else:
+                keys = [stop_id]
+                index = self._by_stop
+            for key in keys:
+                if (dep_index := index.get(key)) is not None:
+                    if window := dep_index.window(start, end):
+                        sources.append(window)
+
+        if not sources:
+            return []
+        if len(sources) == 1:
+            candidates = sources[0]
+        else:
+            candidates = heapq.merge(*sources, key=_departure_key)
+
+        ## Direction is only checked when the service index was used
+        check_direction = service_ids is not None and direction is not None
+        departures = []
+        for dep in candidates:
+            if (
+                (not check_direction or dep.direction in direction)
+                and (not realtime_only or dep.realtime is not None)
+                and (include_cancelled or not dep.cancelled)
+            ):
+                departures.append(dep)
+                if limit_departures and len(departures) >= limit_departures:
+                    break
+        return departures
+
+    def evaluate(self, spec: DepartureFilter, now: float) -> list[Departure]:
+        """Return departures matching a compiled filter from now."""
+        return self.query(
+            spec.stop_ids,
+            now,
+            now + spec.horizon,
+            service_ids=spec.service_ids,
+            direction=spec.direction,
+            limit_departures=spec.limit_departures,
+            realtime_only=spec.realtime_only,
+            include_cancelled=spec.include_cancelled,
+        )
@@ -0,0 +1,59 @@
+"""TFI Journey Planner diagnostics."""
+
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import (
+    DOMAIN,
+    CONF_GTFS_REALTIME_API_KEY,
+    CONF_STOPS,
+    CONF_STOP_IDS,
+)
+from .coordinator import TFIJourneyPlannerCoordinator
+from .tfi_journeyplanner_api import TFIData
+
+TO_REDACT = {CONF_GTFS_REALTIME_API_KEY}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics with performance metrics of a config entry."""
+    coordinator: TFIJourneyPlannerCoordinator = hass.data[DOMAIN][entry.entry_id][
+        "coordinator"
+    ]
+    tfi_data: TFIData = hass.data[DOMAIN][entry.entry_id]["tfi_data"]
+    stop_ids = [
+        stop_id for stop in entry.options[CONF_STOPS] for stop_id in stop[CONF_STOP_IDS]
+    ]
+    circuit_breaker = tfi_data.circuit_breaker
+
+    return {
+        "options": async_redact_data(dict(entry.options), TO_REDACT),
+        "polling": {
+            "enabled": coordinator.polling_enabled,
+            "update_interval": (
+                None
+                if coordinator.update_interval is None
+                else coordinator.update_interval.total_seconds()
+            ),
+            "last_update_success": coordinator.last_update_success,
+        },
+        "circuit_breaker": {
+            "state": circuit_breaker.state,
+            "failures": circuit_breaker.failures,
+            "retry_in": circuit_breaker.retry_in,
+        },
+        "cache": {
+            "departures": len(tfi_data.get_cached_departures(stop_ids)),
+            "departures_all_stops": len(tfi_data.get_cached_departures(None)),
+        },
+        "entry_metrics": coordinator.metrics.as_dict(),
+        "api_metrics": tfi_data.metrics.as_dict(stop_ids),
+        "stop_metrics": tfi_data.metrics.for_stops(stop_ids).as_dict(),
+    }
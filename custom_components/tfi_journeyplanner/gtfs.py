@@ -0,0 +1,583 @@
+"""TFI Journey Planner GTFS static timetable."""
+
+from __future__ import annotations
+
+from array import array
+from collections.abc import Iterable, Iterator
+import contextlib
+import csv
+from datetime import date, datetime, time, timedelta
+import hashlib
+import io
+from itertools import groupby
+import logging
+from operator import itemgetter
+import os
+import sqlite3
+import sys
+import threading
+from typing import NamedTuple
+import zipfile
+from zoneinfo import ZoneInfo
+
+from .departures import Departure
+
+_LOGGER = logging.getLogger(__name__)
+
+GTFS_SCHEMA_VERSION = "2"
+GTFS_DIRECTIONS = {"0": "OUTBOUND", "1": "INBOUND"}
+GTFS_NO_PICKUP = "1"
+GTFS_NO_DROP_OFF = "1"
+GTFS_SERVICE_ADDED = "1"
+GTFS_SERVICE_REMOVED = "2"
+GTFS_WEEKDAYS = (
+    "monday",
+    "tuesday",
+    "wednesday",
+    "thursday",
+    "friday",
+    "saturday",
+    "sunday",
+)
+GTFS_MMAP_SIZE = 256 * 1024 * 1024
+GTFS_INSERT_BATCH = 50000
+GTFS_STOP_SEPARATOR = "\x1f"
+
+_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE routes (route_id TEXT PRIMARY KEY, short_name TEXT);
+CREATE TABLE trips (
+    trip_id TEXT PRIMARY KEY,
+    route_id TEXT,
+    service_id TEXT,
+    direction_id TEXT,
+    headsign TEXT
+);
+CREATE TABLE stops (stop_id TEXT PRIMARY KEY, name TEXT, lat REAL, lon REAL);
+CREATE TABLE stop_times (
+    stop_id TEXT,
+    departure_secs INTEGER,
+    trip_id TEXT,
+    stop_sequence INTEGER,
+    arrival_secs INTEGER,
+    pickup INTEGER,
+    drop_off INTEGER
+);
+CREATE TABLE trip_stop_times (
+    trip_id TEXT PRIMARY KEY,
+    stop_ids TEXT,
+    arrivals BLOB,
+    departures BLOB,
+    pickup BLOB,
+    drop_off BLOB,
+    end_secs INTEGER
+);
+CREATE TABLE calendar (
+    service_id TEXT,
+    weekdays TEXT,
+    start_date TEXT,
+    end_date TEXT
+);
+CREATE TABLE calendar_dates (service_id TEXT, date TEXT, exception_type TEXT);
+"""
+_INDEXES = """
+CREATE INDEX stop_times_stop ON stop_times (stop_id, departure_secs);
+CREATE INDEX stop_times_trip ON stop_times (trip_id, stop_sequence);
+CREATE INDEX trips_service ON trips (service_id);
+CREATE INDEX calendar_dates_date ON calendar_dates (date);
+"""
+
+
+class ServiceDayTrip(NamedTuple):
+    """Trip running on a service day, with its stop times in sequence.
+
+    Stop times are in columns, with arrival and departure times in seconds
+    from the start of the service day and pickup and drop off flags.
+    """
+
+    trip_id: str
+    service: str
+    direction: str
+    destination: str | None
+    start: int
+    stop_ids: tuple[str, ...]
+    arrivals: array
+    departures: array
+    pickup: bytes
+    drop_off: bytes
+
+
+class ScheduledStopTime(NamedTuple):
+    """Scheduled departure of a trip from a stop."""
+
+    stop_id: str
+    trip_id: str
+    stop_sequence: int
+    departure: int
+    service: str
+    direction: str
+    destination: str | None
+
+    def as_departure(self) -> Departure:
+        """Return scheduled departure as a departure."""
+        return Departure(
+            self.stop_id,
+            self.service,
+            self.direction,
+            self.destination,
+            self.departure,
+            None,
+        )
+
+
+def _gtfs_time_to_secs(value: str) -> int | None:
+    """Convert GTFS time, which may be past 24:00:00, to seconds."""
+    if not value:
+        return None
+    hours, minutes, seconds = value.strip().split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+def _read_csv(zf: zipfile.ZipFile, name: str) -> Iterator[dict[str, int] | list[str]]:
+    """Yield the column index of a GTFS file, then its rows."""
+    with zf.open(name) as file:
+        reader = csv.reader(io.TextIOWrapper(file, encoding="utf-8-sig"))
+        header = next(reader, [])
+        yield {column.strip(): i for i, column in enumerate(header)}
+        yield from reader
+
+
+def _unpack_times(packed: bytes) -> array:
+    times = array("i")
+    times.frombytes(packed)
+    return times
+
+
+def _batched(rows: Iterable[tuple], size: int) -> Iterator[list[tuple]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def get_timetable_db_path(db_dir: str, zip_path: str) -> str:
+    """Return the path in db_dir of the timetable database for a GTFS zip."""
+    digest = hashlib.blake2b(
+        os.path.abspath(zip_path).encode(), digest_size=8
+    ).hexdigest()
+    return os.path.join(db_dir, f"gtfs_{digest}.db")
+
+
+def remove_timetable_db(db_path: str) -> None:
+    """Remove a timetable database and any partially built database."""
+    for path in (db_path, db_path + ".tmp"):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+
+
+class GTFSStaticTimetable:
+    """Scheduled departures from a GTFS static timetable.
+
+    The timetable zip is loaded once into an SQLite database indexed by stop
+    and departure time, which is rebuilt when the zip changes. The database
+    is created next to the zip unless db_path is given. All methods block
+    and should be run in an executor.
+    """
+
+    def __init__(self, zip_path: str, db_path: str | None = None) -> None:
+        """Initialise GTFS static timetable."""
+        self.zip_path = zip_path
+        self.db_path = db_path or os.path.splitext(zip_path)[0] + ".db"
+        self.timezone: ZoneInfo | None = None
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._services: dict[date, frozenset[str]] = {}
+
+    def load(self) -> None:
+        """Open the timetable database, building it if the zip has changed."""
+        self.close()
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        stat = os.stat(self.zip_path)
+        source = f"{GTFS_SCHEMA_VERSION}:{stat.st_size}:{int(stat.st_mtime)}"
+        conn = self._connect()
+        if self._get_meta(conn, "source") != source:
+            conn.close()
+            self._build(source)
+            conn = self._connect()
+        self.timezone = ZoneInfo(self._get_meta(conn, "timezone") or "Europe/Dublin")
+        self._conn = conn
+        self._services = {}
+
+    def close(self) -> None:
+        """Close the timetable database."""
+        with self._lock:
+            if self._conn:
+                self._conn.close()
+                self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute(f"PRAGMA mmap_size = {GTFS_MMAP_SIZE}")
+        return conn
+
+    @staticmethod
+    def _get_meta(conn: sqlite3.Connection, key: str) -> str | None:
+        try:
+            row = conn.execute(
+                "SELECT value FROM meta WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return row[0] if row else None
+
+    def _build(self, source: str) -> None:
+        """Build the timetable database from the zip."""
+        _LOGGER.info("building GTFS timetable database from %s", self.zip_path)
+        tmp_path = self.db_path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.executescript("PRAGMA journal_mode = OFF; PRAGMA synchronous = OFF;")
+            conn.executescript(_SCHEMA)
+            with zipfile.ZipFile(self.zip_path) as zf:
+                self._load_tables(conn, zf)
+            conn.executescript(_INDEXES)
+            self._pack_trips(conn)
+            conn.execute("INSERT INTO meta VALUES ('source', ?)", (source,))
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp_path, self.db_path)
+
+    def _load_tables(self, conn: sqlite3.Connection, zf: zipfile.ZipFile) -> None:
+        names = set(zf.namelist())
+
+        rows = _read_csv(zf, "agency.txt")
+        col = next(rows)
+        timezone = next((row[col["agency_timezone"]] for row in rows), None)
+        conn.execute("INSERT INTO meta VALUES ('timezone', ?)", (timezone,))
+
+        rows = _read_csv(zf, "routes.txt")
+        col = next(rows)
+        conn.executemany(
+            "INSERT INTO routes VALUES (?, ?)",
+            (
+                (row[col["route_id"]], row[col["route_short_name"]] or "unknown")
+                for row in rows
+            ),
+        )
+
+        rows = _read_csv(zf, "trips.txt")
+        col = next(rows)
+        direction_col = col.get("direction_id")
+        headsign_col = col.get("trip_headsign")
+        conn.executemany(
+            "INSERT INTO trips VALUES (?, ?, ?, ?, ?)",
+            (
+                (
+                    row[col["trip_id"]],
+                    row[col["route_id"]],
+                    row[col["service_id"]],
+                    row[direction_col] if direction_col is not None else "",
+                    row[headsign_col] if headsign_col is not None else None,
+                )
+                for row in rows
+            ),
+        )
+
+        if "stops.txt" in names:
+            rows = _read_csv(zf, "stops.txt")
+            col = next(rows)
+            name_col = col.get("stop_name")
+            lat_col = col.get("stop_lat")
+            lon_col = col.get("stop_lon")
+            conn.executemany(
+                "INSERT OR IGNORE INTO stops VALUES (?, ?, ?, ?)",
+                (
+                    (
+                        row[col["stop_id"]],
+                        row[name_col] if name_col is not None else None,
+                        float(row[lat_col]) if lat_col is not None else None,
+                        float(row[lon_col]) if lon_col is not None else None,
+                    )
+                    for row in rows
+                    if lat_col is None or row[lat_col]
+                ),
+            )
+
+        rows = _read_csv(zf, "stop_times.txt")
+        col = next(rows)
+        stop_col = col["stop_id"]
+        trip_col = col["trip_id"]
+        sequence_col = col["stop_sequence"]
+        departure_col = col["departure_time"]
+        arrival_col = col.get("arrival_time")
+        pickup_col = col.get("pickup_type")
+        drop_off_col = col.get("drop_off_type")
+
+        def stop_times() -> Iterator[tuple]:
+            for row in rows:
+                departure = _gtfs_time_to_secs(row[departure_col])
+                arrival = (
+                    _gtfs_time_to_secs(row[arrival_col])
+                    if arrival_col is not None
+                    else None
+                )
+                if departure is None:
+                    departure = arrival
+                if departure is None:
+                    continue
+                yield (
+                    row[stop_col],
+                    departure,
+                    row[trip_col],
+                    int(row[sequence_col]),
+                    arrival if arrival is not None else departure,
+                    pickup_col is None or row[pickup_col] != GTFS_NO_PICKUP,
+                    drop_off_col is None or row[drop_off_col] != GTFS_NO_DROP_OFF,
+                )
+
+        for batch in _batched(stop_times(), GTFS_INSERT_BATCH):
+            conn.executemany(
+                "INSERT INTO stop_times VALUES (?, ?, ?, ?, ?, ?, ?)", batch
+            )
+
+        if "calendar.txt" in names:
+            rows = _read_csv(zf, "calendar.txt")
+            col = next(rows)
+            conn.executemany(
+                "INSERT INTO calendar VALUES (?, ?, ?, ?)",
+                (
+                    (
+                        row[col["service_id"]],
+                        "".join(row[col[day]] for day in GTFS_WEEKDAYS),
+                        row[col["start_date"]],
+                        row[col["end_date"]],
+                    )
+                    for row in rows
+                ),
+            )
+
+        if "calendar_dates.txt" in names:
+            rows = _read_csv(zf, "calendar_dates.txt")
+            col = next(rows)
+            conn.executemany(
+                "INSERT INTO calendar_dates VALUES (?, ?, ?)",
+                (
+                    (
+                        row[col["service_id"]],
+                        row[col["date"]],
+                        row[col["exception_type"]],
+                    )
+                    for row in rows
+                ),
+            )
+
+    @staticmethod
+    def _pack_trips(conn: sqlite3.Connection) -> None:
+        """Pack the stop times of each trip into a single row.
+
+        Reading the packed rows of the trips of a day is much faster than
+        reading their stop times, which are only indexed by stop.
+        """
+        rows = conn.execute(
+            "SELECT trip_id, stop_id, arrival_secs, departure_secs, pickup, drop_off"
+            " FROM stop_times ORDER BY trip_id, stop_sequence"
+        )
+
+        def packed_trips() -> Iterator[tuple]:
+            for trip_id, trip_rows in groupby(rows, key=itemgetter(0)):
+                _, stop_ids, arrivals, departures, pickup, drop_off = zip(*trip_rows)
+                yield (
+                    trip_id,
+                    GTFS_STOP_SEPARATOR.join(stop_ids),
+                    array("i", arrivals).tobytes(),
+                    array("i", departures).tobytes(),
+                    bytes(pickup),
+                    bytes(drop_off),
+                    max(arrivals),
+                )
+
+        for batch in _batched(packed_trips(), GTFS_INSERT_BATCH):
+            conn.executemany(
+                "INSERT INTO trip_stop_times VALUES (?, ?, ?, ?, ?, ?, ?)", batch
+            )
+
+    def _get_services(self, conn: sqlite3.Connection, day: date) -> frozenset[str]:
+        """Return service IDs running on a service day."""
+        if (services := self._services.get(day)) is not None:
+            return services
+        day_str = day.strftime("%Y%m%d")
+        services = {
+            service_id
+            for service_id, weekdays in conn.execute(
+                "SELECT service_id, weekdays FROM calendar"
+                " WHERE start_date <= ? AND end_date >= ?",
+                (day_str, day_str),
+            )
+            if weekdays[day.weekday()] == "1"
+        }
+        for service_id, exception_type in conn.execute(
+            "SELECT service_id, exception_type FROM calendar_dates WHERE date = ?",
+            (day_str,),
+        ):
+            if exception_type == GTFS_SERVICE_ADDED:
+                services.add(service_id)
+            elif exception_type == GTFS_SERVICE_REMOVED:
+                services.discard(service_id)
+        self._services = {
+            d: s for d, s in self._services.items() if abs((d - day).days) <= 2
+        }
+        self._services[day] = services = frozenset(services)
+        return services
+
+    def _get_day_start(self, day: date) -> int:
+        """Return epoch time of the start of a service day.
+
+        GTFS times are measured from noon minus 12 hours, which differs from
+        midnight on daylight saving changeover days.
+        """
+        noon = datetime.combine(day, time(12), tzinfo=self.timezone)
+        return int(noon.timestamp()) - 12 * 3600
+
+    def scheduled_stop_times(
+        self, stop_ids: Iterable[str], start: float, end: float
+    ) -> list[ScheduledStopTime]:
+        """Return scheduled departures from stops between start and end.
+
+        Departures are sorted by departure time.
+        """
+        stop_ids = list(stop_ids)
+        if not stop_ids or end < start:
+            return []
+        placeholders = ",".join("?" * len(stop_ids))
+        query = (
+            "SELECT st.stop_id, st.trip_id, st.stop_sequence, st.departure_secs,"
+            " r.short_name, t.direction_id, t.headsign, t.service_id"
+            " FROM stop_times st"
+            " JOIN trips t ON t.trip_id = st.trip_id"
+            " JOIN routes r ON r.route_id = t.route_id"
+            f" WHERE st.stop_id IN ({placeholders})"
+            " AND st.departure_secs BETWEEN ? AND ?"
+            " AND st.pickup"
+        )
+        with self._lock:
+            conn = self._conn
+            if conn is None:
+                raise RuntimeError("GTFS timetable not loaded")
+            first_day = datetime.fromtimestamp(start, self.timezone).date()
+            last_day = datetime.fromtimestamp(end, self.timezone).date()
+            ## Trips of the previous service day may run past midnight
+            day = first_day - timedelta(days=1)
+            results = []
+            while day <= last_day:
+                day_start = self._get_day_start(day)
+                services = self._get_services(conn, day)
+                for row in conn.execute(
+                    query,
+                    (*stop_ids, max(int(start) - day_start, 0), int(end) - day_start),
+                ):
+                    stop_id, trip_id, seq, secs, service, direction, headsign, sid = row
+                    if sid not in services:
+                        continue
+                    results.append(
+                        ScheduledStopTime(
+                            sys.intern(stop_id),
+                            trip_id,
+                            seq,
+                            day_start + secs,
+                            sys.intern(service),
+                            GTFS_DIRECTIONS.get(direction, "OUTBOUND"),
+                            sys.intern(headsign) if headsign else None,
+                        )
+                    )
+                day += timedelta(days=1)
+        results.sort(key=lambda stop_time: stop_time.departure)
+        return results
+
+    def departures(
+        self, stop_ids: Iterable[str], start: float, end: float
+    ) -> list[Departure]:
+        """Return scheduled departures from stops between start and end."""
+        return [
+            stop_time.as_departure()
+            for stop_time in self.scheduled_stop_times(stop_ids, start, end)
+        ]
+
+    def stops(self) -> dict[str, tuple[str | None, float | None, float | None]]:
+        """Return the name, latitude and longitude of stops."""
+        with self._lock:
+            conn = self._conn
+            if conn is None:
+                raise RuntimeError("GTFS timetable not loaded")
+            return {
+                stop_id: (name, lat, lon)
+                for stop_id, name, lat, lon in conn.execute(
+                    "SELECT stop_id, name, lat, lon FROM stops"
+                )
+            }
+
+    def service_day_trips(
+        self, day: date, since: int | None = None
+    ) -> Iterator[ServiceDayTrip]:
+        """Yield trips running on a service day with their stop times.
+
+        Stop times include stops without pickup or drop off. If since is
+        given, only trips that arrive at their last stop at or after since
+        are included. The timetable is locked until the iterator is exhausted
+        or closed.
+        """
+        with self._lock:
+            conn = self._conn
+            if conn is None:
+                raise RuntimeError("GTFS timetable not loaded")
+            day_start = self._get_day_start(day)
+            services = self._get_services(conn, day)
+            trips = {
+                trip_id: (
+                    sys.intern(service),
+                    GTFS_DIRECTIONS.get(direction, "OUTBOUND"),
+                    sys.intern(headsign) if headsign else None,
+                )
+                for trip_id, service_id, service, direction, headsign in conn.execute(
+                    "SELECT t.trip_id, t.service_id, r.short_name, t.direction_id,"
+                    " t.headsign FROM trips t JOIN routes r ON r.route_id = t.route_id"
+                )
+                if service_id in services
+            }
+            ## Join through a table of running trips to read their stop times
+            ## in a single indexed pass
+            conn.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS day_trips (trip_id TEXT PRIMARY KEY)"
+            )
+            conn.execute("DELETE FROM day_trips")
+            conn.executemany(
+                "INSERT INTO day_trips VALUES (?)", ((trip_id,) for trip_id in trips)
+            )
+            rows = conn.execute(
+                "SELECT s.trip_id, s.stop_ids, s.arrivals, s.departures, s.pickup,"
+                " s.drop_off FROM day_trips d"
+                " JOIN trip_stop_times s ON s.trip_id = d.trip_id"
+                " WHERE s.end_secs >= ?",
+                (since - day_start if since is not None else 0,),
+            )
+            try:
+                for trip_id, stop_ids, arrivals, departures, pickup, drop_off in rows:
+                    yield ServiceDayTrip(
+                        trip_id,
+                        *trips[trip_id],
+                        day_start,
+                        tuple(map(sys.intern, stop_ids.split(GTFS_STOP_SEPARATOR))),
+                        _unpack_times(arrivals),
+                        _unpack_times(departures),
+                        pickup,
+                        drop_off,
+                    )
+            finally:
+                rows.close()
+                conn.execute("DELETE FROM day_trips")
@@ -0,0 +1,134 @@
+"""TFI Journey Planner GTFS-Realtime trip updates."""
+
+from __future__ import annotations
+
+from collections.abc import Iterable
+from typing import NamedTuple
+
+from .departures import Departure
+from .gtfs import ScheduledStopTime
+
+
+class StopTimeUpdate(NamedTuple):
+    """Real-time update of a trip at a stop."""
+
+    stop_sequence: int | None
+    stop_id: str | None
+    time: int | None
+    delay: int | None
+    skipped: bool
+
+
+class TripUpdate(NamedTuple):
+    """Real-time update of a trip."""
+
+    cancelled: bool
+    delay: int | None
+    stop_time_updates: list[StopTimeUpdate]
+
+
+def parse_trip_updates(data: bytes) -> dict[str, TripUpdate]:
+    """Decode a GTFS-Realtime feed into trip updates keyed by trip ID.
+
+    The protobuf bindings are imported on first use so that they are only
+    required when the GTFS-Realtime backend is configured.
+    """
+    # pylint: disable-next=import-outside-toplevel
+    from google.transit import gtfs_realtime_pb2
+
+    trip_canceled = gtfs_realtime_pb2.TripDescriptor.CANCELED
+    stop_skipped = gtfs_realtime_pb2.TripUpdate.StopTimeUpdate.SKIPPED
+
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(data)
+
+    trip_updates = {}
+    for entity in feed.entity:
+        if entity.is_deleted or not entity.HasField("trip_update"):
+            continue
+        trip_update = entity.trip_update
+        trip = trip_update.trip
+        if not trip.trip_id:
+            continue
+        stop_time_updates = []
+        for stu in trip_update.stop_time_update:
+            if stu.HasField("departure"):
+                event = stu.departure
+            elif stu.HasField("arrival"):
+                event = stu.arrival
+            else:
+                event = None
+            stop_time_updates.append(
+                StopTimeUpdate(
+                    stu.stop_sequence if stu.HasField("stop_sequence") else None,
+                    stu.stop_id or None,
+                    event.time if event and event.HasField("time") else None,
+                    event.delay if event and event.HasField("delay") else None,
+                    stu.schedule_relationship == stop_skipped,
+                )
+            )
+        trip_updates[trip.trip_id] = TripUpdate(
+            trip.schedule_relationship == trip_canceled,
+            trip_update.delay if trip_update.HasField("delay") else None,
+            stop_time_updates,
+        )
+    return trip_updates
+
+
+def _apply_trip_update(
+    stop_time: ScheduledStopTime, trip_update: TripUpdate
+) -> tuple[int | None, bool]:
+    """Return real-time departure and cancellation of a scheduled stop time.
+
+    Delays of earlier stops of the trip are propagated to later stops that
+    have no update of their own.
+    """
+    if trip_update.cancelled:
+        return None, True
+
+    delay = trip_update.delay
+    for update in trip_update.stop_time_updates:
+        if update.stop_sequence is not None:
+            if update.stop_sequence > stop_time.stop_sequence:
+                break
+            matched = update.stop_sequence == stop_time.stop_sequence
+        else:
+            matched = update.stop_id == stop_time.stop_id
+        if matched:
+            if update.skipped:
+                return None, True
+            if update.time:
+                return update.time, False
+            if update.delay is not None:
+                return stop_time.departure + update.delay, False
+        elif update.stop_sequence is not None and update.delay is not None:
+            delay = update.delay
+
+    if delay is None:
+        return None, False
+    return stop_time.departure + delay, False
+
+
+def join_trip_updates(
+    stop_times: Iterable[ScheduledStopTime],
+    trip_updates: dict[str, TripUpdate],
+) -> list[Departure]:
+    """Return departures for scheduled stop times with trip updates applied."""
+    departures = []
+    for stop_time in stop_times:
+        realtime = None
+        cancelled = False
+        if (trip_update := trip_updates.get(stop_time.trip_id)) is not None:
+            realtime, cancelled = _apply_trip_update(stop_time, trip_update)
+        departures.append(
+            Departure(
+                stop_time.stop_id,
+                stop_time.service,
+                stop_time.direction,
+                stop_time.destination,
+                stop_time.departure,
+                realtime,
+                cancelled,
+            )
+        )
+    return departures
@@ -0,0 +1,272 @@
+"""TFI Journey Planner shared fetch hub."""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Callable, Mapping
+from datetime import datetime, timedelta
+from functools import partial
+import logging
+import time
+from typing import TYPE_CHECKING, Any
+
+from .const import (
+    DEFAULTS,
+    DEFAULT_HUB_BATCH_DELAY,
+    DEFAULT_HUB_CACHE_TTL,
+    CONF_STOPS,
+    CONF_STOP_IDS,
+    CONF_UPDATE_INTERVAL_NO_DATA,
+    CONF_SHARD_SIZE,
+    CONF_SHARD_CONCURRENCY,
+    CONF_STREAM_DECODE,
+    CONF_EXECUTOR_THRESHOLD,
+    CONF_SHARED_SESSION,
+    CONF_GTFS_STATIC_PATH,
+    CONF_GTFS_REALTIME_FEED,
+    CONF_GTFS_REALTIME_API_KEY,
+    CONF_API_URL,
+)
+from .attributes import DepartureAttributeCache
+from .departures import Departure
+from .journey import JourneyPlanner
+from .scheduler import StopScheduler
+from .tfi_journeyplanner_api import TFI_DEPARTURES_API, TFIData
+from .util import get_departure_horizon, get_duration_option
+
+if TYPE_CHECKING:
+    from .cache_store import DepartureCacheStore
+    from .service_hours import ServiceHoursStore
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class TFIHub:
+    """Process-wide TFI fetch hub shared by all config entries.
+
+    The hub owns the stop subscriptions of every config entry. Update requests
+    that arrive within the batch delay are merged into a single upstream
+    request, which also includes the stops of other subscribed entries that
+    are due for update within the cache TTL. Stops fetched within the cache
+    TTL are served from the shared cache.
+    """
+
+    def __init__(
+        self,
+        batch_delay: timedelta = DEFAULT_HUB_BATCH_DELAY,
+        cache_ttl: timedelta = DEFAULT_HUB_CACHE_TTL,
+    ) -> None:
+        """Initialise TFI fetch hub."""
+        self.tfi_data = TFIData()
+        self.attribute_cache = DepartureAttributeCache()
+        self.journey_planner = JourneyPlanner(self.tfi_data)
+        self.cache_store: DepartureCacheStore | None = None
+        self.service_hours: ServiceHoursStore | None = None
+        self.batch_delay = batch_delay
+        self.cache_ttl = cache_ttl
+        self._subscriptions: dict[str, set[str]] = {}
+        self._update_callbacks: dict[str, Callable[[], None]] = {}
+        self._schedulers: dict[str, StopScheduler] = {}
+        self._options: dict[str, Mapping[str, Any]] = {}
+        self._stop_updated: dict[str, float] = {}
+        self._pending: set[str] = set()
+        self._batch: asyncio.Task | None = None
+        self._cleanup_callbacks: list[Callable[[], None]] = []
+
+    async def setup(self) -> None:
+        """Set up TFI fetch hub, restoring the persistent departure cache."""
+        if self.cache_store:
+            await self.cache_store.async_load()
+        if self.service_hours:
+            await self.service_hours.async_load()
+        await self.tfi_data.setup()
+
+    def async_on_cleanup(self, func: Callable[[], None]) -> Callable[[], None]:
+        """Add a function called when the hub is cleaned up.
+
+        Returns a function that removes it, which must not be called once
+        the hub has been cleaned up.
+        """
+        self._cleanup_callbacks.append(func)
+        return partial(self._cleanup_callbacks.remove, func)
+
+    async def cleanup(self) -> None:
+        """Clean up TFI fetch hub."""
+        while self._cleanup_callbacks:
+            self._cleanup_callbacks.pop()()
+        if self._batch:
+            self._batch.cancel()
+            self._batch = None
+        self.attribute_cache.clear()
+        self.journey_planner.clear()
+        if self.cache_store:
+            await self.cache_store.async_unload()
+        await self.tfi_data.cleanup()
+
+    @property
+    def subscribers(self) -> set[str]:
+        """Return subscribed entry IDs."""
+        return set(self._subscriptions)
+
+    @property
+    def stop_ids(self) -> set[str]:
+        """Return stop IDs subscribed by all entries."""
+        return {stop_id for stops in self._subscriptions.values() for stop_id in stops}
+
+    def subscribe(
+        self,
+        entry_id: str,
+        options: Mapping[str, Any],
+        update_callback: Callable[[], None] | None = None,
+        scheduler: StopScheduler | None = None,
+    ) -> None:
+        """Subscribe entry to the stops in its options.
+
+        update_callback is called when a shard containing any of the stops
+        has been updated before the full update has completed. If scheduler
+        is given, only stops due for update are added to other entries'
+        requests, otherwise all stops are added.
+        """
+        stop_ids = [
+            stop_id for stop in options[CONF_STOPS] for stop_id in stop[CONF_STOP_IDS]
+        ]
+        _LOGGER.debug("subscribing entry %s to stops %s", entry_id, stop_ids)
+        self._subscriptions[entry_id] = set(stop_ids)
+        self._options[entry_id] = options
+        if update_callback:
+            self._update_callbacks[entry_id] = update_callback
+        if scheduler:
+            self._schedulers[entry_id] = scheduler
+        self._update_fetch_options()
+
+    def unsubscribe(self, entry_id: str) -> None:
+        """Unsubscribe entry from all stops."""
+        _LOGGER.debug("unsubscribing entry %s", entry_id)
+        self._subscriptions.pop(entry_id, None)
+        self._options.pop(entry_id, None)
+        self._update_callbacks.pop(entry_id, None)
+        self._schedulers.pop(entry_id, None)
+        self._update_fetch_options()
+        stop_ids = self.stop_ids
+        for stop_id in [s for s in self._stop_updated if s not in stop_ids]:
+            del self._stop_updated[stop_id]
+
+    def _update_fetch_options(self) -> None:
+        """Apply the most conservative fetch options of all entries."""
+        tfi_data = self.tfi_data
+        all_options = self._options.values()
+
+        tfi_data.shard_size = min(
+            (size for opts in all_options if (size := opts.get(CONF_SHARD_SIZE))),
+            default=DEFAULTS[CONF_SHARD_SIZE],
+        )
+        tfi_data.shard_concurrency = min(
+            (
+                opts.get(CONF_SHARD_CONCURRENCY, DEFAULTS[CONF_SHARD_CONCURRENCY])
+                for opts in all_options
+            ),
+            default=DEFAULTS[CONF_SHARD_CONCURRENCY],
+        )
+        tfi_data.stream_decode = all(
+            opts.get(CONF_STREAM_DECODE, DEFAULTS[CONF_STREAM_DECODE])
+            for opts in all_options
+        )
+        tfi_data.executor_threshold = min(
+            (
+                threshold
+                for opts in all_options
+                if (
+                    threshold := opts.get(
+                        CONF_EXECUTOR_THRESHOLD, DEFAULTS[CONF_EXECUTOR_THRESHOLD]
+                    )
+                )
+            ),
+            default=0,
+        )
+        tfi_data.use_shared_session = all(
+            opts.get(CONF_SHARED_SESSION, DEFAULTS[CONF_SHARED_SESSION])
+            for opts in all_options
+        )
+        ## Only one timetable and real-time feed are used, use the first configured
+        tfi_data.timetable_path = next(
+            (path for opts in all_options if (path := opts.get(CONF_GTFS_STATIC_PATH))),
+            None,
+        )
+        realtime_options = next(
+            (opts for opts in all_options if opts.get(CONF_GTFS_REALTIME_FEED)), {}
+        )
+        tfi_data.realtime_feed = realtime_options.get(CONF_GTFS_REALTIME_FEED)
+        tfi_data.realtime_api_key = realtime_options.get(CONF_GTFS_REALTIME_API_KEY)
+        tfi_data.api_url = next(
+            (url for opts in all_options if (url := opts.get(CONF_API_URL))),
+            TFI_DEPARTURES_API,
+        )
+
+        ## Keep departures that may enter a sensor's departure horizon before
+        ## its stop is next polled at the no data update interval
+        tfi_data.cache_horizon = max(
+            (
+                get_departure_horizon(opts, stop)
+                + get_duration_option(opts, CONF_UPDATE_INTERVAL_NO_DATA)
+                for opts in all_options
+                for stop in opts[CONF_STOPS]
+            ),
+            default=None,
+        )
+
+    def _notify_shard(self, stop_ids: list[str]) -> None:
+        """Notify entries subscribed to stops in an updated shard."""
+        for entry_id, update_callback in self._update_callbacks.items():
+            if self._subscriptions.get(entry_id, set()).intersection(stop_ids):
+                update_callback()
+
+    def _get_due_stops(self) -> set[str]:
+        """Return subscribed stops due for update within the cache TTL."""
+        due_time = datetime.now().astimezone() + self.cache_ttl
+        stop_ids = set()
+        for entry_id, stops in self._subscriptions.items():
+            if (scheduler := self._schedulers.get(entry_id)) is not None:
+                stop_ids.update(scheduler.due_stops(due_time))
+            else:
+                stop_ids.update(stops)
+        return stop_ids
+
+    def _is_fresh(self, stop_id: str, now: float) -> bool:
+        updated = self._stop_updated.get(stop_id)
+        return updated is not None and now - updated < self.cache_ttl.total_seconds()
+
+    async def update_departures(self, stop_ids: list[str]) -> list[Departure]:
+        """Update departures for stops and return departures for those stops."""
+        stops = set(stop_ids)
+        if all(self._is_fresh(stop_id, time.monotonic()) for stop_id in stops):
+            _LOGGER.debug("serving stops %s from shared cache", stop_ids)
+            return self.tfi_data.get_cached_departures(stop_ids)
+
+        self._pending.update(stops)
+        if self._batch is None:
+            self._batch = asyncio.get_running_loop().create_task(self._async_flush())
+        departures = await asyncio.shield(self._batch)
+        return [dep for dep in departures if dep.stop_ref in stops]
+
+    async def _async_flush(self) -> list[Departure]:
+        """Fetch all pending and due subscribed stops in one request."""
+        await asyncio.sleep(self.batch_delay.total_seconds())
+        stop_ids = sorted(self._pending | self._get_due_stops())
+        self._pending = set()
+        self._batch = None
+
+        _LOGGER.debug("fetching departures for %d stops", len(stop_ids))
+        start = time.monotonic()
+        departures = await self.tfi_data.update_departures(
+            stop_ids, shard_callback=self._notify_shard
+        )
+        ## Stops of failed or empty shards are not fresh
+        if fetched := self.tfi_data.get_fetched_stops(stop_ids, start):
+            now = time.monotonic()
+            for stop_id in fetched:
+                self._stop_updated[stop_id] = now
+            if self.cache_store:
+                self.cache_store.async_mark_dirty()
+            if self.service_hours:
+                self.service_hours.async_observe(departures)
+        return departures
@@ -0,0 +1,832 @@
+"""TFI Journey Planner local journey search."""
+
+from __future__ import annotations
+
+from array import array
+import asyncio
+from bisect import bisect_left, insort
+from collections.abc import Iterable
+from datetime import date, datetime, time, timedelta
+from functools import partial
+from itertools import islice
+import logging
+import math
+from typing import Any, NamedTuple
+
+from .const import (
+    DEFAULT_JOURNEY_MAX_DURATION,
+    DEFAULT_JOURNEY_MAX_TRANSFERS,
+    DEFAULT_JOURNEY_MAX_WALK_DISTANCE,
+    DEFAULT_JOURNEY_TRANSFER_SLACK,
+    DEFAULT_JOURNEY_WALK_SPEED,
+)
+from .departures import Departure
+from .gtfs import GTFSStaticTimetable
+from .util import timestamp_to_datetime
+
+_LOGGER = logging.getLogger(__name__)
+
+UNREACHED = 2**31 - 1
+EARTH_RADIUS = 6371000
+WALK_DETOUR_FACTOR = 1.25
+
+_ORIGIN = None
+_WALK = -1
+
+
+class JourneyLeg(NamedTuple):
+    """Leg of a journey, either on a trip or walking between stops."""
+
+    mode: str
+    from_stop: str
+    to_stop: str
+    departure: int
+    arrival: int
+    service: str | None = None
+    destination: str | None = None
+    trip_id: str | None = None
+    realtime: bool = False
+
+    def as_dict(self, stop_names: dict[str, str | None]) -> dict[str, Any]:
+        """Return leg for service responses."""
+        leg = {
+            "mode": self.mode,
+            "from_stop": self.from_stop,
+            "from_stop_name": stop_names.get(self.from_stop),
+            "to_stop": self.to_stop,
+            "to_stop_name": stop_names.get(self.to_stop),
+            "departure": timestamp_to_datetime(self.departure).isoformat(),
+            "arrival": timestamp_to_datetime(self.arrival).isoformat(),
+        }
+        if self.mode == "transit":
+            leg.update(
+                {
+                    "service": self.service,
+                    "destination": self.destination,
+                    "trip_id": self.trip_id,
+                    "realtime": self.realtime,
+                }
+            )
+        return leg
+
+
+class Journey(NamedTuple):
+    """Journey from an origin stop to a destination stop."""
+
+    departure: int
+    arrival: int
+    transfers: int
+    legs: list[JourneyLeg]
+
+    def as_dict(self, stop_names: dict[str, str | None]) -> dict[str, Any]:
+        """Return journey for service responses."""
+        return {
+            "departure": timestamp_to_datetime(self.departure).isoformat(),
+            "arrival": timestamp_to_datetime(self.arrival).isoformat(),
+            "duration": self.arrival - self.departure,
+            "transfers": self.transfers,
+            "legs": [leg.as_dict(stop_names) for leg in self.legs],
+        }
+
+
+class RealtimePatches:
+    """Real-time delays and cancellations of trips in a transit index.
+
+    Delays apply from the stop at which they were observed to the end of the
+    trip, and are expanded to every stop of the trip. Patches are kept apart
+    from the index so that the index can be shared between searches.
+    """
+
+    def __init__(self) -> None:
+        """Initialise empty real-time patches."""
+        self.delays: dict[int, list[int]] = {}
+        self.cancelled: set[int] = set()
+        self.routes: dict[int, list[int]] = {}
+        self.route_delays: dict[int, tuple[int, int]] = {}
+        self._observed: dict[int, list[tuple[int, int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.delays) + len(self.cancelled)
+
+    def add(
+        self,
+        route: int,
+        trip: int,
+        global_trip: int,
+        pos: int,
+        stride: int,
+        dep: Departure,
+    ) -> None:
+        """Patch trip with a real-time departure observed at position pos."""
+        if global_trip in self.cancelled:
+            return
+        if dep.cancelled:
+            self.cancelled.add(global_trip)
+            if self.delays.pop(global_trip, None) is not None:
+                self.routes[route].remove(trip)
+            return
+        if global_trip not in self.delays:
+            insort(self.routes.setdefault(route, []), trip)
+        delay = dep.realtime - dep.scheduled
+        observed = self._observed.setdefault(global_trip, [])
+        observed.append((pos, delay))
+        observed.sort()
+        delays = [0] * stride
+        for from_pos, from_delay in observed:
+            delays[from_pos:] = [from_delay] * (stride - from_pos)
+        self.delays[global_trip] = delays
+        ## Delay bounds of a route limit the trips checked when boarding
+        min_delay, max_delay = self.route_delays.get(route, (0, 0))
+        self.route_delays[route] = (min(min_delay, delay), max(max_delay, delay))
+
+    def delay(self, global_trip: int, pos: int) -> int | None:
+        """Return delay of trip at position pos, or None if cancelled."""
+        if global_trip in self.cancelled:
+            return None
+        if (delays := self.delays.get(global_trip)) is None:
+            return 0
+        return delays[pos]
+
+
+class TransitIndex:
+    """Compact stop, route and trip index of a service day.
+
+    Trips with the same stops are grouped into routes, which are split so
+    that trips of a route never overtake each other. Times are stored in
+    arrays of seconds from the start of the day, trip by trip for each
+    route, and footpaths connect stops within walking distance. The index
+    is immutable once built and can be searched from several threads.
+    """
+
+    def __init__(self, day: date, base: int) -> None:
+        """Initialise empty transit index."""
+        self.day = day
+        self.base = base
+        self.stop_ids: list[str] = []
+        self.stop_index: dict[str, int] = {}
+        self.stop_names: dict[str, str | None] = {}
+        self.route_stop_start = array("i", [0])
+        self.route_stops = array("i")
+        self.route_pickup = bytearray()
+        self.route_drop_off = bytearray()
+        self.route_trip_start = array("i", [0])
+        self.route_time_start = array("i", [0])
+        self.arrivals = array("i")
+        self.departures = array("i")
+        self.trip_ids: list[str] = []
+        self.trip_services: list[str] = []
+        self.trip_destinations: list[str | None] = []
+        self.stop_route_start = array("i", [0])
+        self.stop_routes = array("i")
+        self.stop_route_pos = array("i")
+        self.foot_start = array("i", [0])
+        self.foot_stops = array("i")
+        self.foot_secs = array("i")
+
+    @property
+    def route_count(self) -> int:
+        """Return number of routes."""
+        return len(self.route_trip_start) - 1
+
+    @property
+    def size(self) -> int:
+        """Return approximate size of the index arrays in bytes."""
+        return (
+            sum(
+                len(arr) * arr.itemsize
+                for arr in (
+                    self.route_stop_start,
+                    self.route_stops,
+                    self.route_trip_start,
+                    self.route_time_start,
+                    self.arrivals,
+                    self.departures,
+                    self.stop_route_start,
+                    self.stop_routes,
+                    self.stop_route_pos,
+                    self.foot_start,
+                    self.foot_stops,
+                    self.foot_secs,
+                )
+            )
+            + len(self.route_pickup)
+            + len(self.route_drop_off)
+        )
+
+    @classmethod
+    def build(
+        cls,
+        timetable: GTFSStaticTimetable,
+        day: date,
+        max_walk_distance: float = DEFAULT_JOURNEY_MAX_WALK_DISTANCE,
+        walk_speed: float = DEFAULT_JOURNEY_WALK_SPEED,
+        max_duration: timedelta = DEFAULT_JOURNEY_MAX_DURATION,
+    ) -> TransitIndex:
+        """Build index of trips running on a day from a GTFS timetable.
+
+        Trips of the previous service day that run past midnight are
+        included, as are trips of the next service day that depart within
+        max_duration of its start, so that journeys searched late in the
+        day can continue after midnight. Blocks, so should be run in an
+        executor.
+        """
+        base = int(datetime.combine(day, time(), timetable.timezone).timestamp())
+        next_day = day + timedelta(days=1)
+        until = int(
+            datetime.combine(next_day, time(), timetable.timezone).timestamp()
+            + max_duration.total_seconds()
+        )
+        index = cls(day, base)
+
+        ## Group trips by their stops and pickup and drop off flags
+        patterns: dict[tuple, list[tuple]] = {}
+        for service_day, since in (
+            (day - timedelta(days=1), base),
+            (day, None),
+            (next_day, None),
+        ):
+            for trip in timetable.service_day_trips(service_day, since):
+                if len(trip.stop_ids) < 2:
+                    continue
+                if service_day == next_day and trip.start + trip.departures[0] > until:
+                    continue
+                to_index_time = (trip.start - base).__add__
+                patterns.setdefault(
+                    (trip.stop_ids, trip.pickup, trip.drop_off), []
+                ).append(
+                    (
+                        array("i", map(to_index_time, trip.arrivals)),
+                        array("i", map(to_index_time, trip.departures)),
+                        trip.trip_id,
+                        trip.service,
+                        trip.destination,
+                    )
+                )
+
+        stop_index = index.stop_index
+        stop_routes: list[list[tuple[int, int]]] = []
+        while patterns:
+            (stop_ids, pickup, drop_off), trips = patterns.popitem()
+            stops = []
+            for stop_id in stop_ids:
+                if (stop := stop_index.get(stop_id)) is None:
+                    stop = stop_index[stop_id] = len(index.stop_ids)
+                    index.stop_ids.append(stop_id)
+                    stop_routes.append([])
+                stops.append(stop)
+            for route_trips in _split_overtaking(trips):
+                index._add_route(stops, pickup, drop_off, route_trips, stop_routes)
+
+        for routes in stop_routes:
+            for route, pos in routes:
+                index.stop_routes.append(route)
+                index.stop_route_pos.append(pos)
+            index.stop_route_start.append(len(index.stop_routes))
+
+        stops = timetable.stops()
+        index.stop_names = {
+            stop_id: stops[stop_id][0] for stop_id in index.stop_ids if stop_id in stops
+        }
+        index._add_footpaths(stops, max_walk_distance, walk_speed)
+        return index
+
+    def _add_route(
+        self,
+        stops: list[int],
+        pickup: tuple[int, ...],
+        drop_off: tuple[int, ...],
+        trips: list[tuple],
+        stop_routes: list[list[tuple[int, int]]],
+    ) -> None:
+        route = self.route_count
+        for pos, stop in enumerate(stops):
+            stop_routes[stop].append((route, pos))
+        self.route_stops.extend(stops)
+        self.route_pickup.extend(pickup)
+        self.route_drop_off.extend(drop_off)
+        self.route_stop_start.append(len(self.route_stops))
+        for arrivals, departures, trip_id, service, destination in trips:
+            self.arrivals.extend(arrivals)
+            self.departures.extend(departures)
+            self.trip_ids.append(trip_id)
+            self.trip_services.append(service)
+            self.trip_destinations.append(destination)
+        self.route_trip_start.append(len(self.trip_ids))
+        self.route_time_start.append(len(self.departures))
+
+    def _add_footpaths(
+        self,
+        stops: dict[str, tuple[str | None, float | None, float | None]],
+        max_walk_distance: float,
+        walk_speed: float,
+    ) -> None:
+        """Connect stops within walking distance of each other.
+
+        Stops are hashed into a grid of cells of the walking distance, so
+        only stops in neighbouring cells need to be compared.
+        """
+        locations = {}
+        for stop, stop_id in enumerate(self.stop_ids):
+            if (location := stops.get(stop_id)) and location[1] is not None:
+                locations[stop] = (math.radians(location[1]), math.radians(location[2]))
+        if not locations or max_walk_distance <= 0:
+            self.foot_start.extend([0] * len(self.stop_ids))
+            return
+
+        mean_lat = sum(lat for lat, _ in locations.values()) / len(locations)
+        cos_lat = math.cos(mean_lat)
+        cell = max_walk_distance / EARTH_RADIUS
+        grid: dict[tuple[int, int], list[int]] = {}
+        for stop, (lat, lon) in locations.items():
+            grid.setdefault((int(lat // cell), int(lon * cos_lat // cell)), []).append(
+                stop
+            )
+
+        for stop in range(len(self.stop_ids)):
+            if (location := locations.get(stop)) is not None:
+                lat, lon = location
+                cell_lat, cell_lon = int(lat // cell), int(lon * cos_lat // cell)
+                for other in (
+                    other
+                    for d_lat in (-1, 0, 1)
+                    for d_lon in (-1, 0, 1)
+                    for other in grid.get((cell_lat + d_lat, cell_lon + d_lon), ())
+                ):
+                    if other == stop:
+                        continue
+                    other_lat, other_lon = locations[other]
+                    distance = EARTH_RADIUS * math.hypot(
+                        other_lat - lat, (other_lon - lon) * cos_lat
+                    )
+                    if distance <= max_walk_distance:
+                        self.foot_stops.append(other)
+                        self.foot_secs.append(
+                            math.ceil(distance * WALK_DETOUR_FACTOR / walk_speed)
+                        )
+            self.foot_start.append(len(self.foot_stops))
+
+    def patch(self, departures: Iterable[Departure]) -> RealtimePatches:
+        """Return patches of trips with real-time or cancelled departures.
+
+        Departures are matched to trips by stop, service and scheduled
+        departure time.
+        """
+        patches = RealtimePatches()
+        route_stop_start = self.route_stop_start
+        route_trip_start = self.route_trip_start
+        route_time_start = self.route_time_start
+        departures_arr = self.departures
+        for dep in departures:
+            if (dep.realtime is None and not dep.cancelled) or dep.scheduled is None:
+                continue
+            if (stop := self.stop_index.get(dep.stop_ref)) is None:
+                continue
+            scheduled = dep.scheduled - self.base
+            for j in range(
+                self.stop_route_start[stop], self.stop_route_start[stop + 1]
+            ):
+                route = self.stop_routes[j]
+                pos = self.stop_route_pos[j]
+                stride = route_stop_start[route + 1] - route_stop_start[route]
+                offset = route_time_start[route] + pos
+                first_trip = route_trip_start[route]
+                trip_count = route_trip_start[route + 1] - first_trip
+                trip = _first_trip_at(
+                    departures_arr, offset, stride, trip_count, scheduled
+                )
+                if (
+                    trip < trip_count
+                    and departures_arr[offset + trip * stride] == scheduled
+                    and self.trip_services[first_trip + trip] == dep.service
+                ):
+                    patches.add(route, trip, first_trip + trip, pos, stride, dep)
+                    break
+        return patches
+
+    def search(
+        self,
+        origins: Iterable[str],
+        destinations: Iterable[str],
+        departure_time: float,
+        patches: RealtimePatches | None = None,
+        max_transfers: int = DEFAULT_JOURNEY_MAX_TRANSFERS,
+        max_duration: timedelta = DEFAULT_JOURNEY_MAX_DURATION,
+        transfer_slack: timedelta = DEFAULT_JOURNEY_TRANSFER_SLACK,
+    ) -> list[Journey]:
+        """Return the earliest arriving journeys for each number of transfers.
+
+        Runs a round-based (RAPTOR) search, where each round extends the
+        journeys of the previous round by one more trip followed by an
+        optional walk. Only journeys that arrive earlier than all journeys
+        with fewer transfers are returned, sorted by number of transfers.
+        """
+        origin_stops = [s for s in map(self.stop_index.get, origins) if s is not None]
+        targets = {s for s in map(self.stop_index.get, destinations) if s is not None}
+        if not origin_stops:
+            raise ValueError("no trips serve the origin stops")
+        if not targets:
+            raise ValueError("no trips serve the destination stops")
+
+        patches = patches or RealtimePatches()
+        start = int(departure_time) - self.base
+        limit = start + int(max_duration.total_seconds())
+        slack = int(transfer_slack.total_seconds())
+
+        route_stop_start = self.route_stop_start
+        route_stops = self.route_stops
+        route_pickup = self.route_pickup
+        route_drop_off = self.route_drop_off
+        route_trip_start = self.route_trip_start
+        route_time_start = self.route_time_start
+        arrivals_arr = self.arrivals
+        departures_arr = self.departures
+        stop_route_start = self.stop_route_start
+        stop_routes = self.stop_routes
+        stop_route_pos = self.stop_route_pos
+        foot_start = self.foot_start
+        foot_stops = self.foot_stops
+        foot_secs = self.foot_secs
+        patched_routes = patches.routes
+        route_delays = patches.route_delays
+        delays = patches.delays
+        patched = delays.keys() | patches.cancelled
+
+        best: dict[int, int] = {}
+        best_round: dict[int, int] = {}
+        labels: list[dict[int, tuple | None]] = [{}]
+        arrivals: list[dict[int, int]] = [{}]
+        best_target = UNREACHED
+
+        ## Round 0 reaches the origins and stops within walking distance
+        marked = set()
+        for stop in origin_stops:
+            best[stop] = arrivals[0][stop] = start
+            best_round[stop] = 0
+            labels[0][stop] = _ORIGIN
+            marked.add(stop)
+        for stop in origin_stops:
+            for j in range(foot_start[stop], foot_start[stop + 1]):
+                other = foot_stops[j]
+                arrival = start + foot_secs[j]
+                if arrival < best.get(other, UNREACHED):
+                    best[other] = arrivals[0][other] = arrival
+                    best_round[other] = 0
+                    labels[0][other] = (_WALK, stop)
+                    marked.add(other)
+        for target in targets & marked:
+            best_target = min(best_target, best[target])
+
+        for k in range(1, max_transfers + 2):
+            if not marked:
+                break
+            round_labels: dict[int, tuple | None] = {}
+            round_arrivals: dict[int, int] = {}
+            labels.append(round_labels)
+            arrivals.append(round_arrivals)
+            prev_best = dict(best)
+            prev_round = dict(best_round)
+
+            ## Scan each route from the first stop marked in the last round
+            queue: dict[int, int] = {}
+            for stop in marked:
+                for j in range(stop_route_start[stop], stop_route_start[stop + 1]):
+                    route = stop_routes[j]
+                    if stop_route_pos[j] < queue.get(route, UNREACHED):
+                        queue[route] = stop_route_pos[j]
+            marked = set()
+
+            for route, first_pos in queue.items():
+                stop_start = route_stop_start[route]
+                stride = route_stop_start[route + 1] - stop_start
+                time_start = route_time_start[route]
+                first_trip = route_trip_start[route]
+                trip_count = route_trip_start[route + 1] - first_trip
+                route_patched = patched_routes.get(route)
+                trip = -1
+                trip_delays = None
+                board_pos = board_round = 0
+                trip_departure = UNREACHED
+                for pos in range(first_pos, stride):
+                    stop = route_stops[stop_start + pos]
+                    if trip >= 0:
+                        trip_delay = trip_delays[pos] if trip_delays else 0
+                        if route_drop_off[stop_start + pos]:
+                            arrival = (
+                                arrivals_arr[time_start + trip * stride + pos]
+                                + trip_delay
+                            )
+                            if (
+                                arrival < best.get(stop, UNREACHED)
+                                and arrival < best_target
+                                and arrival <= limit
+                            ):
+                                best[stop] = round_arrivals[stop] = arrival
+                                best_round[stop] = k
+                                round_labels[stop] = (
+                                    route,
+                                    trip,
+                                    board_pos,
+                                    pos,
+                                    board_round,
+                                )
+                                marked.add(stop)
+                                if stop in targets:
+                                    best_target = arrival
+                        trip_departure = (
+                            departures_arr[time_start + trip * stride + pos]
+                            + trip_delay
+                        )
+
+                    ## Board an earlier trip if the stop was reached in time
+                    if (ready := prev_best.get(stop)) is None or not route_pickup[
+                        stop_start + pos
+                    ]:
+                        continue
+                    if prev_round[stop] > 0:
+                        ready += slack
+                    if ready > trip_departure:
+                        continue
+                    new_trip = _first_trip_at(
+                        departures_arr,
+                        time_start + pos,
+                        stride,
+                        trip_count,
+                        ready,
+                    )
+                    while new_trip < trip_count and first_trip + new_trip in patched:
+                        new_trip += 1
+                    new_departure = (
+                        departures_arr[time_start + new_trip * stride + pos]
+                        if new_trip < trip_count
+                        else UNREACHED
+                    )
+
+                    ## Delayed trips may depart later or earlier than scheduled,
+                    ## so check those scheduled within the delay bounds
+                    if route_patched:
+                        min_delay, max_delay = route_delays[route]
+                        i = bisect_left(
+                            route_patched,
+                            _first_trip_at(
+                                departures_arr,
+                                time_start + pos,
+                                stride,
+                                trip_count,
+                                ready - max_delay,
+                            ),
+                        )
+                        for patched_trip in islice(route_patched, i, None):
+                            scheduled = departures_arr[
+                                time_start + patched_trip * stride + pos
+                            ]
+                            if scheduled + min_delay >= new_departure:
+                                break
+                            departure = (
+                                scheduled + delays[first_trip + patched_trip][pos]
+                            )
+                            if ready <= departure < new_departure:
+                                new_trip, new_departure = patched_trip, departure
+                    if new_departure < trip_departure:
+                        trip = new_trip
+                        trip_departure = new_departure
+                        trip_delays = delays.get(first_trip + trip)
+                        board_pos = pos
+                        board_round = prev_round[stop]
+
+            ## Walk from stops reached by a trip in this round
+            for stop in list(marked):
+                arrival = round_arrivals[stop]
+                for j in range(foot_start[stop], foot_start[stop + 1]):
+                    other = foot_stops[j]
+                    other_arrival = arrival + foot_secs[j]
+                    if (
+                        other_arrival < best.get(other, UNREACHED)
+                        and other_arrival < best_target
+                        and other_arrival <= limit
+                    ):
+                        best[other] = round_arrivals[other] = other_arrival
+                        best_round[other] = k
+                        round_labels[other] = (_WALK, stop)
+                        marked.add(other)
+                        if other in targets:
+                            best_target = other_arrival
+
+        journeys = []
+        earliest = UNREACHED
+        for k, round_arrivals in enumerate(arrivals):
+            reached = [
+                (arrival, stop)
+                for stop, arrival in round_arrivals.items()
+                if stop in targets
+            ]
+            if reached and (arrival_stop := min(reached))[0] < earliest:
+                earliest, stop = arrival_stop
+                journeys.append(
+                    self._journey(labels, arrivals, patches, k, stop, start)
+                )
+        return journeys
+
+    def _journey(
+        self,
+        labels: list[dict[int, tuple | None]],
+        arrivals: list[dict[int, int]],
+        patches: RealtimePatches,
+        k: int,
+        stop: int,
+        start: int,
+    ) -> Journey:
+        """Reconstruct journey arriving at stop in round k from the labels."""
+        base = self.base
+        legs = []
+        while (label := labels[k][stop]) is not _ORIGIN:
+            if label[0] == _WALK:
+                from_stop = label[1]
+                legs.append(
+                    JourneyLeg(
+                        "walk",
+                        self.stop_ids[from_stop],
+                        self.stop_ids[stop],
+                        base + arrivals[k][from_stop],
+                        base + arrivals[k][stop],
+                    )
+                )
+                stop = from_stop
+                continue
+            route, trip, board_pos, alight_pos, board_round = label
+            stop_start = self.route_stop_start[route]
+            stride = self.route_stop_start[route + 1] - stop_start
+            offset = self.route_time_start[route] + trip * stride
+            global_trip = self.route_trip_start[route] + trip
+            realtime = global_trip in patches.delays
+            board_stop = self.route_stops[stop_start + board_pos]
+            legs.append(
+                JourneyLeg(
+                    "transit",
+                    self.stop_ids[board_stop],
+                    self.stop_ids[stop],
+                    base
+                    + self.departures[offset + board_pos]
+                    + (patches.delay(global_trip, board_pos) or 0),
+                    base + arrivals[k][stop],
+                    self.trip_services[global_trip],
+                    self.trip_destinations[global_trip],
+                    self.trip_ids[global_trip],
+                    realtime,
+                )
+            )
+            stop = board_stop
+            k = board_round
+        legs.reverse()
+
+        ## Leave as late as possible for walks before the first trip
+        departure = base + start
+        for i, leg in enumerate(legs):
+            if leg.mode == "transit":
+                walk = sum(walk.arrival - walk.departure for walk in legs[:i])
+                departure = leg.departure - walk
+                legs[:i] = _shift_walks(legs[:i], departure)
+                break
+        return Journey(
+            departure,
+            legs[-1].arrival if legs else departure,
+            max(sum(leg.mode == "transit" for leg in legs) - 1, 0),
+            legs,
+        )
+
+
+def _shift_walks(legs: list[JourneyLeg], departure: int) -> list[JourneyLeg]:
+    """Return walks before the first trip starting at departure."""
+    shifted = []
+    for leg in legs:
+        duration = leg.arrival - leg.departure
+        shifted.append(leg._replace(departure=departure, arrival=departure + duration))
+        departure += duration
+    return shifted
+
+
+def _first_trip_at(
+    departures: array, offset: int, stride: int, trip_count: int, when: int
+) -> int:
+    """Return the first trip departing at or after when, or trip_count.
+
+    Departures of the trips of a route at a stop are at offset, stride
+    apart, and are sorted as trips of a route do not overtake.
+    """
+    low, high = 0, trip_count
+    while low < high:
+        mid = (low + high) // 2
+        if departures[offset + mid * stride] < when:
+            low = mid + 1
+        else:
+            high = mid
+    return low
+
+
+def _split_overtaking(trips: list[tuple]) -> list[list[tuple]]:
+    """Split trips with the same stops into routes without overtaking."""
+    trips.sort(key=lambda trip: trip[1][0])
+    routes: list[list[tuple]] = []
+    for trip in trips:
+        arrivals, departures = trip[0], trip[1]
+        for route in routes:
+            last = route[-1]
+            if all(map(int.__ge__, arrivals, last[0])) and all(
+                map(int.__ge__, departures, last[1])
+            ):
+                route.append(trip)
+                break
+        else:
+            routes.append([trip])
+    return routes
+
+
+class JourneyPlanner:
+    """Plan journeys over the GTFS timetable and cached real-time departures.
+
+    The transit index of the day of the requested departure time is built
+    on first use in an executor and kept until the day or timetable changes.
+    """
+
+    def __init__(self, tfi_data: Any) -> None:
+        """Initialise journey planner."""
+        self.tfi_data = tfi_data
+        self._index: TransitIndex | None = None
+        self._timetable: GTFSStaticTimetable | None = None
+        self._lock = asyncio.Lock()
+
+    def clear(self) -> None:
+        """Release the transit index."""
+        self._index = None
+        self._timetable = None
+
+    async def async_get_index(self, when: datetime) -> TransitIndex | None:
+        """Return the transit index of the day of when, building it if required.
+
+        Returns None if no GTFS timetable is configured.
+        """
+        if (timetable := await self.tfi_data.async_get_timetable()) is None:
+            return None
+        day = when.astimezone(timetable.timezone).date()
+        async with self._lock:
+            index = self._index
+            if index is None or index.day != day or self._timetable is not timetable:
+                self._index = None
+                _LOGGER.debug("building transit index for %s", day)
+                index = await asyncio.get_running_loop().run_in_executor(
+                    None, TransitIndex.build, timetable, day
+                )
+                _LOGGER.debug(
+                    "built transit index of %d stops, %d routes and %d trips, %d bytes",
+                    len(index.stop_ids),
+                    index.route_count,
+                    len(index.trip_ids),
+                    index.size,
+                )
+                self._index = index
+                self._timetable = timetable
+            return index
+
+    async def async_plan(
+        self,
+        origins: list[str],
+        destinations: list[str],
+        departure_time: datetime,
+        max_transfers: int = DEFAULT_JOURNEY_MAX_TRANSFERS,
+    ) -> list[dict[str, Any]] | None:
+        """Return journeys from origins to destinations for service responses.
+
+        Returns None if no GTFS timetable is configured.
+        """
+        if (index := await self.async_get_index(departure_time)) is None:
+            return None
+        journeys = await asyncio.get_running_loop().run_in_executor(
+            None,
+            partial(
+                self._plan,
+                index,
+                self.tfi_data.get_cached_departures(None),
+                origins,
+                destinations,
+                departure_time.timestamp(),
+                max_transfers,
+            ),
+        )
+        return [journey.as_dict(index.stop_names) for journey in journeys]
+
+    @staticmethod
+    def _plan(
+        index: TransitIndex,
+        departures: list[Departure],
+        origins: list[str],
+        destinations: list[str],
+        departure_time: float,
+        max_transfers: int,
+    ) -> list[Journey]:
+        """Search index patched with real-time departures. Blocks."""
+        return index.search(
+            origins,
+            destinations,
+            departure_time,
+            index.patch(departures),
+            max_transfers,
+        )
@@ -0,0 +1,79 @@
+"""TFI Journey Planner incremental JSON array decoder."""
+
+from __future__ import annotations
+
+import codecs
+from collections.abc import Iterator
+import json
+import re
+from typing import Any
+
+_WHITESPACE_RE = re.compile(r"[ \t\n\r]*")
+
+
+class JSONArrayStreamDecoder:
+    """Incrementally decode the elements of an array member of a JSON object.
+
+    Response body chunks are passed to feed(), which yields each element of
+    the array as soon as it has been received in full. Only the current
+    incomplete element is buffered, so memory use does not grow with the
+    size of the array.
+    """
+
+    def __init__(self, key: str) -> None:
+        """Initialise decoder for the array member named key."""
+        self._key_re = re.compile(re.escape(json.dumps(key)) + r"\s*:\s*\[")
+        self._key_len = len(json.dumps(key))
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._in_array = False
+        self.found = False
+        self.done = False
+
+    def feed(self, chunk: bytes) -> Iterator[Any]:
+        """Add a chunk of the response body and yield completed elements."""
+        if self.done:
+            return
+        self._buffer += self._utf8.decode(chunk)
+        if not self._in_array and not self._find_array():
+            return
+
+        buffer = self._buffer
+        pos = 0
+        while True:
+            pos = _WHITESPACE_RE.match(buffer, pos).end()
+            if pos >= len(buffer):
+                break
+            if buffer[pos] == ",":
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                self.done = True
+                pos += 1
+                break
+            try:
+                element, end = self._decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                ## Incomplete element, wait for more data
+                break
+            pos = end
+            yield element
+        self._buffer = "" if self.done else buffer[pos:]
+
+    def close(self) -> None:
+        """Check that the array was decoded in full."""
+        self._buffer += self._utf8.decode(b"", final=True)
+        if self.found and not self.done:
+            raise ValueError("incomplete JSON array in response")
+
+    def _find_array(self) -> bool:
+        """Skip the buffer to the start of the array."""
+        if match := self._key_re.search(self._buffer):
+            self._buffer = self._buffer[match.end() :]
+            self._in_array = True
+            self.found = True
+            return True
+        ## Keep enough of the buffer to match a key split across chunks
+        self._buffer = self._buffer[-(self._key_len + 64) :]
+        return False
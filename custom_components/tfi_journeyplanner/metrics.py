@@ -0,0 +1,355 @@
+"""TFI Journey Planner performance metrics."""
+
+from __future__ import annotations
+
+from bisect import bisect_left
+from collections import Counter, deque
+from collections.abc import Iterable
+import logging
+from operator import attrgetter
+import time
+from typing import Any
+
+from .const import (
+    DEFAULT_METRICS_BUCKETS_MS,
+    DEFAULT_METRICS_RATE_WINDOW,
+    DEFAULT_LOOP_BLOCK_BUDGET_MS,
+)
+from .departures import Departure
+
+_LOGGER = logging.getLogger(__name__)
+
+_stop_ref = attrgetter("stop_ref")
+
+
+class Histogram:
+    """Histogram of durations in milliseconds with fixed bucket bounds.
+
+    Percentiles are estimated as the upper bound of the bucket containing
+    the percentile, or the maximum for the overflow bucket.
+    """
+
+    __slots__ = ("bounds", "counts", "count", "total", "max")
+
+    def __init__(self, bounds: tuple[float, ...] = DEFAULT_METRICS_BUCKETS_MS) -> None:
+        """Initialise empty histogram."""
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value: float) -> None:
+        """Record a duration in milliseconds."""
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self) -> float | None:
+        """Return the mean duration."""
+        return self.total / self.count if self.count else None
+
+    def percentile(self, pct: float) -> float | None:
+        """Return the estimated percentile duration."""
+        if not self.count:
+            return None
+        rank = pct / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return histogram for diagnostics."""
+        return {
+            "count": self.count,
+            "mean": _round(self.mean),
+            "p50": _round(self.percentile(50)),
+            "p90": _round(self.percentile(90)),
+            "p99": _round(self.percentile(99)),
+            "max": _round(self.max),
+            "buckets": {
+                **{
+                    f"le_{bound:g}": count
+                    for bound, count in zip(self.bounds, self.counts)
+                },
+                "inf": self.counts[-1],
+            },
+        }
+
+
+class RateCounter:
+    """Counter of events with the event rate over a sliding window."""
+
+    __slots__ = ("window", "total", "_events")
+
+    def __init__(self, window: float = DEFAULT_METRICS_RATE_WINDOW.total_seconds()):
+        """Initialise rate counter."""
+        self.window = window
+        self.total = 0
+        self._events: deque[float] = deque()
+
+    def record(self) -> None:
+        """Record an event."""
+        now = time.monotonic()
+        self.total += 1
+        self._events.append(now)
+        self._expire(now)
+
+    @property
+    def rate(self) -> int:
+        """Return the number of events in the window."""
+        self._expire(time.monotonic())
+        return len(self._events)
+
+    def _expire(self, now: float) -> None:
+        events = self._events
+        while events and events[0] <= now - self.window:
+            events.popleft()
+
+
+class LoopBlocks:
+    """Counter of callbacks that blocked the event loop longer than a budget.
+
+    The longest time any recorded callback blocked the event loop is also kept.
+    """
+
+    __slots__ = ("budget", "count", "max", "callbacks")
+
+    def __init__(self, budget: float = DEFAULT_LOOP_BLOCK_BUDGET_MS) -> None:
+        """Initialise loop block counter with a budget in milliseconds."""
+        self.budget = budget
+        self.count = 0
+        self.max = 0.0
+        self.callbacks: dict[str, int] = {}
+
+    def record(self, name: str, blocked_ms: float) -> None:
+        """Record the time a callback ran in the event loop without yielding."""
+        if blocked_ms > self.max:
+            self.max = blocked_ms
+        if blocked_ms <= self.budget:
+            return
+        _LOGGER.debug("%s blocked the event loop for %.1f ms", name, blocked_ms)
+        self.count += 1
+        self.callbacks[name] = self.callbacks.get(name, 0) + 1
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return loop blocks for diagnostics."""
+        return {
+            "budget_ms": self.budget,
+            "count": self.count,
+            "max_ms": _round(self.max),
+            "callbacks": dict(self.callbacks),
+        }
+
+
+class StopMetrics:
+    """Costs of requests attributed to a stop.
+
+    Costs of a request for several stops are shared equally between them.
+    """
+
+    __slots__ = (
+        "requests",
+        "latency_ms",
+        "response_bytes",
+        "parse_ms",
+        "departures_parsed",
+        "departures_kept",
+    )
+
+    def __init__(self) -> None:
+        """Initialise stop metrics."""
+        self.requests = 0
+        self.latency_ms = 0.0
+        self.response_bytes = 0.0
+        self.parse_ms = 0.0
+        self.departures_parsed = 0.0
+        self.departures_kept = 0
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return stop metrics for diagnostics."""
+        return {key: _round(getattr(self, key)) for key in self.__slots__}
+
+
+class APIMetrics:
+    """Metrics of departure requests to the TFI API, shared by all entries."""
+
+    def __init__(self) -> None:
+        """Initialise API metrics."""
+        self.request_latency = Histogram()
+        self.parse_time = Histogram()
+        self.requests = 0
+        self.failures = 0
+        self.unchanged = 0
+        self.response_bytes = 0
+        self.last_response_bytes = 0
+        self.departures_parsed = 0
+        self.departures_kept = 0
+        self.executor_decodes = 0
+        self.executor_rebuilds = 0
+        self.loop_blocks = LoopBlocks()
+        self.stops: dict[str, StopMetrics] = {}
+
+    def _stops(self, stop_ids: list[str]) -> list[StopMetrics]:
+        stops = self.stops
+        return [
+            (
+                stops[stop_id]
+                if stop_id in stops
+                else stops.setdefault(stop_id, StopMetrics())
+            )
+            for stop_id in stop_ids
+        ]
+
+    def record_request(
+        self,
+        stop_ids: list[str],
+        latency_ms: float,
+        response_bytes: int,
+        failed: bool = False,
+        unchanged: bool = False,
+    ) -> None:
+        """Record a completed request for stops."""
+        self.requests += 1
+        self.failures += failed
+        self.unchanged += unchanged
+        self.request_latency.record(latency_ms)
+        self.response_bytes += response_bytes
+        self.last_response_bytes = response_bytes
+        share = 1 / max(len(stop_ids), 1)
+        for stop in self._stops(stop_ids):
+            stop.requests += 1
+            stop.latency_ms += latency_ms * share
+            stop.response_bytes += response_bytes * share
+
+    def record_parse(
+        self,
+        stop_ids: list[str],
+        parse_ms: float,
+        parsed: int,
+        departures: Iterable[Departure],
+    ) -> None:
+        """Record parsing of a response for stops and the departures kept."""
+        self.parse_time.record(parse_ms)
+        self.departures_parsed += parsed
+        share = 1 / max(len(stop_ids), 1)
+        kept = Counter(map(_stop_ref, departures))
+        self.departures_kept += kept.total()
+        for stop_id, stop in zip(stop_ids, self._stops(stop_ids)):
+            stop.parse_ms += parse_ms * share
+            stop.departures_parsed += parsed * share
+            stop.departures_kept = kept[stop_id]
+
+    def for_stops(self, stop_ids: Iterable[str]) -> StopMetrics:
+        """Return the sum of the metrics of stops."""
+        total = StopMetrics()
+        for stop_id in stop_ids:
+            if (stop := self.stops.get(stop_id)) is not None:
+                for key in StopMetrics.__slots__:
+                    setattr(total, key, getattr(total, key) + getattr(stop, key))
+        return total
+
+    def as_dict(self, stop_ids: Iterable[str] | None = None) -> dict[str, Any]:
+        """Return API metrics for diagnostics, optionally only for some stops."""
+        stops = (
+            self.stops
+            if stop_ids is None
+            else {
+                stop_id: self.stops[stop_id]
+                for stop_id in stop_ids
+                if stop_id in self.stops
+            }
+        )
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "unchanged": self.unchanged,
+            "response_bytes": self.response_bytes,
+            "last_response_bytes": self.last_response_bytes,
+            "departures_parsed": self.departures_parsed,
+            "departures_kept": self.departures_kept,
+            "executor_decodes": self.executor_decodes,
+            "executor_rebuilds": self.executor_rebuilds,
+            "loop_blocks": self.loop_blocks.as_dict(),
+            "request_latency_ms": self.request_latency.as_dict(),
+            "parse_time_ms": self.parse_time.as_dict(),
+            "stops": {stop_id: stop.as_dict() for stop_id, stop in stops.items()},
+        }
+
+
+class SensorMetrics:
+    """Metrics of a departure sensor."""
+
+    __slots__ = ("filter_time", "state_writes")
+
+    def __init__(self) -> None:
+        """Initialise sensor metrics."""
+        self.filter_time = Histogram()
+        self.state_writes = RateCounter()
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return sensor metrics for diagnostics."""
+        return {
+            "filter_time_ms": self.filter_time.as_dict(),
+            "state_writes": self.state_writes.total,
+            "state_writes_per_minute": self.state_writes.rate,
+        }
+
+
+class EntryMetrics:
+    """Metrics of the coordinator and sensors of a config entry."""
+
+    def __init__(self) -> None:
+        """Initialise entry metrics."""
+        self.update_time = Histogram()
+        self.request_latency = Histogram()
+        self.filter_time = Histogram()
+        self.state_writes = RateCounter()
+        self.loop_blocks = LoopBlocks()
+        self.sensors: dict[str, SensorMetrics] = {}
+
+    def sensor(self, sensor_id: str) -> SensorMetrics:
+        """Return the metrics of a sensor."""
+        if (sensor := self.sensors.get(sensor_id)) is None:
+            sensor = self.sensors[sensor_id] = SensorMetrics()
+        return sensor
+
+    def record_filter(self, sensor: SensorMetrics, filter_ms: float) -> None:
+        """Record the time taken to filter departures for a sensor."""
+        sensor.filter_time.record(filter_ms)
+        self.filter_time.record(filter_ms)
+
+    def record_state_write(self, sensor: SensorMetrics) -> None:
+        """Record a state write of a sensor."""
+        sensor.state_writes.record()
+        self.state_writes.record()
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return entry metrics for diagnostics."""
+        return {
+            "update_time_ms": self.update_time.as_dict(),
+            "request_latency_ms": self.request_latency.as_dict(),
+            "filter_time_ms": self.filter_time.as_dict(),
+            "state_writes": self.state_writes.total,
+            "state_writes_per_minute": self.state_writes.rate,
+            "loop_blocks": self.loop_blocks.as_dict(),
+            "sensors": {
+                sensor_id: sensor.as_dict()
+                for sensor_id, sensor in self.sensors.items()
+            },
+        }
+
+
+def elapsed_ms(start: float) -> float:
+    """Return milliseconds elapsed since a perf_counter start time."""
+    return (time.perf_counter() - start) * 1000
+
+
+def _round(value: float | None) -> float | None:
+    return round(value, 3) if isinstance(value, float) else value
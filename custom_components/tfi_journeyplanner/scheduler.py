@@ -0,0 +1,123 @@
+"""TFI Journey Planner per-stop polling scheduler."""
+
+from __future__ import annotations
+
+from collections.abc import Iterable
+from datetime import datetime, timedelta
+
+from .const import DEFAULT_UPDATE_NO_DATA_THRESHOLD
+from .departures import Departure
+
+
+class StopScheduler:
+    """Track the next update time of each stop.
+
+    The update interval of each stop is chosen from the first departure at
+    that stop, so quiet stops are polled at the default or no data interval
+    while busy stops are polled at the fast interval.
+    """
+
+    def __init__(
+        self,
+        update_interval: timedelta,
+        update_interval_fast: timedelta,
+        update_interval_no_data: timedelta,
+        update_horizon_fast: timedelta,
+        no_data_threshold: int = DEFAULT_UPDATE_NO_DATA_THRESHOLD,
+    ) -> None:
+        """Initialise per-stop polling scheduler."""
+        self.update_interval_default = update_interval
+        self.update_interval_fast = update_interval_fast
+        self.update_interval_no_data = update_interval_no_data
+        self.update_horizon_fast = update_horizon_fast
+        self.no_data_threshold = no_data_threshold
+        self._next_update: dict[str, datetime | None] = {}
+        self._update_no_data: dict[str, int] = {}
+        self.paused = False
+
+    @property
+    def stop_ids(self) -> list[str]:
+        """Return scheduled stop IDs."""
+        return list(self._next_update)
+
+    @property
+    def next_update(self) -> datetime | None:
+        """Return the earliest next update time of all stops."""
+        if not self._next_update or None in self._next_update.values():
+            return None
+        return min(self._next_update.values())
+
+    def set_stops(self, stop_ids: Iterable[str]) -> None:
+        """Set scheduled stops, scheduling new stops for immediate update."""
+        stop_ids = dict.fromkeys(stop_ids)
+        for stop_id in [s for s in self._next_update if s not in stop_ids]:
+            del self._next_update[stop_id]
+            self._update_no_data.pop(stop_id, None)
+        for stop_id in stop_ids:
+            self._next_update.setdefault(stop_id, None)
+
+    def reset(self) -> None:
+        """Schedule all stops for immediate update."""
+        for stop_id in self._next_update:
+            self._next_update[stop_id] = None
+
+    def due_stops(self, when: datetime) -> list[str]:
+        """Return stops due for update at or before when, none if paused."""
+        if self.paused:
+            return []
+        return [
+            stop_id
+            for stop_id, next_update in self._next_update.items()
+            if next_update is None or next_update <= when
+        ]
+
+    def defer(self, stop_ids: Iterable[str], until: datetime) -> None:
+        """Postpone the next update of stops until a given time."""
+        for stop_id in stop_ids:
+            if stop_id in self._next_update:
+                self._next_update[stop_id] = until
+
+    def update(
+        self,
+        stop_ids: Iterable[str],
+        departures: list[Departure],
+        now: datetime,
+    ) -> dict[str, timedelta]:
+        """Schedule next update of stops from their retrieved departures.
+
+        departures must be sorted by departure time. Returns the update
+        interval chosen for each stop.
+        """
+        first_departures: dict[str, int] = {}
+        for dep in departures:
+            first_departures.setdefault(dep.stop_ref, dep.departure)
+
+        intervals = {}
+        for stop_id in stop_ids:
+            update_interval = self.update_interval_default
+            if (first_departure := first_departures.get(stop_id)) is None:
+                no_data = self._update_no_data.get(stop_id, 0) + 1
+                self._update_no_data[stop_id] = no_data
+                if no_data > self.no_data_threshold:
+                    update_interval = self.update_interval_no_data
+            else:
+                self._update_no_data[stop_id] = 0
+                update_interval = self._get_update_interval(
+                    timedelta(seconds=first_departure - now.timestamp())
+                )
+            self._next_update[stop_id] = now + update_interval
+            intervals[stop_id] = update_interval
+        return intervals
+
+    def _get_update_interval(self, departure_horizon: timedelta) -> timedelta:
+        """Return update interval for first departure horizon."""
+        update_horizon_fast = self.update_horizon_fast
+        update_interval_default = self.update_interval_default
+        update_interval_fast = self.update_interval_fast
+        if departure_horizon < update_horizon_fast:
+            ## Next departure due within fast update horizon
+            return update_interval_fast
+        if departure_horizon < update_horizon_fast + update_interval_default:
+            ## Next departure will fall within fast update horizon before next update
+            return max(departure_horizon - update_horizon_fast, update_interval_fast)
+        return update_interval_default
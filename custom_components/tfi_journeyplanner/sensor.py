@@ -2,20 +2,27 @@
 
 from __future__ import annotations
 
+from collections.abc import Callable
+from dataclasses import dataclass
 from typing import Any
 
 # import asyncio
 import logging
+import time
 
 from datetime import datetime, timedelta
 
 from homeassistant.components.sensor import (
     SensorDeviceClass,
     SensorEntity,
+    SensorEntityDescription,
+    SensorStateClass,
 )
-from homeassistant.core import HomeAssistant, callback
-from homeassistant.helpers.entity import DeviceInfo
+from homeassistant.const import UnitOfInformation, UnitOfTime
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.entity import DeviceInfo, EntityCategory
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.event import async_call_later
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
@@ -26,17 +33,22 @@ from .const import (
     CONF_SERVICE_IDS,
     CONF_DIRECTION,
     CONF_LIMIT_DEPARTURES,
-    CONF_DEPARTURE_HORIZON,
     CONF_REALTIME_ONLY,
     CONF_INCLUDE_CANCELLED,
+    CONF_FIRST_DEPARTURE_GRANULARITY,
+    CONF_ATTRIBUTE_FIELDS,
+    CONF_ATTRIBUTE_MAX_BYTES,
     DEFAULTS,
     DEFAULT_SENSOR_ICON,
-    DEFAULT_DEPARTURE_HORIZON,
 )
 from .tfi_journeyplanner_api import TFIData
+from .departures import DepartureFilter
+from .attributes import DepartureAttributeCache
+from .circuit_breaker import STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN
 from .coordinator import TFIJourneyPlannerCoordinator
 from .device import get_device_info, get_device_unique_id
-from .util import get_duration_option
+from .metrics import Histogram, elapsed_ms
+from .util import get_departure_horizon, get_duration_option, timestamp_to_datetime
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -50,8 +62,15 @@ async def async_setup_entry(
     entry_data = hass.data[DOMAIN][entry.entry_id]
     coordinator: TFIJourneyPlannerCoordinator = entry_data["coordinator"]
     tfi_data: TFIData = entry_data["tfi_data"]
+    attribute_cache: DepartureAttributeCache = entry_data["attribute_cache"]
     options = entry.options
 
+    first_departure_granularity = get_duration_option(
+        options, CONF_FIRST_DEPARTURE_GRANULARITY
+    )
+    attribute_max_bytes = options.get(
+        CONF_ATTRIBUTE_MAX_BYTES, DEFAULTS[CONF_ATTRIBUTE_MAX_BYTES]
+    )
     entities = []
     entity_unique_ids = {}
     for stop in options[CONF_STOPS]:
@@ -63,12 +82,9 @@ async def async_setup_entry(
         limit_departures = stop.get(
             CONF_LIMIT_DEPARTURES, options.get(CONF_LIMIT_DEPARTURES)
         )
-        departure_horizon = get_duration_option(
-            stop,
-            CONF_DEPARTURE_HORIZON,
-            default=get_duration_option(
-                options, CONF_DEPARTURE_HORIZON, default=DEFAULT_DEPARTURE_HORIZON
-            ),
+        departure_horizon = get_departure_horizon(options, stop)
+        attribute_fields = stop.get(CONF_ATTRIBUTE_FIELDS) or options.get(
+            CONF_ATTRIBUTE_FIELDS, DEFAULTS[CONF_ATTRIBUTE_FIELDS]
         )
 
         name = (
@@ -91,13 +107,21 @@ async def async_setup_entry(
                 entry=entry,
                 coordinator=coordinator,
                 tfi_data=tfi_data,
+                attribute_cache=attribute_cache,
                 stop=stop,
                 service_ids=service_ids,
                 direction=direction,
                 limit_departures=limit_departures,
                 departure_horizon=departure_horizon,
+                first_departure_granularity=first_departure_granularity,
+                attribute_fields=attribute_fields,
+                attribute_max_bytes=attribute_max_bytes,
             )
         )
+    entities.extend(
+        TfiJourneyPlannerMetricSensor(description, entry, coordinator, tfi_data)
+        for description in METRIC_SENSORS
+    )
     async_add_entities(entities)
 
 
@@ -114,28 +138,40 @@ class TfiJourneyPlannerSensor(CoordinatorEntity, SensorEntity):
         entry: ConfigEntry,
         coordinator: TFIJourneyPlannerCoordinator,
         tfi_data: TFIData,
+        attribute_cache: DepartureAttributeCache,
         stop: dict[str, Any],
         service_ids: list[str] | None,
         direction: list[str] | None,
         limit_departures: int | None,
         departure_horizon: timedelta,
+        first_departure_granularity: timedelta,
+        attribute_fields: list[str] | None = None,
+        attribute_max_bytes: int = 0,
     ):
         self._attr_name = name
         self._attr_unique_id = unique_id
         self._attr_icon = DEFAULT_SENSOR_ICON
         self._coordinator = coordinator
         self._tfi_data = tfi_data
+        self._attribute_cache = attribute_cache
         self._config_entry = entry
         self._stop = stop
-        self._service_ids = service_ids
-        self._direction = direction
-        self._limit_departures = limit_departures
-        self._departure_horizon = departure_horizon
-        self._realtime_only = entry.options.get(
-            CONF_INCLUDE_CANCELLED, DEFAULTS[CONF_INCLUDE_CANCELLED]
-        )
-        self._include_cancelled = entry.options.get(
-            CONF_REALTIME_ONLY, DEFAULTS[CONF_REALTIME_ONLY]
+        self._first_departure_granularity = first_departure_granularity
+        ## An empty whitelist includes all departure attributes
+        self._attribute_fields = tuple(attribute_fields) if attribute_fields else None
+        self._attribute_max_bytes = attribute_max_bytes
+        self._filter = DepartureFilter.create(
+            stop[CONF_STOP_IDS],
+            service_ids=service_ids,
+            direction=direction,
+            limit_departures=limit_departures,
+            departure_horizon=departure_horizon,
+            realtime_only=entry.options.get(
+                CONF_REALTIME_ONLY, DEFAULTS[CONF_REALTIME_ONLY]
+            ),
+            include_cancelled=entry.options.get(
+                CONF_INCLUDE_CANCELLED, DEFAULTS[CONF_INCLUDE_CANCELLED]
+            ),
         )
 
         super().__init__(coordinator, context=stop[CONF_STOP_IDS])
@@ -144,41 +180,309 @@ class TfiJourneyPlannerSensor(CoordinatorEntity, SensorEntity):
         )
 
         self._departures = None
+        self._fingerprint = None
+        self._unsub_countdown: CALLBACK_TYPE | None = None
+        self._metrics = coordinator.metrics.sensor(unique_id)
 
     @property
     def device_info(self) -> DeviceInfo:
         """Return the device info."""
         return get_device_info(self._config_entry)
 
+    async def async_added_to_hass(self) -> None:
+        """Show cached departures, which may be restored from the last run."""
+        await super().async_added_to_hass()
+        self._handle_coordinator_update()
+
+    async def async_will_remove_from_hass(self) -> None:
+        """Cancel first departure countdown timer."""
+        self._cancel_countdown()
+        await super().async_will_remove_from_hass()
+
     @callback
     def _handle_coordinator_update(self) -> None:
         """Handle updated data from the coordinator."""
-        stop = self._stop
+        ## Sensors with identical filters share one evaluation
+        start = time.perf_counter()
+        self._departures = self._tfi_data.get_departures_for_filter(self._filter)
+        metrics = self._coordinator.metrics
+        metrics.record_filter(self._metrics, elapsed_ms(start))
+        self._async_update_state()
+        metrics.loop_blocks.record("sensor update", elapsed_ms(start))
+
+    @callback
+    def _handle_countdown(self, _now: datetime) -> None:
+        """Handle first departure countdown crossing the granularity."""
+        self._unsub_countdown = None
+        self._async_update_state()
+
+    @callback
+    def _cancel_countdown(self) -> None:
+        """Cancel first departure countdown timer."""
+        if self._unsub_countdown:
+            self._unsub_countdown()
+            self._unsub_countdown = None
+
+    @callback
+    def _async_update_state(self) -> None:
+        """Write state if departures, countdown or availability have changed."""
+        departures = self._departures
+        self._cancel_countdown()
 
-        departures = self._tfi_data.get_filtered_departures(
-            stop[CONF_STOP_IDS],
-            service_ids=self._service_ids,
-            direction=self._direction,
-            limit_departures=self._limit_departures,
-            departure_horizon=self._departure_horizon,
-            realtime_only=self._realtime_only,
-            include_cancelled=self._include_cancelled,
-        )
-        self._departures = departures
         first_departure = None
+        first_departure_secs = None
+        countdown = None
         if len(departures) > 0:
-            first_departure: datetime = departures[0].get("departure")
+            first_departure = departures[0].departure
+            first_departure_secs = first_departure - time.time()
+            if granularity := self._first_departure_granularity.total_seconds():
+                countdown = int(first_departure_secs // granularity)
+                ## Refresh when the countdown crosses the next granularity step
+                self._unsub_countdown = async_call_later(
+                    self.hass,
+                    max(first_departure_secs - countdown * granularity, 0),
+                    self._handle_countdown,
+                )
 
-        self._attr_native_value = first_departure
+        departures_key = tuple(
+            (
+                dep.stop_ref,
+                dep.service,
+                dep.direction,
+                dep.destination,
+                dep.scheduled,
+                dep.realtime,
+                dep.cancelled,
+            )
+            for dep in departures
+        )
+        ## Availability follows the coordinator and is written when it changes
+        fingerprint = (departures_key, countdown, self.available)
+        if fingerprint == self._fingerprint:
+            return
+        self._fingerprint = fingerprint
+
+        ## Sensors with identical filters share the projected departures
+        departures_attr = self._attribute_cache.project(
+            departures_key,
+            departures,
+            fields=self._attribute_fields,
+            max_bytes=self._attribute_max_bytes,
+        )
+        self._attr_native_value = timestamp_to_datetime(first_departure)
         attrs = {
             "attribution": "Data provided by transportforireland.ie "
             "per conditions of reuse at https://data.gov.ie/licence",
             "source": "tfi_journeyplanner",
-            "departures": departures,
+            "departures": departures_attr,
         }
-        if first_departure:
-            now = datetime.now().astimezone()
-            attrs["first_departure"] = (first_departure - now).total_seconds()
+        if len(departures_attr) < len(departures):
+            attrs["departures_truncated"] = len(departures) - len(departures_attr)
+        if first_departure_secs is not None:
+            attrs["first_departure"] = first_departure_secs
         self._attr_extra_state_attributes = attrs
 
         self.async_write_ha_state()
+        self._coordinator.metrics.record_state_write(self._metrics)
+
+
+def _percentiles(histogram: Histogram, prefix: str = "") -> dict[str, Any]:
+    """Return percentile attributes of a histogram."""
+    data = histogram.as_dict()
+    return {
+        prefix + key: data[key] for key in ("count", "mean", "p50", "p90", "p99", "max")
+    }
+
+
+@dataclass(frozen=True, kw_only=True)
+class TfiJourneyPlannerMetricSensorDescription(SensorEntityDescription):
+    """Description of a performance metric sensor."""
+
+    value_fn: Callable[[TfiJourneyPlannerMetricSensor], Any]
+    attributes_fn: Callable[[TfiJourneyPlannerMetricSensor], dict[str, Any]] = (
+        lambda _: {}
+    )
+
+
+## Costs of requests are attributed to the stops of the entry, and costs of
+## requests for several stops are shared equally between them
+METRIC_SENSORS = (
+    TfiJourneyPlannerMetricSensorDescription(
+        key="request_latency",
+        name="Request latency",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda s: s.metrics.request_latency.percentile(50),
+        attributes_fn=lambda s: {
+            **_percentiles(s.metrics.request_latency),
+            "api_p50": s.api_metrics.request_latency.percentile(50),
+        },
+    ),
+    TfiJourneyPlannerMetricSensorDescription(
+        key="update_time",
+        name="Update time",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda s: s.metrics.update_time.percentile(50),
+        attributes_fn=lambda s: _percentiles(s.metrics.update_time),
+    ),
+    TfiJourneyPlannerMetricSensorDescription(
+        key="response_bytes",
+        name="Response size",
+        device_class=SensorDeviceClass.DATA_SIZE,
+        native_unit_of_measurement=UnitOfInformation.BYTES,
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda s: round(s.stop_metrics.response_bytes),
+        attributes_fn=lambda s: {
+            "requests": s.stop_metrics.requests,
+            "api_response_bytes": s.api_metrics.response_bytes,
+            "api_last_response_bytes": s.api_metrics.last_response_bytes,
+        },
+    ),
+    TfiJourneyPlannerMetricSensorDescription(
+        key="parse_time",
+        name="Parse time",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        suggested_display_precision=1,
+        value_fn=lambda s: s.stop_metrics.parse_ms,
+        attributes_fn=lambda s: _percentiles(s.api_metrics.parse_time, "api_"),
+    ),
+    TfiJourneyPlannerMetricSensorDescription(
+        key="departures_kept",
+        name="Departures kept",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda s: s.stop_metrics.departures_kept,
+        attributes_fn=lambda s: {
+            "departures_parsed": round(s.stop_metrics.departures_parsed),
+            "api_departures_parsed": s.api_metrics.departures_parsed,
+            "api_departures_kept": s.api_metrics.departures_kept,
+        },
+    ),
+    TfiJourneyPlannerMetricSensorDescription(
+        key="cached_departures",
+        name="Cached departures",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda s: len(s.tfi_data.get_cached_departures(s.stop_ids)),
+        attributes_fn=lambda s: {
+            "all_stops": len(s.tfi_data.get_cached_departures(None)),
+        },
+    ),
+    TfiJourneyPlannerMetricSensorDescription(
+        key="filter_time",
+        name="Filter time",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        suggested_display_precision=3,
+        value_fn=lambda s: s.metrics.filter_time.percentile(50),
+        attributes_fn=lambda s: {
+            **_percentiles(s.metrics.filter_time),
+            "sensors": {
+                sensor_id: sensor.filter_time.percentile(50)
+                for sensor_id, sensor in s.metrics.sensors.items()
+            },
+        },
+    ),
+    TfiJourneyPlannerMetricSensorDescription(
+        key="state_writes",
+        name="State writes",
+        native_unit_of_measurement="writes/min",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda s: s.metrics.state_writes.rate,
+        attributes_fn=lambda s: {
+            "total": s.metrics.state_writes.total,
+            "sensors": {
+                sensor_id: sensor.state_writes.rate
+                for sensor_id, sensor in s.metrics.sensors.items()
+            },
+        },
+    ),
+    TfiJourneyPlannerMetricSensorDescription(
+        key="loop_blocks",
+        name="Event loop blocks",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda s: (
+            s.metrics.loop_blocks.count + s.api_metrics.loop_blocks.count
+        ),
+        attributes_fn=lambda s: {
+            "budget_ms": s.metrics.loop_blocks.budget,
+            "longest_ms": round(
+                max(s.metrics.loop_blocks.max, s.api_metrics.loop_blocks.max), 3
+            ),
+            "callbacks": {
+                **s.api_metrics.loop_blocks.callbacks,
+                **s.metrics.loop_blocks.callbacks,
+            },
+            "executor_decodes": s.api_metrics.executor_decodes,
+            "executor_rebuilds": s.api_metrics.executor_rebuilds,
+        },
+    ),
+    TfiJourneyPlannerMetricSensorDescription(
+        key="circuit_breaker",
+        name="Circuit breaker",
+        device_class=SensorDeviceClass.ENUM,
+        options=[STATE_CLOSED, STATE_OPEN, STATE_HALF_OPEN],
+        value_fn=lambda s: s.tfi_data.circuit_breaker.state,
+        attributes_fn=lambda s: {
+            "failures": s.tfi_data.circuit_breaker.failures,
+            "retry_in": (
+                None
+                if (retry_in := s.tfi_data.circuit_breaker.retry_in) is None
+                else round(retry_in)
+            ),
+        },
+    ),
+)
+
+
+class TfiJourneyPlannerMetricSensor(CoordinatorEntity, SensorEntity):
+    """TFI Journey Planner performance metric sensor class."""
+
+    _attr_has_entity_name = True
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+    entity_description: TfiJourneyPlannerMetricSensorDescription
+
+    def __init__(
+        self,
+        description: TfiJourneyPlannerMetricSensorDescription,
+        entry: ConfigEntry,
+        coordinator: TFIJourneyPlannerCoordinator,
+        tfi_data: TFIData,
+    ):
+        self.entity_description = description
+        self._attr_unique_id = get_device_unique_id(entry, f"metric_{description.key}")
+        self._config_entry = entry
+        self.tfi_data = tfi_data
+        self.metrics = coordinator.metrics
+        self.api_metrics = tfi_data.metrics
+        self.stop_ids = [
+            stop_id
+            for stop in entry.options[CONF_STOPS]
+            for stop_id in stop[CONF_STOP_IDS]
+        ]
+        self.stop_metrics = self.api_metrics.for_stops(self.stop_ids)
+        super().__init__(coordinator)
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        """Return the device info."""
+        return get_device_info(self._config_entry)
+
+    async def async_added_to_hass(self) -> None:
+        """Show current metrics."""
+        await super().async_added_to_hass()
+        self._handle_coordinator_update()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Handle updated metrics after a coordinator update."""
+        self.stop_metrics = self.api_metrics.for_stops(self.stop_ids)
+        description = self.entity_description
+        self._attr_native_value = description.value_fn(self)
+        self._attr_extra_state_attributes = description.attributes_fn(self)
+        self.async_write_ha_state()
@@ -0,0 +1,161 @@
+"""TFI Journey Planner learned stop service hours."""
+
+from __future__ import annotations
+
+from collections.abc import Iterable
+from datetime import datetime, timedelta
+import logging
+import time
+from typing import Any
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+
+from .const import (
+    STORAGE_KEY_SERVICE_HOURS,
+    STORAGE_VERSION,
+    DEFAULT_SERVICE_HOURS_LEARNING_PERIOD,
+    DEFAULT_SERVICE_HOURS_SAVE_DELAY,
+)
+from .departures import Departure
+
+_LOGGER = logging.getLogger(__name__)
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+SLOTS_PER_WEEK = 7 * SLOTS_PER_DAY
+WEEK_MASK = (1 << SLOTS_PER_WEEK) - 1
+
+
+def _slot(local: datetime) -> int:
+    """Return weekly slot of a local time."""
+    return (
+        local.weekday() * SLOTS_PER_DAY
+        + (local.hour * 60 + local.minute) // SLOT_MINUTES
+    )
+
+
+class ServiceHoursProfile:
+    """Weekly profile of the times at which each stop has service.
+
+    Each stop has a bitmap of the 15 minute slots of the week, in local time,
+    in which a departure has been scheduled. A stop's profile is only used
+    once departures have been observed for the learning period, so that
+    every slot of the week has been seen at least once.
+    """
+
+    def __init__(
+        self, learning_period: timedelta = DEFAULT_SERVICE_HOURS_LEARNING_PERIOD
+    ) -> None:
+        """Initialise empty service hours profile."""
+        self.learning_period = learning_period.total_seconds()
+        self._active: dict[str, int] = {}
+        self._since: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._active)
+
+    def observe(self, departures: Iterable[Departure], now: float) -> bool:
+        """Add the scheduled departure times of departures to the profile.
+
+        Returns whether the profile has changed.
+        """
+        changed = False
+        for dep in departures:
+            stop_id = dep.stop_ref
+            if stop_id not in self._since:
+                self._since[stop_id] = int(now)
+                self._active[stop_id] = 0
+                changed = True
+            if (scheduled := dep.scheduled or dep.departure) is None:
+                continue
+            bit = 1 << _slot(datetime.fromtimestamp(scheduled))
+            if not self._active[stop_id] & bit:
+                self._active[stop_id] |= bit
+                changed = True
+        return changed
+
+    def is_learned(self, stop_id: str, now: float) -> bool:
+        """Return whether the profile of a stop has been learned."""
+        since = self._since.get(stop_id)
+        return since is not None and now - since >= self.learning_period
+
+    def next_service(self, stop_id: str, now: datetime) -> datetime | None:
+        """Return the start of the next slot at which the stop has service.
+
+        The current slot is included. Returns None if the profile of the stop
+        has not been learned or has no service, in which case the stop should
+        be polled as usual.
+        """
+        if not self.is_learned(stop_id, now.timestamp()):
+            return None
+        if not (active := self._active[stop_id]):
+            return None
+        local = datetime.fromtimestamp(now.timestamp())
+        slot = _slot(local)
+        ## Rotate the current slot to bit 0 and find the next active slot
+        rotated = ((active >> slot) | (active << (SLOTS_PER_WEEK - slot))) & WEEK_MASK
+        offset = (rotated & -rotated).bit_length() - 1
+        start = local.replace(
+            minute=local.minute - local.minute % SLOT_MINUTES, second=0, microsecond=0
+        ) + timedelta(minutes=offset * SLOT_MINUTES)
+        ## Naive local time is converted across daylight saving changes
+        return start.astimezone()
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return profile for persistent storage."""
+        return {
+            "slot_minutes": SLOT_MINUTES,
+            "stops": {
+                stop_id: {"since": self._since[stop_id], "active": f"{active:x}"}
+                for stop_id, active in self._active.items()
+            },
+        }
+
+    def restore(self, data: dict[str, Any]) -> None:
+        """Restore profile from persistent storage."""
+        if data.get("slot_minutes") != SLOT_MINUTES:
+            return
+        for stop_id, stop in data["stops"].items():
+            self._since[stop_id] = int(stop["since"])
+            self._active[stop_id] = int(stop["active"], 16) & WEEK_MASK
+
+
+class ServiceHoursStore:
+    """Persistent learned service hours shared by all config entries."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        profile: ServiceHoursProfile | None = None,
+        save_delay: timedelta = DEFAULT_SERVICE_HOURS_SAVE_DELAY,
+    ) -> None:
+        """Initialise persistent service hours."""
+        self.profile = profile or ServiceHoursProfile()
+        self.save_delay = save_delay
+        self._store: Store[dict[str, Any]] = Store(
+            hass, STORAGE_VERSION, STORAGE_KEY_SERVICE_HOURS
+        )
+
+    async def async_load(self) -> None:
+        """Restore learned service hours."""
+        try:
+            if data := await self._store.async_load():
+                self.profile.restore(data)
+        except Exception as exc:  # pylint: disable=broad-except
+            _LOGGER.warning(
+                "Could not load service hours: %s: %s", type(exc).__name__, exc
+            )
+        _LOGGER.debug("restored service hours of %d stops", len(self.profile))
+
+    @callback
+    def async_observe(self, departures: Iterable[Departure]) -> None:
+        """Learn service hours from departures, saving them if changed.
+
+        Saves are delayed and batched, and pending saves are written when
+        Home Assistant shuts down.
+        """
+        if self.profile.observe(departures, time.time()):
+            self._store.async_delay_save(
+                self.profile.as_dict, self.save_delay.total_seconds()
+            )
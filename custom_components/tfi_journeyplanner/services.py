@@ -0,0 +1,88 @@
+"""TFI Journey Planner services."""
+
+from __future__ import annotations
+
+from datetime import datetime
+import logging
+
+import voluptuous as vol
+
+from homeassistant.core import (
+    HomeAssistant,
+    ServiceCall,
+    ServiceResponse,
+    SupportsResponse,
+    callback,
+)
+from homeassistant.exceptions import HomeAssistantError, ServiceValidationError
+import homeassistant.helpers.config_validation as cv
+
+from .const import (
+    DOMAIN,
+    DATA_HUB,
+    SERVICE_PLAN_JOURNEY,
+    ATTR_ORIGIN,
+    ATTR_DESTINATION,
+    ATTR_DEPARTURE_TIME,
+    ATTR_MAX_TRANSFERS,
+    DEFAULT_JOURNEY_MAX_TRANSFERS,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+PLAN_JOURNEY_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_ORIGIN): vol.All(cv.ensure_list, [cv.string]),
+        vol.Required(ATTR_DESTINATION): vol.All(cv.ensure_list, [cv.string]),
+        vol.Optional(ATTR_DEPARTURE_TIME): cv.datetime,
+        vol.Optional(
+            ATTR_MAX_TRANSFERS, default=DEFAULT_JOURNEY_MAX_TRANSFERS
+        ): vol.All(vol.Coerce(int), vol.Range(min=0, max=5)),
+    }
+)
+
+
+@callback
+def async_setup_services(hass: HomeAssistant) -> None:
+    """Register integration services."""
+
+    async def async_plan_journey(call: ServiceCall) -> ServiceResponse:
+        """Plan journeys between stops."""
+        departure_time: datetime = call.data.get(ATTR_DEPARTURE_TIME) or datetime.now()
+        ## Naive departure times are in local time
+        departure_time = departure_time.astimezone()
+        journey_planner = hass.data[DOMAIN][DATA_HUB].journey_planner
+        try:
+            journeys = await journey_planner.async_plan(
+                call.data[ATTR_ORIGIN],
+                call.data[ATTR_DESTINATION],
+                departure_time,
+                call.data[ATTR_MAX_TRANSFERS],
+            )
+        except ValueError as exc:
+            raise ServiceValidationError(str(exc)) from exc
+        if journeys is None:
+            raise HomeAssistantError(
+                "Journey planning requires a GTFS static timetable"
+            )
+        _LOGGER.debug(
+            "planned %d journeys from %s to %s",
+            len(journeys),
+            call.data[ATTR_ORIGIN],
+            call.data[ATTR_DESTINATION],
+        )
+        return {"journeys": journeys}
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_PLAN_JOURNEY,
+        async_plan_journey,
+        schema=PLAN_JOURNEY_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+
+
+@callback
+def async_unload_services(hass: HomeAssistant) -> None:
+    """Unregister integration services."""
+    hass.services.async_remove(DOMAIN, SERVICE_PLAN_JOURNEY)
@@ -1,13 +1,34 @@
 """TFI Journey Planner API."""
 
+import asyncio
+from collections.abc import Callable, Iterable
 from datetime import datetime, timedelta, timezone
+from functools import partial
+import hashlib
+import time
 from typing import Any
 
-# import json
+import json
 import logging
 import aiohttp
 
-from .const import DEFAULT_DEPARTURE_HORIZON
+from .const import (
+    DEFAULTS,
+    DEFAULT_DEPARTURE_HORIZON,
+    CONF_SHARD_SIZE,
+    CONF_SHARD_CONCURRENCY,
+    CONF_STREAM_DECODE,
+    CONF_EXECUTOR_THRESHOLD,
+    DEFAULT_STREAM_CHUNK_SIZE,
+    DEFAULT_GTFS_REALTIME_MIN_INTERVAL,
+    DEFAULT_GTFS_REALTIME_MAX_DELAY,
+)
+from .circuit_breaker import CircuitBreaker
+from .departures import Departure, DepartureFilter, DepartureStore
+from .gtfs import GTFSStaticTimetable, get_timetable_db_path
+from .gtfs_realtime import TripUpdate, join_trip_updates, parse_trip_updates
+from .json_stream import JSONArrayStreamDecoder
+from .metrics import APIMetrics, elapsed_ms
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -34,32 +55,96 @@ TFI_DEFAULT_HEADERS = {
 }
 TFI_DEFAULT_SESSION_TIMEOUT = 20
 TFI_DEFAULT_CONNECT_TIMEOUT = 10
+TFI_DEFAULT_CONNECTION_LIMIT_PER_HOST = 4
+TFI_DEFAULT_KEEPALIVE_TIMEOUT = 60
+TFI_DEFAULT_DNS_CACHE_TTL = 300
 
 
 class NotConnected(Exception):
     """Journey planner not connected."""
 
 
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read()
+
+
 class TFIData:
     """TFI Journey Planner Data class."""
 
-    def __init__(self):
+    def __init__(
+        self,
+        shard_size: int = DEFAULTS[CONF_SHARD_SIZE],
+        shard_concurrency: int = DEFAULTS[CONF_SHARD_CONCURRENCY],
+        stream_decode: bool = DEFAULTS[CONF_STREAM_DECODE],
+        executor_threshold: int = DEFAULTS[CONF_EXECUTOR_THRESHOLD],
+        cache_horizon: timedelta | None = None,
+        timetable_path: str | None = None,
+        realtime_feed: str | None = None,
+        realtime_api_key: str | None = None,
+    ):
+        self.shard_size = shard_size
+        self.shard_concurrency = shard_concurrency
+        self.stream_decode = stream_decode
+        self.executor_threshold = executor_threshold
+        self.cache_horizon = cache_horizon
+        self.timetable_path = timetable_path
+        self.timetable_db_dir: str | None = None
+        self._timetable: GTFSStaticTimetable | None = None
+        self._timetable_failed_path: str | None = None
+        self._timetable_lock = asyncio.Lock()
+        self.realtime_feed = realtime_feed
+        self.realtime_api_key = realtime_api_key
+        self._trip_updates: dict[str, TripUpdate] | None = None
+        self._trip_updates_digest: str | None = None
+        self._trip_updates_fetched = 0.0
+        self._trip_updates_lock = asyncio.Lock()
+        self.api_url = TFI_DEPARTURES_API
         self._session = None
-        self._departures = None
+        self.shared_session: aiohttp.ClientSession | None = None
+        self.use_shared_session = False
+        self._timeout = aiohttp.ClientTimeout(
+            total=TFI_DEFAULT_SESSION_TIMEOUT,
+            connect=TFI_DEFAULT_CONNECT_TIMEOUT,
+        )
+        self._store = DepartureStore()
+        self._rebuild_lock = asyncio.Lock()
+        self.circuit_breaker = CircuitBreaker()
+        self.metrics = APIMetrics()
+        self._stop_versions: dict[str, int] = {}
+        self._stop_fetched: dict[str, float] = {}
+        self._listeners: list[Callable[[list[str] | None], None]] = []
+        self._generation = 0
+        self._filter_generation = 0
+        self._filter_results: dict[
+            DepartureFilter, tuple[tuple[int, int], list[Departure]]
+        ] = {}
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._request_seq = 0
+        self._stop_request_seq: dict[str, int] = {}
+        self._digests: dict[tuple[str, ...], str] = {}
+        self._validators: dict[tuple[str, ...], dict[str, str]] = {}
         self._connect_failed_log_msg = False
         self._bad_response_log_msg = False
+        self._realtime_failed_log_msg = False
+        self._realtime_bad_response_log_msg = False
+        self._realtime_no_timetable_log_msg = False
         self._no_data_log_msg = False
         self._no_data_filtered_log_msg = False
 
     async def setup(self) -> None:
         """Set up TFI Journey Planner."""
         if not self._session:
-            timeout = aiohttp.ClientTimeout(
-                total=TFI_DEFAULT_SESSION_TIMEOUT,
-                connect=TFI_DEFAULT_CONNECT_TIMEOUT,
+            ## Keep connections to the TFI API warm between polls
+            connector = aiohttp.TCPConnector(
+                limit_per_host=TFI_DEFAULT_CONNECTION_LIMIT_PER_HOST,
+                keepalive_timeout=TFI_DEFAULT_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=TFI_DEFAULT_DNS_CACHE_TTL,
             )
+            ## TFI API headers are sent per request, as the session is also used
+            ## for the GTFS-Realtime feed
             self._session = aiohttp.ClientSession(
-                headers=TFI_DEFAULT_HEADERS, timeout=timeout
+                connector=connector, timeout=self._timeout
             )
 
     async def cleanup(self) -> None:
@@ -67,6 +152,11 @@ class TFIData:
         if self._session:
             await self._session.close()
             self._session = None
+        if self._timetable:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._timetable.close
+            )
+            self._timetable = None
 
     async def get_departures(
         self,
@@ -78,7 +168,7 @@ class TFIData:
         departure_horizon: timedelta | None = None,
         realtime_only: bool = False,
         include_cancelled: bool = False,
-    ) -> list[dict[str, Any]]:
+    ) -> list[Departure]:
         """Update cache and return filtered departures."""
         await self.update_departures(stop_ids, departure_time)
         return self.get_filtered_departures(
@@ -100,70 +190,373 @@ class TFIData:
         departure_horizon: timedelta | None = None,
         realtime_only: bool = False,
         include_cancelled: bool = False,
-    ) -> list[dict[str, Any]]:
+    ) -> list[Departure]:
         """Return filtered departures from cache."""
-        if self._departures is None:
-            return []
-
-        now = datetime.now().astimezone()
-        if service_ids is None:
-            service_ids = []
-        if departure_horizon is None:
-            departure_horizon = timedelta(**DEFAULT_DEPARTURE_HORIZON)
-
-        def filter_departure(dep: dict[str, Any]) -> bool:
-            """Filter departure based on options."""
-            dep_stop_id = dep["stopRef"]
-            dep_rt = dep["realTimeDeparture"]
-            dep_sch = dep["scheduledDeparture"]
-            dep_dir = dep["serviceDirection"]
-            dep_time = dep_rt if dep_rt else dep_sch
-            dep_cancelled = dep.get("cancelled", False)
-            dep_service = dep.get("serviceNumber", "unknown")
-            dep_time = dep_rt if dep_rt else dep_sch
-            return (
-                dep_stop_id in stop_ids
-                and now <= dep_time <= now + departure_horizon
-                and (not service_ids or dep_service in service_ids)
-                and (not direction or dep_dir in direction)
-                and (not realtime_only or dep_rt is not None)
-                and (include_cancelled or not dep_cancelled)
+        return self.get_departures_for_filter(
+            DepartureFilter.create(
+                stop_ids,
+                service_ids=service_ids,
+                direction=direction,
+                limit_departures=limit_departures,
+                departure_horizon=departure_horizon or DEFAULT_DEPARTURE_HORIZON,
+                realtime_only=realtime_only,
+                include_cancelled=include_cancelled,
             )
+        )
 
-        departures = []
-        dep_count = 0
-        for dep in self._departures:
-            if filter_departure(dep):
-                dep_count += 1
-                departures.append(dep)
-                if limit_departures and dep_count >= limit_departures:
-                    break
+    def get_departures_for_filter(self, spec: DepartureFilter) -> list[Departure]:
+        """Return cached departures matching a compiled filter.
+
+        The filter is evaluated once per cache change and second, and the
+        result is shared by all callers with an identical filter. The returned
+        list must not be modified.
+        """
+        if self._filter_generation != self._generation:
+            self._filter_results.clear()
+            self._filter_generation = self._generation
+        now = time.time()
+        tick = (self._generation, int(now))
+        if (result := self._filter_results.get(spec)) is not None and (
+            result[0] == tick
+        ):
+            return result[1]
+        departures = self._store.evaluate(spec, now)
+        self._filter_results[spec] = (tick, departures)
         return departures
 
-    def _filter_departure_time(self, dep: dict[str, Any]) -> bool:
-        now = datetime.now().astimezone(timezone.utc)
-        return dep["departure"] >= now - timedelta(minutes=1)
+    def _get_departure_cutoff(self) -> float:
+        """Return the epoch time before which departures are discarded."""
+        return time.time() - 60
+
+    def _get_departure_horizon(self) -> float:
+        """Return the epoch time after which departures are discarded."""
+        if self.cache_horizon is None:
+            return float("inf")
+        return time.time() + self.cache_horizon.total_seconds()
+
+    def get_cached_departures(self, stop_ids: list[str] | None) -> list[Departure]:
+        """Return all cached departures for stops, or for all stops if None."""
+        if stop_ids is None:
+            return list(self._store.departures)
+        return self._store.for_stops(stop_ids)
 
-    def filter_cached_departures(self) -> None:
-        """Filter cached departures."""
+    def get_fetched_stops(self, stop_ids: Iterable[str], since: float) -> list[str]:
+        """Return stops with departures retrieved at or after a monotonic time.
+
+        Stops are retrieved if a response for them was received, including
+        unchanged responses, but not if their request failed or returned no
+        departures.
+        """
+        stop_fetched = self._stop_fetched
+        return [
+            stop_id for stop_id in stop_ids if stop_fetched.get(stop_id, -1.0) >= since
+        ]
+
+    def _mark_fetched(self, stop_ids: Iterable[str]) -> None:
+        """Record that departures were retrieved for stops."""
+        now = time.monotonic()
+        for stop_id in stop_ids:
+            self._stop_fetched[stop_id] = now
+
+    def get_stop_versions(self, stop_ids: list[str]) -> tuple[int, ...]:
+        """Return cache versions of stops, which change when departures change."""
+        return tuple(self._stop_versions.get(stop_id, 0) for stop_id in stop_ids)
+
+    def _use_executor(self, size: int) -> bool:
+        """Return whether a response of size bytes is processed in an executor."""
+        return bool(self.executor_threshold) and size >= self.executor_threshold * 1024
+
+    def _replace_departures(
+        self, departures: list[Departure], stop_ids: list[str] | None
+    ) -> None:
+        """Replace cached departures for stops and update stop versions."""
+        start = time.perf_counter()
+        self._store.replace(departures, stop_ids)
+        self.metrics.loop_blocks.record("rebuild departure cache", elapsed_ms(start))
+        self._update_stop_versions(stop_ids)
+
+    def _update_stop_versions(self, stop_ids: list[str] | None) -> None:
+        """Update versions of stops with replaced departures."""
+        self._generation += 1
+        for stop_id in self._store.stop_ids if stop_ids is None else stop_ids:
+            self._stop_versions[stop_id] = self._stop_versions.get(stop_id, 0) + 1
+        for listener in list(self._listeners):
+            listener(stop_ids)
+
+    def add_listener(
+        self, listener: Callable[[list[str] | None], None]
+    ) -> Callable[[], None]:
+        """Add a listener called with the stop IDs of each cache change.
+
+        The stop IDs are None if departures of all stops were replaced.
+        Returns a function that removes the listener.
+        """
+        self._listeners.append(listener)
+        return partial(self._listeners.remove, listener)
+
+    def _get_current_departures(self, stop_ids: list[str]) -> list[Departure]:
+        """Return cached departures for stops that have not departed."""
+        cutoff = self._get_departure_cutoff()
+        return [
+            dep for dep in self._store.for_stops(stop_ids) if dep.departure >= cutoff
+        ]
+
+    def _claim_stops(
+        self, stop_ids: list[str], request_seq: int
+    ) -> tuple[list[str], list[Departure]]:
+        """Claim stops for applying the results of a request.
+
+        Stops already updated by a later request are not claimed, so results
+        are applied in request order. Returns the claimed stops and the cached
+        departures of the other stops.
+        """
+        stop_request_seq = self._stop_request_seq
+        claimed = []
+        stale = []
+        for stop_id in stop_ids:
+            if stop_request_seq.get(stop_id, 0) > request_seq:
+                stale.append(stop_id)
+            else:
+                stop_request_seq[stop_id] = request_seq
+                claimed.append(stop_id)
+        if not stale:
+            return claimed, []
+        _LOGGER.debug("discarding out of order results for stops %s", stale)
+        return claimed, self._get_current_departures(stale)
+
+    def _discard_digests(self, stop_ids: list[str] | None) -> None:
+        """Discard response digests and validators of requests for stops."""
+        if stop_ids is None:
+            self._digests.clear()
+            self._validators.clear()
+            return
+        stops = set(stop_ids)
+        for key in [key for key in self._digests if stops.intersection(key)]:
+            del self._digests[key]
+        for key in [key for key in self._validators if stops.intersection(key)]:
+            del self._validators[key]
+
+    def filter_cached_departures(self, stop_ids: list[str] | None = None) -> None:
+        """Filter cached departures, optionally only for some stops."""
         departures = []
-        for dep in self._departures:
-            if self._filter_departure_time(dep):
-                if dep["realTimeDeparture"] is not None:
-                    dep["scheduledDeparture"] = dep["realTimeDeparture"]
-                    dep["realTimeDeparture"] = None
+        cached = self._store if stop_ids is None else self._store.for_stops(stop_ids)
+        cutoff = self._get_departure_cutoff()
+        for dep in cached:
+            if dep.departure >= cutoff:
+                dep.expire_realtime()
                 departures.append(dep)
-        self._departures = departures
+        self._replace_departures(departures, stop_ids)
+        ## Cached departures no longer match the last responses
+        self._discard_digests(stop_ids)
+
+    @property
+    def session(self) -> aiohttp.ClientSession | None:
+        """Return the client session used for requests.
+
+        This is the shared session if configured, otherwise the pooled session
+        created by setup().
+        """
+        if self.use_shared_session and self.shared_session:
+            return self.shared_session
+        return self._session
+
+    async def async_get_timetable(self) -> GTFSStaticTimetable | None:
+        """Return the GTFS static timetable, loading it if the path has changed."""
+        path = self.timetable_path
+        async with self._timetable_lock:
+            timetable = self._timetable
+            if timetable and timetable.zip_path == path:
+                return timetable
+            loop = asyncio.get_running_loop()
+            if timetable:
+                await loop.run_in_executor(None, timetable.close)
+                self._timetable = None
+            if not path or path == self._timetable_failed_path:
+                return None
+            db_path = (
+                get_timetable_db_path(self.timetable_db_dir, path)
+                if self.timetable_db_dir
+                else None
+            )
+            timetable = GTFSStaticTimetable(path, db_path)
+            try:
+                await loop.run_in_executor(None, timetable.load)
+            except Exception as exc:  # pylint: disable=broad-except
+                _LOGGER.error(
+                    "Could not load GTFS timetable %s: %s: %s",
+                    path,
+                    type(exc).__name__,
+                    exc,
+                )
+                self._timetable_failed_path = path
+                return None
+            self._timetable_failed_path = None
+            self._timetable = timetable
+            return timetable
+
+    async def get_timetable_departures(
+        self, stop_ids: list[str], start: float, end: float
+    ) -> list[Departure] | None:
+        """Return scheduled departures from the GTFS static timetable.
+
+        Returns None if no timetable is configured.
+        """
+        if (timetable := await self.async_get_timetable()) is None:
+            return None
+        return await asyncio.get_running_loop().run_in_executor(
+            None, timetable.departures, stop_ids, start, end
+        )
+
+    def _get_timetable_horizon(self) -> float:
+        """Return the epoch time up to which timetable departures are cached."""
+        return (
+            time.time()
+            + (self.cache_horizon or DEFAULT_DEPARTURE_HORIZON).total_seconds()
+        )
+
+    async def update_timetable_departures(
+        self, stop_ids: list[str]
+    ) -> list[Departure] | None:
+        """Replace cached departures for stops with timetable departures.
+
+        Returns None if no timetable is configured.
+        """
+        departures = await self.get_timetable_departures(
+            stop_ids, self._get_departure_cutoff(), self._get_timetable_horizon()
+        )
+        if departures is None:
+            return None
+        self._replace_departures(departures, stop_ids)
+        ## The next live request must not be treated as unchanged
+        self._discard_digests(stop_ids)
+        return departures
+
+    async def _fill_from_timetable(self, stop_ids: list[str]) -> list[Departure] | None:
+        """Fill cached departures for stops with no data from the timetable.
+
+        Cached departures are kept, and timetable departures later than the
+        last cached departure of each stop are added. Returns None if no
+        timetable is configured.
+        """
+        cutoff = self._get_departure_cutoff()
+        scheduled = await self.get_timetable_departures(
+            stop_ids, cutoff, self._get_timetable_horizon()
+        )
+        if scheduled is None:
+            return None
+        self.filter_cached_departures(stop_ids)
+        departures = self._store.for_stops(stop_ids)
+        last_departure: dict[str, int] = {}
+        for dep in departures:
+            last_departure[dep.stop_ref] = dep.departure
+        departures.extend(
+            dep
+            for dep in scheduled
+            if dep.departure > last_departure.get(dep.stop_ref, cutoff - 1)
+        )
+        departures.sort(key=lambda dep: dep.departure)
+        self._replace_departures(departures, stop_ids)
+        return departures
+
+    def snapshot(self) -> dict[str, Any]:
+        """Return cached departures for persistent storage."""
+        return {
+            "saved": int(time.time()),
+            "departures": [dep.as_row() for dep in self._store],
+        }
+
+    def restore(self, snapshot: dict[str, Any]) -> int:
+        """Restore cached departures from a snapshot and discard stale departures.
+
+        Returns the number of departures restored.
+        """
+        try:
+            departures = [Departure.from_row(row) for row in snapshot["departures"]]
+        except (KeyError, TypeError, ValueError) as exc:
+            _LOGGER.warning("Discarding invalid departure cache snapshot: %s", exc)
+            return 0
+        departures.sort(key=lambda dep: dep.departure)
+        self._replace_departures(departures, None)
+        self.filter_cached_departures()
+        return len(self._store)
 
     async def update_departures(
         self,
         stop_ids: list[str],
         departure_time: datetime | None = None,
-    ) -> list[dict[str, Any]] | bool:
-        """Update cached departures."""
-        session = self._session
-        if not session:
+        shard_callback: Callable[[list[str]], None] | None = None,
+    ) -> list[Departure]:
+        """Update cached departures and return departures for stops.
+
+        Stops that are already being requested are not requested again, and
+        the in-flight request is awaited instead. shard_callback is only
+        called for shards requested by this call.
+        """
+        if not self.session:
             raise NotConnected
+        if departure_time is not None:
+            return await self._request_departures(
+                stop_ids, departure_time, shard_callback
+            )
+
+        inflight = self._inflight
+        tasks = {task for stop_id in stop_ids if (task := inflight.get(stop_id))}
+        if tasks:
+            _LOGGER.debug("awaiting in-flight requests for stops %s", stop_ids)
+        if new_stop_ids := list(
+            dict.fromkeys(stop_id for stop_id in stop_ids if stop_id not in inflight)
+        ):
+            task = asyncio.get_running_loop().create_task(
+                self._request_departures(new_stop_ids, None, shard_callback)
+            )
+            task.add_done_callback(partial(self._request_done, new_stop_ids))
+            for stop_id in new_stop_ids:
+                inflight[stop_id] = task
+            tasks.add(task)
+
+        ## Shielded so that a cancelled caller does not cancel shared requests
+        results = await asyncio.gather(*(asyncio.shield(task) for task in tasks))
+        stops = set(stop_ids)
+        departures = [
+            dep for result in results for dep in result if dep.stop_ref in stops
+        ]
+        departures.sort(key=lambda dep: dep.departure)
+        return departures
+
+    def _request_done(self, stop_ids: list[str], task: asyncio.Task) -> None:
+        """Remove completed request from in-flight requests."""
+        for stop_id in stop_ids:
+            if self._inflight.get(stop_id) is task:
+                del self._inflight[stop_id]
+
+    async def _request_departures(
+        self,
+        stop_ids: list[str],
+        departure_time: datetime | None,
+        shard_callback: Callable[[list[str]], None] | None,
+    ) -> list[Departure]:
+        """Request departures for stops and update cached departures.
+
+        If sharding is enabled, stops are fetched in concurrent requests of at
+        most shard_size stops. The cache is updated as each shard arrives, and
+        shard_callback is called with the stop IDs of each completed shard.
+        """
+        session = self.session
+        self._request_seq += 1
+        request_seq = self._request_seq
+
+        ## GTFS-Realtime backend serves all stops from one feed download
+        if self.realtime_feed:
+            if (timetable := await self.async_get_timetable()) is not None:
+                self._realtime_no_timetable_log_msg = False
+                return await self._update_departures_realtime(
+                    stop_ids, timetable, request_seq
+                )
+            if not self._realtime_no_timetable_log_msg:
+                _LOGGER.warning(
+                    "GTFS-Realtime feed requires a GTFS timetable, using TFI API"
+                )
+                self._realtime_no_timetable_log_msg = True
 
         now = datetime.now().astimezone(timezone.utc)
         now_str = now.isoformat(timespec="milliseconds")
@@ -173,22 +566,6 @@ class TFIData:
         departure_utc = departure_time.astimezone(timezone.utc)
         departure_str = departure_utc.isoformat(timespec="milliseconds")
 
-        def parse_departure(dep: dict[str, Any]) -> None:
-            """Parse departure information."""
-            dep_rt_str = dep.get("realTimeDeparture")
-            dep["realTimeDeparture"] = (
-                dep_rt := datetime.fromisoformat(dep_rt_str).astimezone()
-                if dep_rt_str
-                else None
-            )
-            dep_sch_str = dep.get("scheduledDeparture")
-            dep["scheduledDeparture"] = (
-                dep_sch := datetime.fromisoformat(dep_sch_str).astimezone()
-                if dep_sch_str
-                else None
-            )
-            dep["departure"] = dep_rt if dep_rt is not None else dep_sch
-
         tzoffset = -int(datetime.now().astimezone().utcoffset().total_seconds()) * 1000
         post_data = {
             "clientTimeZoneOffsetInMS": tzoffset,
@@ -202,13 +579,231 @@ class TFIData:
             "refresh": True,
         }
 
-        data: dict[str, Any] = {}
+        shard_size = self.shard_size or max(len(stop_ids), 1)
+        shards = [
+            stop_ids[i : i + shard_size] for i in range(0, len(stop_ids), shard_size)
+        ]
+        semaphore = asyncio.Semaphore(max(self.shard_concurrency, 1))
+
+        async def fetch_shard(
+            shard: list[str],
+        ) -> tuple[list[str], list[Departure] | None, bool, int]:
+            """Fetch departures for a shard of stops."""
+            async with semaphore:
+                return shard, *await self._fetch_departures(
+                    session, {**post_data, "stopIds": shard}
+                )
+
+        departures = []
+        for shard_result in asyncio.as_completed([fetch_shard(s) for s in shards]):
+            requested, shard_departures, unchanged, response_bytes = await shard_result
+            shard, stale_departures = self._claim_stops(requested, request_seq)
+            departures.extend(stale_departures)
+            if not shard:
+                continue
+            ## Departures of stops claimed by later requests must not replace
+            ## their results, even if those stops have no departures
+            if len(shard) < len(requested) and shard_departures is not None:
+                stops = set(shard)
+                shard_departures = [
+                    dep for dep in shard_departures if dep.stop_ref in stops
+                ]
+            if unchanged:
+                _LOGGER.debug("departures unchanged for stops %s", shard)
+                self._mark_fetched(shard)
+                departures.extend(self._get_current_departures(shard))
+                continue
+            if shard_departures is None:
+                if (filled := await self._fill_from_timetable(shard)) is not None:
+                    _LOGGER.debug("no departures retrieved, using GTFS timetable")
+                    departures.extend(filled)
+                    if shard_callback and len(shards) > 1:
+                        shard_callback(shard)
+                    continue
+            if shard_departures is not None and self._use_executor(response_bytes):
+                departures.extend(
+                    await self._async_update_shard(shard, shard_departures, request_seq)
+                )
+            else:
+                departures.extend(self._update_shard(shard, shard_departures))
+            if shard_departures is not None:
+                self._mark_fetched(shard)
+            if shard_callback and len(shards) > 1:
+                shard_callback(shard)
+        departures.sort(key=lambda dep: dep.departure)
+        return departures
+
+    async def _update_departures_realtime(
+        self, stop_ids: list[str], timetable: GTFSStaticTimetable, request_seq: int
+    ) -> list[Departure]:
+        """Update cached departures from the GTFS-Realtime trip updates feed.
+
+        Scheduled departures from the timetable are joined with the trip
+        updates. Late departures scheduled before the cut-off are included.
+        """
+        trip_updates = await self._fetch_trip_updates()
+        if trip_updates is None:
+            stop_ids, stale_departures = self._claim_stops(stop_ids, request_seq)
+            return stale_departures + (await self._fill_from_timetable(stop_ids) or [])
+
+        cutoff = self._get_departure_cutoff()
+        horizon = self._get_timetable_horizon()
+        stop_times = await asyncio.get_running_loop().run_in_executor(
+            None,
+            timetable.scheduled_stop_times,
+            stop_ids,
+            cutoff - DEFAULT_GTFS_REALTIME_MAX_DELAY.total_seconds(),
+            horizon,
+        )
+        stop_ids, stale_departures = self._claim_stops(stop_ids, request_seq)
+        stops = set(stop_ids)
+        departures = [
+            dep
+            for dep in join_trip_updates(stop_times, trip_updates)
+            if cutoff <= dep.departure <= horizon and dep.stop_ref in stops
+        ]
+        departures.sort(key=lambda dep: dep.departure)
+        self._replace_departures(departures, stop_ids)
+        self._mark_fetched(stop_ids)
+        return departures + stale_departures
+
+    async def _fetch_trip_updates(self) -> dict[str, TripUpdate] | None:
+        """Fetch and decode the GTFS-Realtime trip updates feed.
+
+        The feed is a URL or a local file. Feeds downloaded within the
+        minimum interval are reused, and unchanged feeds are not decoded
+        again. Returns None if the feed could not be retrieved.
+        """
+        async with self._trip_updates_lock:
+            if (
+                self._trip_updates is not None
+                and time.monotonic() - self._trip_updates_fetched
+                < DEFAULT_GTFS_REALTIME_MIN_INTERVAL.total_seconds()
+            ):
+                return self._trip_updates
+
+            source = self.realtime_feed
+            loop = asyncio.get_running_loop()
+            try:
+                if source.startswith(("http://", "https://")):
+                    headers = (
+                        {"x-api-key": self.realtime_api_key}
+                        if self.realtime_api_key
+                        else None
+                    )
+                    async with self.session.get(
+                        source, headers=headers, timeout=self._timeout
+                    ) as resp:
+                        resp.raise_for_status()
+                        data = await resp.read()
+                else:
+                    path = source.removeprefix("file://")
+                    data = await loop.run_in_executor(None, _read_file, path)
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as exc:
+                if not self._realtime_failed_log_msg:
+                    _LOGGER.warning(
+                        "could not retrieve GTFS-Realtime feed: %s", str(exc)
+                    )
+                    self._realtime_failed_log_msg = True
+                return None
+            self._realtime_failed_log_msg = False
+
+            digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+            if digest != self._trip_updates_digest:
+                try:
+                    trip_updates = await loop.run_in_executor(
+                        None, parse_trip_updates, data
+                    )
+                except Exception as exc:  # pylint: disable=broad-except
+                    if not self._realtime_bad_response_log_msg:
+                        _LOGGER.warning(
+                            "invalid GTFS-Realtime feed: %s: %s",
+                            type(exc).__name__,
+                            str(exc),
+                        )
+                        self._realtime_bad_response_log_msg = True
+                    return None
+                self._realtime_bad_response_log_msg = False
+                self._trip_updates = trip_updates
+                self._trip_updates_digest = digest
+                _LOGGER.debug("decoded %d trip updates", len(trip_updates))
+            self._trip_updates_fetched = time.monotonic()
+            return self._trip_updates
+
+    async def _fetch_departures(
+        self, session: aiohttp.ClientSession, post_data: dict[str, Any]
+    ) -> tuple[list[Departure] | None, bool, int]:
+        """Fetch departures from TFI API.
+
+        Returns the retrieved departures within the cache cut-off and horizon,
+        or None if no departures were retrieved, whether the response is
+        unchanged since the last request for the same stops, and the response
+        size. Responses of at least executor_threshold KiB are decoded in an
+        executor thread instead of incrementally. Unchanged
+        responses are detected by the ETag and Last-Modified validators if
+        provided, otherwise by a digest of the response body, and are not
+        parsed where possible. No request is sent while the circuit breaker
+        is open. Request latency, response size and parse time are recorded
+        in the API metrics.
+        """
+        key = tuple(post_data["stopIds"])
+        departures = None
+        unchanged = False
+        circuit_breaker = self.circuit_breaker
+        if not circuit_breaker.allow_request():
+            _LOGGER.debug("circuit open, skipping request for stops %s", key)
+            return departures, unchanged, 0
+        failed = True
+        cancelled = False
+        response_bytes = 0
+        start = time.perf_counter()
         try:
-            async with session.post(TFI_DEPARTURES_API, json=post_data) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
+            ## Headers and timeout are set per request as the session is shared
+            async with session.post(
+                self.api_url,
+                json=post_data,
+                headers={**TFI_DEFAULT_HEADERS, **self._validators.get(key, {})},
+                timeout=self._timeout,
+            ) as resp:
+                if resp.status == 304:
+                    unchanged = True
+                    failed = False
+                elif resp.status == 200:
+                    digest = hashlib.blake2b(digest_size=16)
+                    if self.stream_decode and not self._use_executor(
+                        resp.content_length or 0
+                    ):
+                        (
+                            departures,
+                            response_bytes,
+                            parse_ms,
+                            parsed,
+                        ) = await self._decode_departures_stream(resp, digest)
+                        unchanged = self._digests.get(key) == digest.hexdigest()
+                        if parsed:
+                            self.metrics.record_parse(
+                                post_data["stopIds"], parse_ms, parsed, departures
+                            )
+                    else:
+                        body = await resp.read()
+                        response_bytes = len(body)
+                        digest.update(body)
+                        unchanged = self._digests.get(key) == digest.hexdigest()
+                        if not unchanged:
+                            (
+                                departures,
+                                parse_ms,
+                                parsed,
+                            ) = await self._async_decode_departures(body)
+                            if parsed:
+                                self.metrics.record_parse(
+                                    post_data["stopIds"], parse_ms, parsed, departures
+                                )
+                    self._digests[key] = digest.hexdigest()
+                    self._update_validators(key, resp)
                     self._connect_failed_log_msg = False
                     self._bad_response_log_msg = False
+                    failed = False
                 else:
                     if not self._bad_response_log_msg:
                         _LOGGER.warning(
@@ -216,14 +811,136 @@ class TFIData:
                             resp.status,
                         )
                         self._bad_response_log_msg = True
-        except (aiohttp.ClientConnectionError, aiohttp.ClientResponseError) as exc:
+        except aiohttp.ClientError as exc:
             if not self._connect_failed_log_msg:
                 _LOGGER.warning("could not connect to TFI API: %s", str(exc))
                 self._connect_failed_log_msg = True
+        except asyncio.TimeoutError:
+            if not self._connect_failed_log_msg:
+                _LOGGER.warning("timed out waiting for TFI API")
+                self._connect_failed_log_msg = True
+        except ValueError as exc:
+            if not self._bad_response_log_msg:
+                _LOGGER.warning("invalid response from TFI API: %s", str(exc))
+                self._bad_response_log_msg = True
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            ## Any other exit must settle the circuit breaker, or a half-open
+            ## probe that raised would block requests indefinitely
+            if cancelled:
+                circuit_breaker.abort_request()
+            else:
+                if failed:
+                    circuit_breaker.record_failure()
+                else:
+                    circuit_breaker.record_success()
+                self.metrics.record_request(
+                    post_data["stopIds"],
+                    elapsed_ms(start),
+                    response_bytes,
+                    failed,
+                    unchanged,
+                )
+        return departures, unchanged, response_bytes
+
+    def _update_validators(
+        self, key: tuple[str, ...], resp: aiohttp.ClientResponse
+    ) -> None:
+        """Save cache validators of response for conditional requests."""
+        validators = {}
+        if etag := resp.headers.get("ETag"):
+            validators["If-None-Match"] = etag
+        if last_modified := resp.headers.get("Last-Modified"):
+            validators["If-Modified-Since"] = last_modified
+        if validators:
+            self._validators[key] = validators
+        else:
+            self._validators.pop(key, None)
+
+    async def _decode_departures_stream(
+        self, resp: aiohttp.ClientResponse, digest: Any
+    ) -> tuple[list[Departure] | None, int, float, int]:
+        """Decode departures incrementally while the response is received.
+
+        The response body is also added to digest as it is received. Returns
+        the departures, the response size, the time spent decoding in
+        milliseconds and the number of departures decoded.
+        """
+        decoder = JSONArrayStreamDecoder("stopDepartures")
+        cutoff = self._get_departure_cutoff()
+        horizon = self._get_departure_horizon()
+        departures = []
+        response_bytes = 0
+        parse_secs = 0.0
+        parsed = 0
+        async for chunk in resp.content.iter_chunked(DEFAULT_STREAM_CHUNK_SIZE):
+            start = time.perf_counter()
+            response_bytes += len(chunk)
+            digest.update(chunk)
+            for dep_raw in decoder.feed(chunk):
+                parsed += 1
+                dep = Departure.from_json(dep_raw)
+                if cutoff <= dep.departure <= horizon:
+                    departures.append(dep)
+            chunk_secs = time.perf_counter() - start
+            self.metrics.loop_blocks.record("decode departures", chunk_secs * 1000)
+            parse_secs += chunk_secs
+        decoder.close()
+        return (
+            departures if parsed else None,
+            response_bytes,
+            parse_secs * 1000,
+            parsed,
+        )
+
+    async def _async_decode_departures(
+        self, body: bytes
+    ) -> tuple[list[Departure] | None, float, int]:
+        """Decode departures from a response body, in an executor if large."""
+        if not self._use_executor(len(body)):
+            result = self._decode_departures(body)
+            self.metrics.loop_blocks.record("decode departures", result[1])
+            return result
+        self.metrics.executor_decodes += 1
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self._decode_departures, body
+        )
+
+    def _decode_departures(
+        self, body: bytes
+    ) -> tuple[list[Departure] | None, float, int]:
+        """Decode departures from a response body.
 
+        Returns the departures, or None if the response has no departures,
+        the time spent decoding in milliseconds and the number of departures
+        decoded. Safe to run in an executor thread.
+        """
+        start = time.perf_counter()
+        data: dict[str, Any] = json.loads(body)
+        if not (deps_raw := data.get("stopDepartures")):
+            return None, elapsed_ms(start), 0
+        departures = self._parse_departures(deps_raw)
+        return departures, elapsed_ms(start), len(deps_raw)
+
+    def _parse_departures(self, deps_raw: Iterable[dict[str, Any]]) -> list[Departure]:
+        """Parse departures within the cache cut-off and horizon."""
+        cutoff = self._get_departure_cutoff()
+        horizon = self._get_departure_horizon()
         departures = []
-        if not (deps_raw := data.get("stopDepartures", [])):
-            if not self._departures:
+        for dep_raw in deps_raw:
+            dep = Departure.from_json(dep_raw)
+            if cutoff <= dep.departure <= horizon:
+                departures.append(dep)
+        return departures
+
+    def _update_shard(
+        self, stop_ids: list[str], departures: list[Departure] | None
+    ) -> list[Departure]:
+        """Update cache for stops with retrieved departures."""
+        if departures is None:
+            if not self._store.stop_ids.intersection(stop_ids):
                 if not self._no_data_log_msg:
                     _LOGGER.warning("no departures retrieved and no cached departures")
                     self._no_data_log_msg = True
@@ -233,13 +950,46 @@ class TFIData:
                     _LOGGER.debug(
                         "no departures retrieved, filtering cached departures"
                     )
-                self.filter_cached_departures()
-        else:
-            self._no_data_log_msg = False
-            self._no_data_filtered_log_msg = False
-            for dep in deps_raw:
-                parse_departure(dep)
-                if self._filter_departure_time(dep):
-                    departures.append(dep)
-            self._departures = departures
+                self.filter_cached_departures(stop_ids)
+            return []
+
+        self._no_data_log_msg = False
+        self._no_data_filtered_log_msg = False
+        self._replace_departures(departures, stop_ids)
         return departures
+
+    async def _async_update_shard(
+        self, stop_ids: list[str], departures: list[Departure], request_seq: int
+    ) -> list[Departure]:
+        """Update cache for stops with retrieved departures in an executor.
+
+        The departure store is rebuilt in a copy that is swapped in if the
+        cache has not changed during the rebuild. Otherwise the rebuild is
+        repeated without the stops claimed by later requests in the meantime.
+        """
+        self._no_data_log_msg = False
+        self._no_data_filtered_log_msg = False
+        loop = asyncio.get_running_loop()
+        stale_departures = []
+        async with self._rebuild_lock:
+            while True:
+                generation = self._generation
+                start = time.perf_counter()
+                store = self._store.copy()
+                self.metrics.loop_blocks.record(
+                    "copy departure cache", elapsed_ms(start)
+                )
+                await loop.run_in_executor(None, store.replace, departures, stop_ids)
+                if self._generation == generation:
+                    break
+                _LOGGER.debug("departure cache changed during rebuild, repeating")
+                claimed, stale = self._claim_stops(stop_ids, request_seq)
+                stale_departures.extend(stale)
+                if len(claimed) < len(stop_ids):
+                    stops = set(claimed)
+                    departures = [dep for dep in departures if dep.stop_ref in stops]
+                stop_ids = claimed
+            self._store = store
+            self._update_stop_versions(stop_ids)
+            self.metrics.executor_rebuilds += 1
+        return departures + stale_departures
@@ -3,10 +3,15 @@
 from __future__ import annotations
 
 from typing import Any
-from datetime import timedelta
+from datetime import datetime, timedelta
+from functools import lru_cache
 import re
 
-from .const import DEFAULTS
+from .const import (
+    DEFAULTS,
+    DEFAULT_DEPARTURE_HORIZON,
+    CONF_DEPARTURE_HORIZON,
+)
 
 
 def get_duration_option(
@@ -25,6 +30,20 @@ def get_duration_option(
     return DEFAULTS.get(opt)
 
 
+def get_departure_horizon(
+    options: dict[str, Any],
+    stop: dict[str, Any],
+) -> timedelta:
+    """Get departure horizon for stop with fallback to entry option."""
+    return get_duration_option(
+        stop,
+        CONF_DEPARTURE_HORIZON,
+        default=get_duration_option(
+            options, CONF_DEPARTURE_HORIZON, default=DEFAULT_DEPARTURE_HORIZON
+        ),
+    )
+
+
 def duration_to_seconds(duration_dict: dict[str, Any]) -> int:
     """Convert duration dict to seconds."""
     return int(timedelta(**duration_dict).total_seconds())
@@ -81,3 +100,19 @@ def timedelta_to_str(tdelta: timedelta) -> str:
         if tdelta.total_seconds() < 0
         else str(tdelta).partition(".")[0]
     )
+
+
+def timestamp_to_datetime(timestamp: float | None) -> datetime | None:
+    """Convert epoch timestamp to local datetime."""
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp).astimezone()
+
+
+@lru_cache(maxsize=4096)
+def iso_to_timestamp(value: str) -> int:
+    """Convert ISO 8601 datetime string to epoch timestamp.
+
+    Departure times repeat across stops and polls, so conversions are cached.
+    """
+    return int(datetime.fromisoformat(value).timestamp())
@@ -0,0 +1,214 @@
+"""TFI Journey Planner websocket API."""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+from datetime import datetime
+import logging
+from typing import Any
+
+import voluptuous as vol
+
+from homeassistant.components import websocket_api
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.event import async_track_time_interval
+
+from .const import (
+    DOMAIN,
+    DATA_HUB,
+    WS_TYPE_SUBSCRIBE_DEPARTURES,
+    CONF_STOP_IDS,
+    CONF_SERVICE_IDS,
+    CONF_DIRECTION,
+    CONF_LIMIT_DEPARTURES,
+    CONF_DEPARTURE_HORIZON,
+    CONF_REALTIME_ONLY,
+    CONF_INCLUDE_CANCELLED,
+    DEFAULT_DEPARTURE_HORIZON,
+    DEFAULT_WS_REFRESH_INTERVAL,
+)
+from .departures import Departure, DepartureFilter
+from .tfi_journeyplanner_api import TFIData
+
+_LOGGER = logging.getLogger(__name__)
+
+## Columns of the departure rows sent to subscribers, times are epoch seconds
+DEPARTURE_COLUMNS = (
+    "key",
+    "stopRef",
+    "serviceNumber",
+    "serviceDirection",
+    "destination",
+    "scheduledDeparture",
+    "realTimeDeparture",
+    "cancelled",
+)
+
+
+def departure_key(dep: Departure) -> str:
+    """Return the key identifying a departure in diffs.
+
+    Departures with the same key in a refresh are told apart by an ordinal
+    suffix, in the order of their departure times.
+    """
+    return f"{dep.stop_ref}/{dep.service}/{dep.direction}/{dep.scheduled}"
+
+
+class DepartureSubscription:
+    """Departures matching a filter, sent as diffs when they change.
+
+    The first message has the departure row columns and all matching
+    departures as added rows. Later messages only have the non-empty lists
+    of added and changed rows and removed keys. Cache changes in the same
+    event loop iteration are sent as one diff, and departures are also
+    compared periodically to remove departures that have left the window.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        tfi_data: TFIData,
+        spec: DepartureFilter,
+        send: Callable[[dict[str, Any]], None],
+    ) -> None:
+        """Initialise departure subscription."""
+        self._hass = hass
+        self._tfi_data = tfi_data
+        self._spec = spec
+        self._send = send
+        self._rows: dict[str, list[Any]] = {}
+        self._refresh_scheduled = False
+        self._unsubs: list[CALLBACK_TYPE] = []
+
+    @callback
+    def async_start(self) -> None:
+        """Send matching departures and subscribe to cache changes."""
+        self._unsubs = [
+            self._tfi_data.add_listener(self._async_cache_changed),
+            async_track_time_interval(
+                self._hass, self._async_refresh, DEFAULT_WS_REFRESH_INTERVAL
+            ),
+        ]
+        self._send({"columns": DEPARTURE_COLUMNS, **self._diff()})
+
+    @callback
+    def async_stop(self) -> None:
+        """Unsubscribe from cache changes."""
+        for unsub in self._unsubs:
+            unsub()
+        self._unsubs = []
+
+    @callback
+    def _async_cache_changed(self, stop_ids: list[str] | None) -> None:
+        """Schedule a diff if departures of subscribed stops changed."""
+        if self._refresh_scheduled or (
+            stop_ids is not None and self._spec.stop_ids.isdisjoint(stop_ids)
+        ):
+            return
+        self._refresh_scheduled = True
+        self._hass.loop.call_soon(self._async_refresh)
+
+    @callback
+    def _async_refresh(self, _now: datetime | None = None) -> None:
+        """Send changes to matching departures."""
+        self._refresh_scheduled = False
+        if self._unsubs and (diff := self._diff()):
+            self._send(diff)
+
+    def _diff(self) -> dict[str, list[Any]]:
+        """Return changes to matching departures since the last diff."""
+        rows = {}
+        seen: dict[str, int] = {}
+        for dep in self._tfi_data.get_departures_for_filter(self._spec):
+            key = departure_key(dep)
+            ## Trips of a service can share a scheduled time at a stop
+            if count := seen.get(key, 0):
+                seen[key] = count + 1
+                key = f"{key}/{count}"
+            else:
+                seen[key] = 1
+            rows[key] = [key, *dep.as_row()]
+        last_rows = self._rows
+        self._rows = rows
+        diff = {}
+        if added := [row for key, row in rows.items() if key not in last_rows]:
+            diff["added"] = added
+        if changed := [
+            row
+            for key, row in rows.items()
+            if key in last_rows and last_rows[key] != row
+        ]:
+            diff["changed"] = changed
+        if removed := [key for key in last_rows if key not in rows]:
+            diff["removed"] = removed
+        return diff
+
+
+@callback
+def async_setup_websocket_api(hass: HomeAssistant) -> None:
+    """Register websocket API commands."""
+    websocket_api.async_register_command(hass, websocket_subscribe_departures)
+
+
+@websocket_api.websocket_command(
+    {
+        vol.Required("type"): WS_TYPE_SUBSCRIBE_DEPARTURES,
+        vol.Required(CONF_STOP_IDS): vol.All(cv.ensure_list, [cv.string]),
+        vol.Optional(CONF_SERVICE_IDS): vol.All(cv.ensure_list, [cv.string]),
+        vol.Optional(CONF_DIRECTION): vol.All(cv.ensure_list, [cv.string]),
+        vol.Optional(CONF_LIMIT_DEPARTURES): vol.All(vol.Coerce(int), vol.Range(min=0)),
+        vol.Optional(
+            CONF_DEPARTURE_HORIZON, default=DEFAULT_DEPARTURE_HORIZON
+        ): cv.positive_time_period,
+        vol.Optional(CONF_REALTIME_ONLY, default=False): cv.boolean,
+        vol.Optional(CONF_INCLUDE_CANCELLED, default=False): cv.boolean,
+    }
+)
+@callback
+def websocket_subscribe_departures(
+    hass: HomeAssistant,
+    connection: websocket_api.ActiveConnection,
+    msg: dict[str, Any],
+) -> None:
+    """Subscribe to diffs of cached departures matching a filter."""
+    msg_id = msg["id"]
+    if (hub := hass.data.get(DOMAIN, {}).get(DATA_HUB)) is None:
+        connection.send_error(
+            msg_id, websocket_api.ERR_NOT_FOUND, "TFI Journey Planner is not set up"
+        )
+        return
+
+    spec = DepartureFilter.create(
+        msg[CONF_STOP_IDS],
+        service_ids=msg.get(CONF_SERVICE_IDS),
+        direction=msg.get(CONF_DIRECTION),
+        limit_departures=msg.get(CONF_LIMIT_DEPARTURES),
+        departure_horizon=msg[CONF_DEPARTURE_HORIZON],
+        realtime_only=msg[CONF_REALTIME_ONLY],
+        include_cancelled=msg[CONF_INCLUDE_CANCELLED],
+    )
+    subscription = DepartureSubscription(
+        hass,
+        hub.tfi_data,
+        spec,
+        lambda diff: connection.send_message(websocket_api.event_message(msg_id, diff)),
+    )
+
+    @callback
+    def async_unsubscribe() -> None:
+        """Stop the subscription when the client unsubscribes."""
+        remove_cleanup()
+        subscription.async_stop()
+
+    @callback
+    def async_hub_cleanup() -> None:
+        """End the subscription when the hub is cleaned up."""
+        connection.subscriptions.pop(msg_id, None)
+        subscription.async_stop()
+
+    remove_cleanup = hub.async_on_cleanup(async_hub_cleanup)
+    connection.subscriptions[msg_id] = async_unsubscribe
+    connection.send_result(msg_id)
+    _LOGGER.debug("subscribed to departures for stops %s", msg[CONF_STOP_IDS])
+    subscription.async_start()
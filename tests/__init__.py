@@ -0,0 +1 @@
+"""Tests for the TFI Journey Planner integration."""
@@ -0,0 +1,13 @@
+
+
+2.0Ϫ
+1
+	
+delayedx
+2
+
+	cancelled "
+3
+	
+skipped(
+Ϫ
\ No newline at end of file
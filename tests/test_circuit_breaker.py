@@ -0,0 +1,103 @@
+"""Tests for the TFI Journey Planner API circuit breaker."""
+
+from __future__ import annotations
+
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from custom_components.tfi_journeyplanner import circuit_breaker
+from custom_components.tfi_journeyplanner.circuit_breaker import (
+    STATE_CLOSED,
+    STATE_HALF_OPEN,
+    STATE_OPEN,
+    CircuitBreaker,
+)
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> SimpleNamespace:
+    """Replace the monotonic clock of the circuit breaker."""
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(
+        circuit_breaker, "time", SimpleNamespace(monotonic=lambda: clock.now)
+    )
+    return clock
+
+
+def make_breaker() -> CircuitBreaker:
+    """Return a circuit breaker without jitter."""
+    return CircuitBreaker(
+        failure_threshold=3,
+        backoff_initial=timedelta(seconds=10),
+        backoff_max=timedelta(seconds=30),
+        jitter=0,
+    )
+
+
+def open_breaker(breaker: CircuitBreaker) -> None:
+    """Fail requests until the circuit opens."""
+    for _ in range(breaker.failure_threshold):
+        assert breaker.allow_request()
+        breaker.record_failure()
+
+
+def test_opens_after_consecutive_failures(clock: SimpleNamespace) -> None:
+    """Test the circuit opens after the failure threshold."""
+    breaker = make_breaker()
+
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == STATE_CLOSED
+    assert breaker.retry_in is None
+
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+    assert breaker.retry_in == 10
+    assert not breaker.allow_request()
+
+
+def test_single_probe_when_half_open(clock: SimpleNamespace) -> None:
+    """Test only one probe request is allowed once the backoff has elapsed."""
+    breaker = make_breaker()
+    open_breaker(breaker)
+
+    clock.now += 10
+    assert breaker.allow_request()
+    assert breaker.state == STATE_HALF_OPEN
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == STATE_CLOSED
+    assert breaker.failures == 0
+    assert breaker.allow_request()
+
+
+def test_failed_probe_doubles_backoff(clock: SimpleNamespace) -> None:
+    """Test failed probes reopen the circuit with a doubled, capped backoff."""
+    breaker = make_breaker()
+    open_breaker(breaker)
+
+    for backoff in (20, 30, 30):
+        clock.now += breaker.retry_in
+        assert breaker.allow_request()
+        breaker.record_failure()
+        assert breaker.state == STATE_OPEN
+        assert breaker.retry_in == backoff
+
+
+def test_aborted_probe_allows_another_probe(clock: SimpleNamespace) -> None:
+    """Test an abandoned probe request does not block later probes."""
+    breaker = make_breaker()
+    open_breaker(breaker)
+
+    clock.now += 10
+    assert breaker.allow_request()
+    breaker.abort_request()
+    assert breaker.state == STATE_OPEN
+    assert breaker.allow_request()
+    assert breaker.state == STATE_HALF_OPEN
@@ -0,0 +1,168 @@
+"""Tests for the TFI Journey Planner departure store."""
+
+from __future__ import annotations
+
+from datetime import timedelta
+
+from custom_components.tfi_journeyplanner.departures import (
+    Departure,
+    DepartureFilter,
+    DepartureStore,
+)
+
+NOW = 1700000000
+
+
+def make_departure(
+    stop_ref: str,
+    service: str,
+    direction: str,
+    offset: int,
+    realtime: bool = False,
+    cancelled: bool = False,
+) -> Departure:
+    """Return a departure scheduled offset seconds from NOW."""
+    return Departure(
+        stop_ref,
+        service,
+        direction,
+        "Destination",
+        NOW + offset,
+        NOW + offset + 60 if realtime else None,
+        cancelled,
+    )
+
+
+DEPARTURES = [
+    make_departure("A", "1", "OUTBOUND", 300),
+    make_departure("A", "1", "INBOUND", 600, realtime=True),
+    make_departure("A", "2", "OUTBOUND", 900, cancelled=True),
+    make_departure("A", "2", "INBOUND", 1200),
+    make_departure("B", "1", "OUTBOUND", 450, realtime=True),
+    make_departure("B", "3", "OUTBOUND", 3600),
+]
+
+
+def keys(departures: list[Departure]) -> list[tuple[str, str, str, int]]:
+    """Return stop, service, direction and departure time of departures."""
+    return [
+        (dep.stop_ref, dep.service, dep.direction, dep.departure - NOW)
+        for dep in departures
+    ]
+
+
+def make_store() -> DepartureStore:
+    """Return a store with the test departures."""
+    store = DepartureStore()
+    store.replace(DEPARTURES)
+    return store
+
+
+def test_departures_sorted_by_departure_time() -> None:
+    """Test departures of all stops are merged by departure time."""
+    store = make_store()
+
+    assert [dep.departure - NOW for dep in store.departures] == [
+        300,
+        510,
+        660,
+        900,
+        1200,
+        3600,
+    ]
+    assert store.stop_ids == {"A", "B"}
+    assert keys(store.for_stops(["B", "A", "B"])) == keys(store.departures)
+
+
+def test_query_time_window_is_inclusive() -> None:
+    """Test departures at the start and end of the window are included."""
+    store = make_store()
+
+    assert keys(store.query(["A"], NOW + 300, NOW + 900, include_cancelled=True)) == [
+        ("A", "1", "OUTBOUND", 300),
+        ("A", "1", "INBOUND", 660),
+        ("A", "2", "OUTBOUND", 900),
+    ]
+
+
+def test_query_filters() -> None:
+    """Test service, direction, real-time and cancelled filters."""
+    store = make_store()
+    end = NOW + 7200
+
+    assert keys(store.query(["A", "B"], NOW, end, service_ids=["1"])) == [
+        ("A", "1", "OUTBOUND", 300),
+        ("B", "1", "OUTBOUND", 510),
+        ("A", "1", "INBOUND", 660),
+    ]
+    assert keys(store.query(["A"], NOW, end, direction=["INBOUND"])) == [
+        ("A", "1", "INBOUND", 660),
+        ("A", "2", "INBOUND", 1200),
+    ]
+    assert keys(
+        store.query(["A"], NOW, end, service_ids=["1", "2"], direction=["OUTBOUND"])
+    ) == [("A", "1", "OUTBOUND", 300)]
+    assert keys(store.query(["A", "B"], NOW, end, realtime_only=True)) == [
+        ("B", "1", "OUTBOUND", 510),
+        ("A", "1", "INBOUND", 660),
+    ]
+    assert ("A", "2", "OUTBOUND", 900) not in keys(store.query(["A"], NOW, end))
+    assert ("A", "2", "OUTBOUND", 900) in keys(
+        store.query(["A"], NOW, end, include_cancelled=True)
+    )
+
+
+def test_query_limit_applies_after_filters() -> None:
+    """Test the departure limit counts matching departures only."""
+    store = make_store()
+
+    assert keys(
+        store.query(["A", "B"], NOW, NOW + 7200, realtime_only=True, limit_departures=1)
+    ) == [("B", "1", "OUTBOUND", 510)]
+    assert store.query(["C"], NOW, NOW + 7200) == []
+
+
+def test_evaluate_filter() -> None:
+    """Test evaluating a compiled filter from a time."""
+    store = make_store()
+    spec = DepartureFilter.create(
+        ["A", "B"],
+        service_ids=["1", "3"],
+        departure_horizon=timedelta(minutes=20),
+    )
+
+    assert keys(store.evaluate(spec, NOW + 400)) == [
+        ("B", "1", "OUTBOUND", 510),
+        ("A", "1", "INBOUND", 660),
+    ]
+    assert DepartureFilter.create(["A"], service_ids=[]) == DepartureFilter.create(
+        ["A"]
+    )
+
+
+def test_replace_stops_keeps_other_stops() -> None:
+    """Test replacing departures of some stops keeps the other stops."""
+    store = make_store()
+
+    store.replace([make_departure("B", "4", "INBOUND", 100)], ["B"])
+
+    assert keys(store.for_stops(["B"])) == [("B", "4", "INBOUND", 100)]
+    assert len(store.for_stops(["A"])) == 4
+    assert store.query(["B"], NOW, NOW + 7200, service_ids=["1"]) == []
+
+    store.replace([], ["A"])
+
+    assert store.stop_ids == {"B"}
+    assert store.query(["A"], NOW, NOW + 7200, direction=["INBOUND"]) == []
+
+
+def test_copy_is_independent() -> None:
+    """Test replacing departures in a copy does not change the original."""
+    store = make_store()
+    copy = store.copy()
+
+    copy.replace([], ["A"])
+
+    assert copy.stop_ids == {"B"}
+    assert store.stop_ids == {"A", "B"}
+    assert len(store) == len(DEPARTURES)
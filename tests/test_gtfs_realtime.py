@@ -0,0 +1,81 @@
+"""Tests for the TFI Journey Planner GTFS-Realtime trip updates."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+from custom_components.tfi_journeyplanner.gtfs import ScheduledStopTime
+from custom_components.tfi_journeyplanner.gtfs_realtime import (
+    join_trip_updates,
+    parse_trip_updates,
+)
+from custom_components.tfi_journeyplanner.tfi_journeyplanner_api import TFIData
+
+## Trip "delayed" is 120s late from stop 2, trip "cancelled" is cancelled and
+## trip "skipped" skips stop 2 and departs stop 3 at 1700003700
+FEED_PATH = Path(__file__).parent / "fixtures" / "trip_updates.pb"
+SCHEDULED = 1700000000
+
+
+def stop_times(trip_id: str) -> list[ScheduledStopTime]:
+    """Return scheduled stop times of a trip calling at three stops."""
+    return [
+        ScheduledStopTime(
+            f"stop{seq}", trip_id, seq, SCHEDULED + seq * 600, "1", "OUTBOUND", None
+        )
+        for seq in (1, 2, 3)
+    ]
+
+
+def test_parse_trip_updates() -> None:
+    """Test decoding trip updates from a feed."""
+    trip_updates = parse_trip_updates(FEED_PATH.read_bytes())
+
+    assert set(trip_updates) == {"delayed", "cancelled", "skipped"}
+    assert trip_updates["cancelled"].cancelled
+    assert trip_updates["delayed"].stop_time_updates[0].delay == 120
+
+
+def test_delay_propagates_to_later_stops() -> None:
+    """Test a delay applies to its stop and later stops without updates."""
+    trip_updates = parse_trip_updates(FEED_PATH.read_bytes())
+    departures = join_trip_updates(stop_times("delayed"), trip_updates)
+
+    assert [dep.realtime for dep in departures] == [
+        None,
+        SCHEDULED + 1200 + 120,
+        SCHEDULED + 1800 + 120,
+    ]
+    assert not any(dep.cancelled for dep in departures)
+
+
+def test_cancelled_trip_and_skipped_stop() -> None:
+    """Test cancelled trips and skipped stops are cancelled departures."""
+    trip_updates = parse_trip_updates(FEED_PATH.read_bytes())
+    cancelled = join_trip_updates(stop_times("cancelled"), trip_updates)
+    skipped = join_trip_updates(stop_times("skipped"), trip_updates)
+
+    assert all(dep.cancelled for dep in cancelled)
+    assert [dep.cancelled for dep in skipped] == [False, True, False]
+    assert skipped[2].realtime == 1700003700
+    assert skipped[2].departure == 1700003700
+
+
+def test_no_trip_update_is_scheduled() -> None:
+    """Test trips without trip updates keep their scheduled departures."""
+    departures = join_trip_updates(stop_times("unknown"), {})
+
+    assert [dep.departure for dep in departures] == [
+        stop_time.departure for stop_time in stop_times("unknown")
+    ]
+    assert all(dep.realtime is None for dep in departures)
+
+
+async def test_fetch_trip_updates_from_file() -> None:
+    """Test the feed can be read from a local file."""
+    tfi_data = TFIData(realtime_feed=f"file://{FEED_PATH}")
+
+    trip_updates = await tfi_data._fetch_trip_updates()
+
+    assert trip_updates is not None
+    assert set(trip_updates) == {"delayed", "cancelled", "skipped"}
@@ -0,0 +1,183 @@
+"""Tests for the TFI Journey Planner local journey search."""
+
+from __future__ import annotations
+
+from collections.abc import Iterator
+import csv
+from datetime import date, timedelta
+import io
+from pathlib import Path
+import zipfile
+
+import pytest
+
+from custom_components.tfi_journeyplanner.departures import Departure
+from custom_components.tfi_journeyplanner.gtfs import GTFSStaticTimetable
+from custom_components.tfi_journeyplanner.journey import TransitIndex
+
+DAY = date(2024, 3, 4)
+
+## Route 1 runs S1 - S2 - S3 and route 2 runs S3 - S4, both half-hourly.
+## Stops are kilometres apart so journeys cannot walk between them.
+STOPS = [
+    ("S1", "Stop 1", "53.30", "-6.20"),
+    ("S2", "Stop 2", "53.35", "-6.20"),
+    ("S3", "Stop 3", "53.40", "-6.20"),
+    ("S4", "Stop 4", "53.45", "-6.20"),
+]
+TRIPS = [
+    ("1", "08:00", ["S1", "S2", "S3"]),
+    ("1", "08:30", ["S1", "S2", "S3"]),
+    ("2", "08:25", ["S3", "S4"]),
+    ("2", "08:55", ["S3", "S4"]),
+]
+
+
+def write_csv(zf: zipfile.ZipFile, name: str, rows: list[tuple]) -> None:
+    """Write rows to a CSV file in a zip."""
+    text = io.StringIO()
+    csv.writer(text).writerows(rows)
+    zf.writestr(name, text.getvalue())
+
+
+def secs(time_str: str) -> int:
+    """Return seconds of a HH:MM time."""
+    hours, minutes = time_str.split(":")
+    return int(hours) * 3600 + int(minutes) * 60
+
+
+@pytest.fixture
+def index(tmp_path: Path) -> Iterator[TransitIndex]:
+    """Return a transit index of a small timetable."""
+    zip_path = tmp_path / "gtfs.zip"
+    stop_times = []
+    with zipfile.ZipFile(zip_path, "w") as zf:
+        write_csv(
+            zf,
+            "agency.txt",
+            [
+                ("agency_id", "agency_name", "agency_url", "agency_timezone"),
+                ("1", "Agency", "https://example.com", "Europe/Dublin"),
+            ],
+        )
+        write_csv(
+            zf,
+            "routes.txt",
+            [("route_id", "route_short_name"), ("1", "1"), ("2", "2")],
+        )
+        write_csv(
+            zf,
+            "trips.txt",
+            [("route_id", "service_id", "trip_id", "trip_headsign", "direction_id")]
+            + [
+                (route, "WEEK", f"{route}.{start}", stops[-1], "0")
+                for route, start, stops in TRIPS
+            ],
+        )
+        write_csv(
+            zf, "stops.txt", [("stop_id", "stop_name", "stop_lat", "stop_lon")] + STOPS
+        )
+        for route, start, stops in TRIPS:
+            for sequence, stop_id in enumerate(stops):
+                time_secs = secs(start) + sequence * 600
+                time_str = f"{time_secs // 3600:02d}:{time_secs // 60 % 60:02d}:00"
+                stop_times.append(
+                    (f"{route}.{start}", time_str, time_str, stop_id, sequence + 1)
+                )
+        write_csv(
+            zf,
+            "stop_times.txt",
+            [("trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence")]
+            + stop_times,
+        )
+        write_csv(
+            zf,
+            "calendar.txt",
+            [
+                (
+                    "service_id",
+                    "monday",
+                    "tuesday",
+                    "wednesday",
+                    "thursday",
+                    "friday",
+                    "saturday",
+                    "sunday",
+                    "start_date",
+                    "end_date",
+                ),
+                ("WEEK", "1", "1", "1", "1", "1", "0", "0", "20240101", "20241231"),
+            ],
+        )
+    timetable = GTFSStaticTimetable(str(zip_path))
+    timetable.load()
+    try:
+        yield TransitIndex.build(timetable, DAY)
+    finally:
+        timetable.close()
+
+
+def test_index(index: TransitIndex) -> None:
+    """Test the index has the stops, routes and trips of the day."""
+    assert sorted(index.stop_ids) == ["S1", "S2", "S3", "S4"]
+    assert index.route_count == 2
+    assert len(index.trip_ids) == 4
+    assert index.stop_names["S4"] == "Stop 4"
+
+
+def test_search_with_transfer(index: TransitIndex) -> None:
+    """Test the earliest journey changes between routes."""
+    journeys = index.search(["S1"], ["S4"], index.base + secs("07:55"))
+
+    assert len(journeys) == 1
+    journey = journeys[0]
+    assert journey.transfers == 1
+    assert journey.arrival == index.base + secs("08:35")
+    assert [(leg.from_stop, leg.to_stop, leg.service) for leg in journey.legs] == [
+        ("S1", "S3", "1"),
+        ("S3", "S4", "2"),
+    ]
+
+
+def test_search_direct_and_unreachable(index: TransitIndex) -> None:
+    """Test journeys without transfers and stops that cannot be reached."""
+    journeys = index.search(["S1"], ["S2"], index.base + secs("08:05"))
+
+    assert [journey.transfers for journey in journeys] == [0]
+    assert journeys[0].departure == index.base + secs("08:30")
+    assert index.search(["S3"], ["S1"], index.base + secs("08:00")) == []
+    with pytest.raises(ValueError):
+        index.search(["S1"], ["unknown"], index.base)
+
+
+def test_search_with_cancelled_trip(index: TransitIndex) -> None:
+    """Test journeys avoid trips cancelled in real-time departures."""
+    cancelled = Departure(
+        "S3", "2", "OUTBOUND", "S4", index.base + secs("08:25"), None, True
+    )
+    journeys = index.search(
+        ["S1"], ["S4"], index.base + secs("07:55"), index.patch([cancelled])
+    )
+
+    assert journeys[0].arrival == index.base + secs("09:05")
+
+
+def test_search_with_delay(index: TransitIndex) -> None:
+    """Test real-time delays are applied to the rest of the trip."""
+    delayed = Departure(
+        "S1",
+        "1",
+        "OUTBOUND",
+        "S3",
+        index.base + secs("08:00"),
+        index.base + secs("08:05"),
+    )
+    journeys = index.search(
+        ["S1"],
+        ["S3"],
+        index.base + secs("07:55"),
+        index.patch([delayed]),
+        max_duration=timedelta(hours=1),
+    )
+
+    assert journeys[0].arrival == index.base + secs("08:25")
@@ -0,0 +1,67 @@
+"""Tests for the TFI Journey Planner incremental JSON array decoder."""
+
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from custom_components.tfi_journeyplanner.json_stream import JSONArrayStreamDecoder
+
+RESPONSE = {
+    "header": {"stopDepartures": "not the array"},
+    "stopDepartures": [
+        {"stopRef": "A", "destination": "Dún Laoghaire"},
+        {"stopRef": "B", "destination": 'Baile Átha Cliath ["quoted"]'},
+        {"stopRef": "C", "nested": {"list": [1, 2, {"deep": []}]}},
+    ],
+    "trailer": [0],
+}
+BODY = json.dumps(RESPONSE, ensure_ascii=False, indent=1).encode()
+
+
+def decode(chunks: list[bytes]) -> list:
+    """Decode the stopDepartures array from chunks of a response body."""
+    decoder = JSONArrayStreamDecoder("stopDepartures")
+    elements = [element for chunk in chunks for element in decoder.feed(chunk)]
+    decoder.close()
+    assert decoder.found
+    assert decoder.done
+    return elements
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, len(BODY)])
+def test_decode_chunks(size: int) -> None:
+    """Test elements are decoded whatever the chunk boundaries."""
+    chunks = [BODY[i : i + size] for i in range(0, len(BODY), size)]
+
+    assert decode(chunks) == RESPONSE["stopDepartures"]
+
+
+def test_elements_yielded_when_complete() -> None:
+    """Test each element is yielded as soon as it has been received."""
+    decoder = JSONArrayStreamDecoder("stopDepartures")
+
+    assert list(decoder.feed(b'{"stopDepartures": [{"a": 1}, {"b"')) == [{"a": 1}]
+    assert list(decoder.feed(b": 2}")) == [{"b": 2}]
+    assert not decoder.done
+    assert list(decoder.feed(b"]}")) == []
+    assert decoder.done
+
+
+def test_missing_array() -> None:
+    """Test a response without the array yields nothing."""
+    decoder = JSONArrayStreamDecoder("stopDepartures")
+
+    assert list(decoder.feed(b'{"errors": []}')) == []
+    decoder.close()
+    assert not decoder.found
+
+
+def test_incomplete_array() -> None:
+    """Test a truncated response raises on close."""
+    decoder = JSONArrayStreamDecoder("stopDepartures")
+    list(decoder.feed(b'{"stopDepartures": [{"a": 1}, {"b": 2'))
+
+    with pytest.raises(ValueError):
+        decoder.close()
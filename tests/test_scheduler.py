@@ -0,0 +1,92 @@
+"""Tests for the TFI Journey Planner per-stop polling scheduler."""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+from custom_components.tfi_journeyplanner.departures import Departure
+from custom_components.tfi_journeyplanner.scheduler import StopScheduler
+
+NOW = datetime(2024, 1, 1, 12, tzinfo=timezone.utc)
+
+
+def make_scheduler() -> StopScheduler:
+    """Return a scheduler with distinct intervals."""
+    return StopScheduler(
+        update_interval=timedelta(minutes=5),
+        update_interval_fast=timedelta(minutes=1),
+        update_interval_no_data=timedelta(minutes=30),
+        update_horizon_fast=timedelta(minutes=10),
+        no_data_threshold=2,
+    )
+
+
+def make_departure(stop_ref: str, minutes: float) -> Departure:
+    """Return a departure from a stop minutes after NOW."""
+    departure = int((NOW + timedelta(minutes=minutes)).timestamp())
+    return Departure(stop_ref, "1", "OUTBOUND", None, departure, None)
+
+
+def test_new_stops_are_due() -> None:
+    """Test new stops are due immediately and removed stops are dropped."""
+    scheduler = make_scheduler()
+    scheduler.set_stops(["A", "B"])
+
+    assert scheduler.due_stops(NOW) == ["A", "B"]
+    assert scheduler.next_update is None
+
+    scheduler.update(["A", "B"], [], NOW)
+    scheduler.set_stops(["B", "C"])
+
+    assert scheduler.stop_ids == ["B", "C"]
+    assert scheduler.due_stops(NOW) == ["C"]
+
+
+def test_interval_from_first_departure() -> None:
+    """Test the update interval follows the first departure of each stop."""
+    scheduler = make_scheduler()
+    scheduler.set_stops(["A", "B", "C"])
+
+    intervals = scheduler.update(
+        ["A", "B", "C"],
+        [make_departure("A", 5), make_departure("B", 12), make_departure("C", 60)],
+        NOW,
+    )
+
+    assert intervals == {
+        "A": timedelta(minutes=1),
+        "B": timedelta(minutes=2),
+        "C": timedelta(minutes=5),
+    }
+    assert scheduler.next_update == NOW + timedelta(minutes=1)
+    assert scheduler.due_stops(NOW + timedelta(minutes=2)) == ["A", "B"]
+
+
+def test_no_data_interval_after_threshold() -> None:
+    """Test stops without departures are polled at the no data interval."""
+    scheduler = make_scheduler()
+    scheduler.set_stops(["A"])
+
+    for _ in range(2):
+        assert scheduler.update(["A"], [], NOW) == {"A": timedelta(minutes=5)}
+    assert scheduler.update(["A"], [], NOW) == {"A": timedelta(minutes=30)}
+    assert scheduler.update(["A"], [make_departure("A", 30)], NOW) == {
+        "A": timedelta(minutes=5)
+    }
+
+
+def test_paused_and_deferred_stops() -> None:
+    """Test paused schedulers have no due stops and deferred stops wait."""
+    scheduler = make_scheduler()
+    scheduler.set_stops(["A", "B"])
+
+    scheduler.paused = True
+    assert scheduler.due_stops(NOW) == []
+    scheduler.paused = False
+
+    scheduler.defer(["A", "unknown"], NOW + timedelta(minutes=10))
+    assert scheduler.due_stops(NOW) == ["B"]
+    assert scheduler.stop_ids == ["A", "B"]
+
+    scheduler.reset()
+    assert scheduler.due_stops(NOW) == ["A", "B"]
@@ -0,0 +1,198 @@
+"""Tests for the TFI Journey Planner API client."""
+
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+import threading
+import time
+from typing import Any
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+import pytest
+
+from custom_components.tfi_journeyplanner.departures import Departure, DepartureStore
+from custom_components.tfi_journeyplanner.tfi_journeyplanner_api import (
+    TFI_DEFAULT_HEADERS,
+    TFIData,
+)
+
+
+def make_departure(stop_ref: str, service: str = "1", offset: int = 600) -> Departure:
+    """Return a departure from a stop scheduled offset seconds from now."""
+    return Departure(
+        stop_ref, service, "OUTBOUND", "Destination", int(time.time()) + offset, None
+    )
+
+
+async def test_out_of_order_response_does_not_replace_newer_empty_result() -> None:
+    """Test a slow response does not replace departures of a later request."""
+    tfi_data = TFIData()
+    fetching = asyncio.Event()
+    release = asyncio.Event()
+
+    async def fetch_departures(
+        _session: Any, post_data: dict[str, Any]
+    ) -> tuple[list[Departure] | None, bool, int]:
+        if post_data["stopIds"] == ["A", "B"]:
+            fetching.set()
+            await release.wait()
+            return [make_departure("A"), make_departure("B")], False, 0
+        return [], False, 0
+
+    tfi_data._fetch_departures = fetch_departures
+    first = asyncio.create_task(tfi_data._request_departures(["A", "B"], None, None))
+    await fetching.wait()
+    assert await tfi_data._request_departures(["B"], None, None) == []
+    release.set()
+    await first
+
+    assert [dep.stop_ref for dep in tfi_data.get_cached_departures(None)] == ["A"]
+
+
+async def test_executor_rebuild_does_not_replace_newer_empty_result() -> None:
+    """Test a rebuild in an executor does not replace a later empty result."""
+    tfi_data = TFIData(executor_threshold=1)
+    rebuilding = asyncio.Event()
+    release = threading.Event()
+
+    async def fetch_departures(
+        _session: Any, post_data: dict[str, Any]
+    ) -> tuple[list[Departure] | None, bool, int]:
+        if post_data["stopIds"] == ["A", "B"]:
+            return [make_departure("A"), make_departure("B")], False, 4096
+        return [], False, 0
+
+    copy = tfi_data._store.copy
+
+    def copy_store() -> DepartureStore:
+        """Hold the first rebuild until the later request has been applied."""
+        store = copy()
+        if not rebuilding.is_set():
+            rebuilding.set()
+            replace = store.replace
+            store.replace = lambda *args: release.wait(5) and replace(*args)
+        return store
+
+    tfi_data._fetch_departures = fetch_departures
+    tfi_data._store.copy = copy_store
+    first = asyncio.create_task(tfi_data._request_departures(["A", "B"], None, None))
+    await rebuilding.wait()
+    assert await tfi_data._request_departures(["B"], None, None) == []
+    release.set()
+    await first
+
+    assert [dep.stop_ref for dep in tfi_data.get_cached_departures(None)] == ["A"]
+    assert tfi_data.metrics.executor_rebuilds == 1
+
+
+async def test_realtime_feed_request_has_no_tfi_headers() -> None:
+    """Test the GTFS-Realtime feed is requested without TFI API headers."""
+    requests = []
+
+    async def feed(request: web.Request) -> web.Response:
+        requests.append(request.headers)
+        return web.Response(body=b"")
+
+    app = web.Application()
+    app.router.add_get("/feed", feed)
+    async with TestServer(app) as server:
+        tfi_data = TFIData(
+            realtime_feed=str(server.make_url("/feed")), realtime_api_key="secret"
+        )
+        await tfi_data.setup()
+        try:
+            assert await tfi_data._fetch_trip_updates() == {}
+        finally:
+            await tfi_data.cleanup()
+
+    assert requests[0]["x-api-key"] == "secret"
+    assert "Ocp-Apim-Subscription-Key" not in requests[0]
+    assert "Origin" not in requests[0]
+    assert requests[0]["User-Agent"] != TFI_DEFAULT_HEADERS["User-Agent"]
+
+
+def departures_response(stop_ids: list[str], scheduled: datetime) -> dict[str, Any]:
+    """Return a TFI API response with a departure from each stop."""
+    return {
+        "stopDepartures": [
+            {
+                "stopRef": stop_id,
+                "serviceNumber": "1",
+                "serviceDirection": "OUTBOUND",
+                "destination": "Destination",
+                "scheduledDeparture": scheduled.isoformat(),
+            }
+            for stop_id in stop_ids
+        ]
+    }
+
+
+@pytest.mark.parametrize("stream_decode", [True, False])
+async def test_unchanged_response_is_not_parsed(stream_decode: bool) -> None:
+    """Test an identical response body is reported unchanged."""
+    scheduled = datetime.now(timezone.utc) + timedelta(minutes=10)
+
+    async def departures(request: web.Request) -> web.Response:
+        post_data = await request.json()
+        return web.json_response(departures_response(post_data["stopIds"], scheduled))
+
+    app = web.Application()
+    app.router.add_post("/departures", departures)
+    async with TestServer(app) as server:
+        tfi_data = TFIData(stream_decode=stream_decode)
+        tfi_data.api_url = str(server.make_url("/departures"))
+        await tfi_data.setup()
+        try:
+            post_data = {"stopIds": ["A", "B"]}
+            first = await tfi_data._fetch_departures(tfi_data.session, post_data)
+            second = await tfi_data._fetch_departures(tfi_data.session, post_data)
+            other = await tfi_data._fetch_departures(
+                tfi_data.session, {"stopIds": ["A"]}
+            )
+        finally:
+            await tfi_data.cleanup()
+
+    departures_first, unchanged_first, _ = first
+    assert [dep.stop_ref for dep in departures_first] == ["A", "B"]
+    assert not unchanged_first
+    assert second[1]
+    if not stream_decode:
+        assert second[0] is None
+    assert not other[1]
+    assert tfi_data.metrics.unchanged == 1
+
+
+async def test_conditional_request_not_modified() -> None:
+    """Test cache validators are sent and a 304 response is unchanged."""
+    validators = []
+    scheduled = datetime.now(timezone.utc) + timedelta(minutes=10)
+
+    async def departures(request: web.Request) -> web.Response:
+        validators.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304)
+        return web.json_response(
+            departures_response(["A"], scheduled), headers={"ETag": '"v1"'}
+        )
+
+    app = web.Application()
+    app.router.add_post("/departures", departures)
+    async with TestServer(app) as server:
+        tfi_data = TFIData()
+        tfi_data.api_url = str(server.make_url("/departures"))
+        await tfi_data.setup()
+        try:
+            post_data = {"stopIds": ["A"]}
+            await tfi_data._fetch_departures(tfi_data.session, post_data)
+            departures_retrieved, unchanged, _ = await tfi_data._fetch_departures(
+                tfi_data.session, post_data
+            )
+        finally:
+            await tfi_data.cleanup()
+
+    assert validators == [None, '"v1"']
+    assert departures_retrieved is None
+    assert unchanged
+    assert tfi_data.circuit_breaker.is_closed